@@ -1,759 +1,4734 @@
-﻿import pygame
-import random
-import time
-import math
-import sys
-import json
-import os
-from typing import List, Dict, Tuple, Optional
-
-# 初始化pygame并设置中文字体
-pygame.init()
-try:
-    # 尝试使用系统默认中文字体
-    font = pygame.font.SysFont("simhei", 24)
-    large_font = pygame.font.SysFont("simhei", 36)
-except:
-    # 如果失败则使用备用字体
-    font = pygame.font.SysFont(None, 24)
-    large_font = pygame.font.SysFont(None, 36)
-
-screen_width, screen_height = 1900, 1000
-screen = pygame.display.set_mode((screen_width, screen_height))
-pygame.display.set_caption("方块洲行动")
-clock = pygame.time.Clock()
-
-# 保存文件路径
-SAVE_FILE = "havoc_coins_save.json"
-
-class GameState:
-    MENU = 0
-    PLAYING = 1
-    DEAD = 2
-    EXTRACTING = 3
-    SUCCESS = 4
-
-COLORS = {
-    "white": (255, 255, 255),
-    "black": (0, 0, 0),
-    "red": (255, 0, 0),
-    "green": (0, 255, 0),
-    "blue": (0, 0, 255),
-    "purple": (128, 0, 128),
-    "gold": (255, 215, 0),
-    "ammo": (255, 215, 0),
-    "health": (50, 205, 50),
-    "container": (70, 130, 180),
-    "grid": (100, 100, 120),
-    "money": (255, 215, 0),
-    "wall": (50, 50, 80)
-}
-
-ITEM_VALUES = {
-    "海盗银币": 13000,
-    "溶解液": 3600,
-    "鼠标": 1000,
-    "间谍笔": 32000,
-    "海盗金币": 65000,
-    "非洲之星": 13460000,
-    "步战车": 30610
-}
-
-def save_havoc_coins(coins):
-    """保存哈弗币到文件"""
-    try:
-        with open(SAVE_FILE, 'w') as f:
-            json.dump({"havoc_coins": coins}, f)
-    except Exception as e:
-        print(f"保存数据失败: {e}")
-
-def load_havoc_coins():
-    """从文件加载哈弗币"""
-    try:
-        if os.path.exists(SAVE_FILE):
-            with open(SAVE_FILE, 'r') as f:
-                data = json.load(f)
-                return data.get("havoc_coins", 0)
-    except Exception as e:
-        print(f"加载数据失败: {e}")
-    return 0
-
-class Player:
-    def __init__(self):
-        self.reset()
-        
-    def reset(self):
-        self.x, self.y = screen_width // 2, screen_height // 2
-        self.speed = 5
-        self.health = 100
-        self.max_health = 100
-        self.ammo = 60
-        self.max_ammo = 60
-        self.reloading = False
-        self.reload_start = 0
-        self.reload_time = 3.5
-        self.rect = pygame.Rect(self.x - 15, self.y - 15, 30, 30)
-        self.bullets = []
-        self.fire_rate = 6
-        self.last_shot = 0
-        self.inventory = [None] * 25
-        self.last_damage_time = 0
-        self.damage_cooldown = 1.0
-        self.shooting = False
-        self.last_reload_progress = 0
-        
-    def update(self, keys, can_shoot=True):
-        # 保存旧位置用于碰撞检测
-        old_x, old_y = self.x, self.y
-        
-        if keys[pygame.K_a]: self.x -= self.speed
-        if keys[pygame.K_d]: self.x += self.speed
-        if keys[pygame.K_w]: self.y -= self.speed
-        if keys[pygame.K_s]: self.y += self.speed
-        
-        # 空气墙碰撞检测（边界外50像素）
-        wall_padding = 50
-        if self.x < wall_padding:
-            self.x = wall_padding
-        elif self.x > screen_width - wall_padding:
-            self.x = screen_width - wall_padding
-        if self.y < wall_padding:
-            self.y = wall_padding
-        elif self.y > screen_height - wall_padding:
-            self.y = screen_height - wall_padding
-        
-        self.rect.center = (self.x, self.y)
-        
-        if self.reloading:
-            current_time = time.time()
-            reload_progress = (current_time - self.reload_start) / self.reload_time
-            
-            if reload_progress <= 1.0:
-                self.last_reload_progress = reload_progress
-            else:
-                self.ammo = self.max_ammo
-                self.reloading = False
-        
-        if self.shooting and can_shoot and not self.reloading and self.ammo > 0:
-            self.shoot(pygame.mouse.get_pos())
-    
-    def shoot(self, target_pos):
-        now = time.time()
-        if now - self.last_shot >= 1 / self.fire_rate:
-            self.last_shot = now
-            self.ammo -= 1
-            angle = math.atan2(target_pos[1] - self.y, target_pos[0] - self.x)
-            self.bullets.append({
-                "x": self.x, "y": self.y, "angle": angle,
-                "speed": 15, "damage": 25, "create_time": now
-            })
-    
-    def take_damage(self, amount):
-        now = time.time()
-        if now - self.last_damage_time >= self.damage_cooldown:
-            self.last_damage_time = now
-            self.health -= amount
-            return self.health <= 0
-        return False
-    
-    def heal(self):
-        if self.health <= 50:
-            self.health = min(self.max_health, self.health + 50)
-        else:
-            self.health = self.max_health
-    
-    def can_pickup(self):
-        return None in self.inventory
-    
-    def add_to_inventory(self, item):
-        for i, slot in enumerate(self.inventory):
-            if slot is None:
-                self.inventory[i] = item
-                return True
-        return False
-
-class Enemy:
-    def __init__(self, x, y):
-        self.x, self.y = x, y
-        self.speed = 2
-        self.health = 100
-        self.damage = 15
-        self.attack_cooldown = 1.0
-        self.last_attack = 0
-        self.rect = pygame.Rect(x - 15, y - 15, 30, 30)
-        self.bullets = []
-        
-    def update(self, player):
-        dx, dy = player.x - self.x, player.y - self.y
-        dist = math.sqrt(dx*dx + dy*dy)
-        if dist > 0:
-            dx, dy = dx/dist, dy/dist
-            self.x += dx * self.speed
-            self.y += dy * self.speed
-        
-        self.rect.center = (self.x, self.y)
-        
-        now = time.time()
-        if now - self.last_attack >= self.attack_cooldown and dist < 300:
-            self.last_attack = now
-            angle = math.atan2(dy, dx)
-            self.bullets.append({
-                "x": self.x, "y": self.y, "angle": angle,
-                "speed": 10, "damage": self.damage, "create_time": now
-            })
-    
-    def take_damage(self, amount):
-        self.health -= amount
-        return self.health <= 0
-
-class Container:
-    def __init__(self, x, y, name, game):
-        self.x, self.y = x, y
-        self.name = name
-        self.game = game
-        self.rect = pygame.Rect(x - 25, y - 25, 50, 50)
-        self.items = []
-        self.grid_size = 5
-        self.max_items = 7
-        self.generate_items()
-        self.is_open = False
-        
-    def generate_items(self):
-        common_items = [
-            {"name": "海盗银币", "color": COLORS["blue"], "value": ITEM_VALUES["海盗银币"], "weight": 40},
-            {"name": "溶解液", "color": COLORS["green"], "value": ITEM_VALUES["溶解液"], "weight": 30},
-            {"name": "鼠标", "color": COLORS["white"], "value": ITEM_VALUES["鼠标"], "weight": 30},
-            {"name": "间谍笔", "color": COLORS["purple"], "value": ITEM_VALUES["间谍笔"], "weight": 10},  # 降低间谍笔刷新率
-            {"name": "海盗金币", "color": COLORS["gold"], "value": ITEM_VALUES["海盗金币"], "weight": 5}  # 海盗金币刷新率更低
-        ]
-        
-        rare_items = [
-            {"name": "非洲之星", "color": COLORS["red"], "value": ITEM_VALUES["非洲之星"]},
-            {"name": "步战车", "color": COLORS["red"], "value": ITEM_VALUES["步战车"]}
-        ]
-        
-        # 生成3-7个物品
-        num_items = random.randint(3, self.max_items)
-        
-        # 非洲之星生成逻辑 (1%基础概率，100局保底)
-        if not self.game.africa_star_spawned and (random.random() < 0.01 or self.game.africa_star_counter >= 100):
-            self.items.append(rare_items[0])
-            self.game.africa_star_spawned = True
-            self.game.africa_star_counter = 0
-            num_items -= 1
-        
-        # 步战车生成逻辑 (2%基础概率，50局保底)
-        if not self.game.tank_spawned and (random.random() < 0.02 or self.game.tank_counter >= 50):
-            self.items.append(rare_items[1])
-            self.game.tank_spawned = True
-            self.game.tank_counter = 0
-            num_items -= 1
-        
-        # 生成普通物品（使用加权随机）
-        weights = [item["weight"] for item in common_items]
-        for _ in range(num_items):
-            item = random.choices(common_items, weights=weights, k=1)[0].copy()
-            del item["weight"]  # 移除权重属性
-            self.items.append(item)
-    
-    def transfer_item(self, grid_index, player):
-        if 0 <= grid_index < len(self.items) and player.can_pickup():
-            transferred_item = self.items.pop(grid_index)
-            if player.add_to_inventory(transferred_item):
-                self.game.current_raid_value += transferred_item["value"]
-                return True
-        return False
-    
-    def receive_item(self, item):
-        if len(self.items) < self.max_items:
-            self.items.append(item)
-            return True
-        return False
-
-class Game:
-    def __init__(self):
-        # 初始化时加载保存的哈弗币
-        self.havoc_coins = load_havoc_coins()
-        self.reset_game()
-    
-    def reset_game(self):
-        self.state = GameState.MENU
-        self.player = Player()
-        self.enemies = []
-        self.containers = []
-        self.medkits = []
-        self.extract_zone = None
-        self.last_enemy_spawn = 0
-        self.enemy_spawn_interval = 60
-        self.last_medkit_spawn = 0
-        self.medkit_spawn_interval = 30
-        self.extraction_start = 0
-        self.extraction_time = 10
-        self.container_open = None
-        self.inventory_open = False
-        self.current_raid_value = 0
-        self.extracted_value = 0
-        self.africa_star_counter = 0
-        self.tank_counter = 0
-        self.africa_star_spawned = False
-        self.tank_spawned = False
-        
-        self.setup_level()
-    
-    def setup_level(self):
-        self.containers = []
-        self.enemies = []
-        self.medkits = []
-        self.current_raid_value = 0
-        self.extracted_value = 0
-        self.africa_star_counter += 1
-        self.tank_counter += 1
-        self.africa_star_spawned = False
-        self.tank_spawned = False
-        
-        # 更自然分散的容器分布
-        container_types = ["衣服", "衣柜", "武器箱", "高级储物箱", "收纳盒", "野外物资箱"]
-        container_positions = [
-            (200, 150),  # 左上
-            (1000, 180),  # 右上
-            (250, 550),   # 左下
-            (950, 600),   # 右下
-            (600, 300),   # 中上
-            (650, 500)    # 中下
-        ]
-        
-        for name, pos in zip(container_types, container_positions):
-            self.containers.append(Container(pos[0], pos[1], name, self))
-        
-        self.extract_zone = pygame.Rect(
-            screen_width - 150, screen_height - 150, 100, 100)
-        
-        for _ in range(5):
-            self.spawn_enemy()
-    
-    def spawn_enemy(self):
-        side = random.randint(0, 3)
-        padding = 100
-        if side == 0:  # 上
-            x = random.randint(padding, screen_width - padding)
-            y = -50
-        elif side == 1:  # 右
-            x = screen_width + 50
-            y = random.randint(padding, screen_height - padding)
-        elif side == 2:  # 下
-            x = random.randint(padding, screen_width - padding)
-            y = screen_height + 50
-        else:  # 左
-            x = -50
-            y = random.randint(padding, screen_height - padding)
-        
-        self.enemies.append(Enemy(x, y))
-        self.last_enemy_spawn = time.time()
-    
-    def spawn_medkit(self):
-        valid_position = False
-        while not valid_position:
-            x = random.randint(50, screen_width - 50)
-            y = random.randint(50, screen_height - 50)
-            new_rect = pygame.Rect(x - 15, y - 15, 30, 30)
-            
-            valid_position = True
-            for container in self.containers:
-                if new_rect.colliderect(container.rect):
-                    valid_position = False
-                    break
-            
-            if valid_position:
-                self.medkits.append(new_rect)
-                self.last_medkit_spawn = time.time()
-                break
-    
-    def calculate_inventory_value(self):
-        total = 0
-        for item in self.player.inventory:
-            if item is not None:
-                total += item["value"]
-        return total
-    
-    def handle_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                # 退出时保存哈弗币
-                save_havoc_coins(self.havoc_coins)
-                return False
-            
-            if self.state == GameState.MENU:
-                if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
-                    self.reset_game()  # 先重置游戏
-                    self.state = GameState.PLAYING  # 再改变状态
-            
-            elif self.state in [GameState.PLAYING, GameState.EXTRACTING]:
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_r and not self.player.reloading and self.player.ammo < self.player.max_ammo:
-                        self.player.reloading = True
-                        self.player.reload_start = time.time()
-                    
-                    if event.key == pygame.K_e:
-                        self.inventory_open = not self.inventory_open
-                    
-                    if event.key == pygame.K_f:
-                        if self.container_open:
-                            if self.container_open.is_open:
-                                self.container_open.is_open = False
-                                self.inventory_open = False
-                            else:
-                                self.container_open.is_open = True
-                                self.inventory_open = True
-                
-                # 修改：左键射击
-                if event.type == pygame.MOUSEBUTTONDOWN and not self.inventory_open:
-                    if event.button == 1:  # 左键射击
-                        self.player.shooting = True
-                        self.player.shoot(pygame.mouse.get_pos())
-                
-                if event.type == pygame.MOUSEBUTTONUP:
-                    if event.button == 1:  # 左键释放
-                        self.player.shooting = False
-                
-                if event.type == pygame.MOUSEBUTTONDOWN and self.inventory_open:
-                    mouse_pos = pygame.mouse.get_pos()
-                    
-                    backpack_area = pygame.Rect(50, 100, screen_width//2 - 100, screen_height - 200)
-                    if backpack_area.collidepoint(mouse_pos):
-                        col = (mouse_pos[0] - 50) // ((screen_width//2 - 100) // 5)
-                        row = (mouse_pos[1] - 100) // ((screen_height - 200) // 5)
-                        clicked_index = row * 5 + col
-                        
-                        # 右键点击背包物品放回容器
-                        if event.button == 3 and clicked_index < len(self.player.inventory):
-                            if self.container_open and self.container_open.is_open:
-                                # 将物品转移到容器中
-                                item = self.player.inventory[clicked_index]
-                                if item is not None and len(self.container_open.items) < self.container_open.max_items:
-                                    self.container_open.items.append(item)
-                                    self.player.inventory[clicked_index] = None
-                                    self.current_raid_value -= item["value"]
-                    
-                    if self.container_open and self.container_open.is_open:
-                        container_area = pygame.Rect(screen_width//2 + 50, 100, screen_width//2 - 100, screen_height - 200)
-                        if container_area.collidepoint(mouse_pos):
-                            col = (mouse_pos[0] - (screen_width//2 + 50)) // ((screen_width//2 - 100) // 5)
-                            row = (mouse_pos[1] - 100) // ((screen_height - 200) // 5)
-                            clicked_index = row * 5 + col
-                            
-                            # 左键点击容器物品拾取
-                            if event.button == 1 and clicked_index < len(self.container_open.items):
-                                self.container_open.transfer_item(clicked_index, self.player)
-            
-            elif self.state in (GameState.DEAD, GameState.SUCCESS):
-                if event.type == pygame.KEYDOWN and event.key == pygame.K_v:
-                    self.reset_game()
-        
-        return True
-    
-    def update(self):
-        if self.state in [GameState.PLAYING, GameState.EXTRACTING]:
-            keys = pygame.key.get_pressed()
-            can_shoot = not self.inventory_open
-            self.player.update(keys, can_shoot)
-            
-            current_time = time.time()
-            for bullet in self.player.bullets[:]:
-                bullet["x"] += math.cos(bullet["angle"]) * bullet["speed"]
-                bullet["y"] += math.sin(bullet["angle"]) * bullet["speed"]
-                
-                for enemy in self.enemies[:]:
-                    if math.sqrt((bullet["x"] - enemy.x)**2 + (bullet["y"] - enemy.y)**2) < 20:
-                        if enemy.take_damage(bullet["damage"]):
-                            self.enemies.remove(enemy)
-                        if bullet in self.player.bullets:
-                            self.player.bullets.remove(bullet)
-                        break
-                
-                if (bullet["x"] < 0 or bullet["x"] > screen_width or 
-                    bullet["y"] < 0 or bullet["y"] > screen_height):
-                    if bullet in self.player.bullets:
-                        self.player.bullets.remove(bullet)
-            
-            for enemy in self.enemies[:]:
-                enemy.update(self.player)
-                
-                for bullet in enemy.bullets[:]:
-                    bullet["x"] += math.cos(bullet["angle"]) * bullet["speed"]
-                    bullet["y"] += math.sin(bullet["angle"]) * bullet["speed"]
-                    
-                    if self.player.rect.collidepoint(bullet["x"], bullet["y"]):
-                        if self.player.take_damage(bullet["damage"]):
-                            self.state = GameState.DEAD
-                            self.extracted_value = 0
-                        enemy.bullets.remove(bullet)
-                        continue
-                    
-                    if (bullet["x"] < 0 or bullet["x"] > screen_width or 
-                        bullet["y"] < 0 or bullet["y"] > screen_height):
-                        enemy.bullets.remove(bullet)
-            
-            if current_time - self.last_enemy_spawn >= self.enemy_spawn_interval:
-                for _ in range(5):
-                    self.spawn_enemy()
-            
-            if (len(self.medkits) == 0 and 
-                current_time - self.last_medkit_spawn >= self.medkit_spawn_interval):
-                self.spawn_medkit()
-            
-            for medkit in self.medkits[:]:
-                if self.player.rect.colliderect(medkit):
-                    self.player.heal()
-                    self.medkits.remove(medkit)
-            
-            self.container_open = None
-            for container in self.containers:
-                if self.player.rect.colliderect(container.rect):
-                    self.container_open = container
-                    break
-            
-            if self.player.rect.colliderect(self.extract_zone):
-                if self.state != GameState.EXTRACTING:
-                    self.state = GameState.EXTRACTING
-                    self.extraction_start = current_time
-            else:
-                if self.state == GameState.EXTRACTING:
-                    self.state = GameState.PLAYING
-            
-            if (self.state == GameState.EXTRACTING and 
-                current_time - self.extraction_start >= self.extraction_time):
-                self.state = GameState.SUCCESS
-                if self.player.reloading:
-                    self.player.ammo = self.player.max_ammo
-                    self.player.reloading = False
-                
-                # 计算并增加哈弗币
-                self.extracted_value = self.calculate_inventory_value()
-                self.havoc_coins += self.extracted_value
-    
-    def draw_grid_ui(self, x, y, width, height, cols, rows, items, title):
-        cell_width = width // cols
-        cell_height = height // rows
-        
-        pygame.draw.rect(screen, (50, 50, 80), (x, y, width, height), border_radius=10)
-        pygame.draw.rect(screen, COLORS["blue"], (x, y, width, height), 2, border_radius=10)
-        
-        title_text = large_font.render(title, True, COLORS["white"])
-        screen.blit(title_text, (x + width//2 - title_text.get_width()//2, y - 40))
-        
-        for col in range(cols + 1):
-            pygame.draw.line(screen, COLORS["grid"], 
-                           (x + col * cell_width, y),
-                           (x + col * cell_width, y + height), 1)
-        for row in range(rows + 1):
-            pygame.draw.line(screen, COLORS["grid"],
-                           (x, y + row * cell_height),
-                           (x + width, y + row * cell_height), 1)
-        
-        for i, item in enumerate(items):
-            if item is not None:
-                row = i // cols
-                col = i % cols
-                item_x = x + col * cell_width + 10
-                item_y = y + row * cell_height + 10
-                
-                item_text = font.render(item["name"], True, item["color"])
-                screen.blit(item_text, (item_x, item_y))
-                
-                value_text = font.render(f"¥{item['value']:,}", True, COLORS["money"])
-                screen.blit(value_text, (item_x, item_y + 20))
-    
-    def draw(self):
-        screen.fill(COLORS["black"])
-        
-        # 绘制空气墙
-        wall_padding = 50
-        wall_rects = [
-            pygame.Rect(0, 0, screen_width, wall_padding),  # 上墙
-            pygame.Rect(0, 0, wall_padding, screen_height),  # 左墙
-            pygame.Rect(screen_width - wall_padding, 0, wall_padding, screen_height),  # 右墙
-            pygame.Rect(0, screen_height - wall_padding, screen_width, wall_padding)  # 下墙
-        ]
-        for wall in wall_rects:
-            pygame.draw.rect(screen, COLORS["wall"], wall)
-        
-        if self.state == GameState.MENU:
-            menu_bg = pygame.Surface((screen_width, screen_height))
-            menu_bg.fill((20, 20, 40))
-            screen.blit(menu_bg, (0, 0))
-            
-            title = large_font.render("方块洲行动（内测版）", True, COLORS["white"])
-            subtitle = font.render("代号: DRO", True, (200, 50, 50))
-            start = large_font.render("按Enter键开始行动", True, COLORS["green"])
-            
-            coins_text = large_font.render(f"方块币: ¥{self.havoc_coins:,}", True, COLORS["money"])
-            
-            screen.blit(title, (screen_width//2 - title.get_width()//2, screen_height//3))
-            screen.blit(subtitle, (screen_width//2 - subtitle.get_width()//2, screen_height//3 + 60))
-            screen.blit(start, (screen_width//2 - start.get_width()//2, screen_height//2 + 100))
-            screen.blit(coins_text, (screen_width//2 - coins_text.get_width()//2, screen_height//2 + 180))
-        
-        elif self.state in [GameState.PLAYING, GameState.EXTRACTING]:
-            pygame.draw.rect(screen, COLORS["green"], self.extract_zone, border_radius=5)
-            
-            for container in self.containers:
-                color = COLORS["container"] if container == self.container_open else COLORS["white"]
-                pygame.draw.rect(screen, color, container.rect, 2, border_radius=5)
-                
-                name_text = font.render(container.name, True, COLORS["white"])
-                screen.blit(name_text, (container.rect.centerx - name_text.get_width()//2, 
-                                      container.rect.y - 30))
-            
-            for medkit in self.medkits:
-                pygame.draw.rect(screen, COLORS["health"], medkit, border_radius=3)
-                pygame.draw.line(screen, COLORS["white"], 
-                               (medkit.x + 5, medkit.centery), 
-                               (medkit.right - 5, medkit.centery), 3)
-                pygame.draw.line(screen, COLORS["white"], 
-                               (medkit.centerx, medkit.y + 5), 
-                               (medkit.centerx, medkit.bottom - 5), 3)
-            
-            pygame.draw.rect(screen, COLORS["white"], self.player.rect, border_radius=3)
-            mouse_pos = pygame.mouse.get_pos()
-            angle = math.atan2(mouse_pos[1] - self.player.y, mouse_pos[0] - self.player.x)
-            end_x = self.player.x + math.cos(angle) * 25
-            end_y = self.player.y + math.sin(angle) * 25
-            pygame.draw.line(screen, COLORS["red"], (self.player.x, self.player.y), (end_x, end_y), 2)
-            
-            for bullet in self.player.bullets:
-                pygame.draw.circle(screen, COLORS["ammo"], (int(bullet["x"]), int(bullet["y"])), 4)
-            
-            for enemy in self.enemies:
-                pygame.draw.rect(screen, COLORS["red"], enemy.rect, border_radius=3)
-                pygame.draw.rect(screen, COLORS["black"], 
-                               (enemy.rect.x, enemy.rect.y - 12, enemy.rect.width, 6))
-                pygame.draw.rect(screen, COLORS["health"], 
-                               (enemy.rect.x, enemy.rect.y - 12, 
-                                enemy.rect.width * (enemy.health / 100), 6))
-                
-                for bullet in enemy.bullets:
-                    pygame.draw.circle(screen, (255, 100, 100), (int(bullet["x"]), int(bullet["y"])), 3)
-            
-            ui_panel = pygame.Surface((screen_width, 80), pygame.SRCALPHA)
-            ui_panel.fill((0, 0, 0, 150))
-            screen.blit(ui_panel, (0, 0))
-            
-            health_text = font.render(f"生命: {self.player.health}/{self.player.max_health}", True, COLORS["white"])
-            pygame.draw.rect(screen, (50, 50, 50), (120, 30, 200, 20))
-            pygame.draw.rect(screen, COLORS["health"], 
-                           (120, 30, 200 * (self.player.health / self.player.max_health), 20))
-            screen.blit(health_text, (20, 30))
-            
-            ammo_text = font.render(f"弹药: {self.player.ammo}/{self.player.max_ammo}", True, COLORS["ammo"])
-            screen.blit(ammo_text, (20, 55))
-            
-            value_text = font.render(f"物资价值: ¥{self.current_raid_value:,}", True, COLORS["money"])
-            screen.blit(value_text, (screen_width - value_text.get_width() - 20, 30))
-            
-            # 添加操作提示
-            controls_text = font.render("左键射击 | R换弹 | F互动 | E背包", True, COLORS["white"])
-            screen.blit(controls_text, (screen_width//2 - controls_text.get_width()//2, screen_height - 30))
-            
-            if self.player.reloading and self.state in [GameState.PLAYING, GameState.EXTRACTING]:
-                reload_progress = self.player.last_reload_progress
-                pygame.draw.rect(screen, (80, 80, 80), 
-                               (screen_width//2 - 150, 50, 300, 20), border_radius=10)
-                pygame.draw.rect(screen, (0, 150, 255), 
-                               (screen_width//2 - 150, 50, 300 * reload_progress, 20), border_radius=10)
-                reload_text = large_font.render("换弹中...", True, COLORS["white"])
-                screen.blit(reload_text, (screen_width//2 - reload_text.get_width()//2, 15))
-            
-            if self.container_open and not self.container_open.is_open:
-                prompt = large_font.render(f"按F打开{self.container_open.name}", True, COLORS["white"])
-                screen.blit(prompt, (screen_width//2 - prompt.get_width()//2, screen_height - 120))
-            
-            if self.inventory_open:
-                overlay = pygame.Surface((screen_width, screen_height), pygame.SRCALPHA)
-                overlay.fill((0, 0, 0, 180))
-                screen.blit(overlay, (0, 0))
-                
-                self.draw_grid_ui(
-                    50, 100, screen_width//2 - 100, screen_height - 200,
-                    5, 5, self.player.inventory, "背包"
-                )
-                
-                # 添加背包操作提示
-                backpack_tip = font.render("右键放回物品", True, COLORS["white"])
-                screen.blit(backpack_tip, (50, screen_height - 80))
-                
-                if self.container_open and self.container_open.is_open:
-                    self.draw_grid_ui(
-                        screen_width//2 + 50, 100, screen_width//2 - 100, screen_height - 200,
-                        5, 5, self.container_open.items, self.container_open.name
-                    )
-                    
-                    # 添加容器操作提示
-                    container_tip = font.render("左键拾取物品到背包", True, COLORS["white"])
-                    screen.blit(container_tip, (screen_width//2 + 50, screen_height - 80))
-            
-            if self.state == GameState.EXTRACTING:
-                remaining = max(0, self.extraction_time - (time.time() - self.extraction_start))
-                timer_bg = pygame.Surface((300, 60), pygame.SRCALPHA)
-                timer_bg.fill((0, 0, 0, 150))
-                screen.blit(timer_bg, (screen_width//2 - 150, 20))
-                
-                extract_text = large_font.render("撤离中", True, COLORS["green"])
-                time_text = large_font.render(f"{remaining:.1f}秒", True, COLORS["white"])
-                
-                screen.blit(extract_text, (screen_width//2 - extract_text.get_width()//2, 25))
-                screen.blit(time_text, (screen_width//2 - time_text.get_width()//2, 60))
-        
-        elif self.state == GameState.DEAD:
-            overlay = pygame.Surface((screen_width, screen_height), pygame.SRCALPHA)
-            overlay.fill((50, 0, 0, 200))
-            screen.blit(overlay, (0, 0))
-            
-            fail_text = large_font.render("任务失败", True, COLORS["red"])
-            reason_text = font.render("你已被敌人击毙", True, (200, 200, 200))
-            prompt = large_font.render("按V键返回主菜单", True, COLORS["white"])
-            value_text = large_font.render(f"带出物资价值: ¥0", True, COLORS["money"])
-            
-            screen.blit(fail_text, (screen_width//2 - fail_text.get_width()//2, screen_height//2 - 80))
-            screen.blit(reason_text, (screen_width//2 - reason_text.get_width()//2, screen_height//2 - 30))
-            screen.blit(value_text, (screen_width//2 - value_text.get_width()//2, screen_height//2 + 10))
-            screen.blit(prompt, (screen_width//2 - prompt.get_width()//2, screen_height//2 + 80))
-        
-        elif self.state == GameState.SUCCESS:
-            overlay = pygame.Surface((screen_width, screen_height), pygame.SRCALPHA)
-            overlay.fill((0, 50, 0, 200))
-            screen.blit(overlay, (0, 0))
-            
-            success_text = large_font.render("任务完成", True, COLORS["green"])
-            reward_text = font.render("成功撤离！", True, (200, 255, 200))
-            prompt = large_font.render("按V键返回主菜单", True, COLORS["white"])
-            value_text = large_font.render(f"带出物资价值: ¥{self.extracted_value:,}", True, COLORS["money"])
-            coins_text = large_font.render(f"获得方块币: ¥{self.extracted_value:,}", True, COLORS["money"])
-            
-            screen.blit(success_text, (screen_width//2 - success_text.get_width()//2, screen_height//2 - 120))
-            screen.blit(reward_text, (screen_width//2 - reward_text.get_width()//2, screen_height//2 - 70))
-            screen.blit(value_text, (screen_width//2 - value_text.get_width()//2, screen_height//2 - 20))
-            screen.blit(coins_text, (screen_width//2 - coins_text.get_width()//2, screen_height//2 + 30))
-            screen.blit(prompt, (screen_width//2 - prompt.get_width()//2, screen_height//2 + 100))
-        
-        pygame.display.flip()
-    
-    def run(self):
-        running = True
-        while running:
-            running = self.handle_events()
-            self.update()
-            self.draw()
-            clock.tick(60)
-        
-        # 游戏循环结束后保存哈弗币
-        save_havoc_coins(self.havoc_coins)
-        pygame.quit()
-
-if __name__ == "__main__":
-    try:
-        game = Game()
-        game.run()
-    except Exception as e:
-        print(f"游戏崩溃: {str(e)}")
-        pygame.quit()
-        raise
+﻿import time
+# 记录开始导入的时间点，用于统计冷启动耗时
+STARTUP_T0 = time.perf_counter()
+import pygame
+import random
+import math
+import sys
+import json
+import os
+import threading
+import heapq
+import bisect
+import hashlib
+import socket
+import struct
+import multiprocessing
+from array import array
+from typing import List, Dict, Tuple, Optional
+# NumPy可选：装了就用向量化计算，没装退回纯Python
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+screen_width, screen_height = 1900, 1000
+# 窗口、时钟和字体在boot()里创建，字体由后台线程加载
+screen = None
+clock = None
+font = None
+large_font = None
+
+# 字体查找结果缓存，避免每次启动都扫描系统字体（换了字体可删除此文件重新查找）
+FONT_CACHE_FILE = "font_cache.json"
+# 冷启动耗时记录
+STARTUP_REPORT_FILE = "startup_report.txt"
+
+class StartupProfiler:
+    """统计冷启动各阶段耗时：导入、初始化、字体加载、首帧"""
+    def __init__(self, t0):
+        self.t0 = t0
+        self.last = t0
+        self.stages = []
+        self.reported = False
+    
+    def mark(self, name):
+        """记录从上一个阶段结束到现在的耗时"""
+        now = time.perf_counter()
+        self.stages.append((name, now - self.last))
+        self.last = now
+    
+    def add(self, name, seconds):
+        """记录与主流程并行的阶段耗时（例如后台线程里的字体加载）"""
+        self.stages.append((name, seconds))
+    
+    def report(self):
+        if self.reported:
+            return
+        self.reported = True
+        stages = self.stages + [("合计", self.last - self.t0)]
+        line = " | ".join(f"{name} {sec * 1000:.0f}ms" for name, sec in stages)
+        print(f"启动耗时: {line}")
+        try:
+            with open(STARTUP_REPORT_FILE, 'a', encoding='utf-8') as f:
+                f.write(time.strftime("%Y-%m-%d %H:%M:%S") + " " + line + "\n")
+        except Exception as e:
+            print(f"保存启动耗时失败: {e}")
+
+startup_profiler = StartupProfiler(STARTUP_T0)
+
+def resolve_font_path(name):
+    """查找系统字体文件路径，结果缓存到文件，下次启动不再扫描系统字体"""
+    cache = {}
+    try:
+        if os.path.exists(FONT_CACHE_FILE):
+            with open(FONT_CACHE_FILE, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+    except Exception as e:
+        print(f"加载字体缓存失败: {e}")
+    
+    if name in cache:
+        path = cache[name]
+        # 空字符串表示上次没找到，不再重复扫描
+        if not path or os.path.exists(path):
+            return path or None
+    
+    path = pygame.font.match_font(name)  # 扫描系统字体，比较慢
+    cache[name] = path or ""
+    try:
+        with open(FONT_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"保存字体缓存失败: {e}")
+    return path
+
+def load_fonts():
+    """加载中文字体（在后台线程运行）"""
+    global font, large_font
+    start = time.perf_counter()
+    try:
+        # 尝试使用系统默认中文字体
+        path = resolve_font_path("simhei")
+        if path is None:
+            raise FileNotFoundError("未找到simhei字体")
+        font = pygame.font.Font(path, 24)
+        large_font = pygame.font.Font(path, 36)
+    except Exception as e:
+        # 如果失败则使用备用字体
+        print(f"加载中文字体失败，使用默认字体: {e}")
+        font = pygame.font.Font(None, 24)
+        large_font = pygame.font.Font(None, 36)
+    startup_profiler.add("字体加载", time.perf_counter() - start)
+
+def load_assets():
+    """启动画面期间在后台线程加载字体和音效"""
+    load_fonts()
+    sounds.load()
+
+def show_splash(loader):
+    """资源加载期间显示启动画面，加载线程结束后返回"""
+    splash_font = pygame.font.Font(None, 36)  # 内置字体，无需扫描
+    text = splash_font.render("LOADING", True, (255, 255, 255))
+    frame = 0
+    while loader.is_alive():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+        screen.fill((20, 20, 40))
+        screen.blit(text, (screen_width//2 - text.get_width()//2, screen_height//2 - 40))
+        # 来回移动的进度块
+        bar_x = screen_width//2 - 150
+        pygame.draw.rect(screen, (80, 80, 80), (bar_x, screen_height//2, 300, 12), border_radius=6)
+        offset = abs(frame % 80 - 40) * 6
+        pygame.draw.rect(screen, (0, 150, 255), (bar_x + offset, screen_height//2, 60, 12), border_radius=6)
+        pygame.display.flip()
+        clock.tick(30)
+        frame += 1
+    loader.join()
+
+def boot():
+    """初始化窗口，先显示启动画面，再在后台线程加载字体和音效"""
+    global screen, clock
+    startup_profiler.mark("导入")
+    # 只初始化用到的模块，pygame.init()还会初始化音频等，拖慢启动
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((screen_width, screen_height))
+    pygame.display.set_caption("方块洲行动")
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(ALLOWED_EVENTS)
+    clock = pygame.time.Clock()
+    startup_profiler.mark("初始化")
+    
+    loader = threading.Thread(target=load_assets, daemon=True)
+    loader.start()
+    show_splash(loader)
+
+# 保存文件路径
+SAVE_FILE = "havoc_coins_save.json"
+
+class GameState:
+    MENU = 0
+    PLAYING = 1
+    DEAD = 2
+    EXTRACTING = 3
+    SUCCESS = 4
+
+# 菜单/结算界面画面基本不动，没有输入时阻塞等待事件，不再每秒重绘60次
+IDLE_STATES = (GameState.MENU, GameState.DEAD, GameState.SUCCESS)
+# 空闲时最多等待多久就跑一遍update（给后台任务和动画留余地），单位秒
+IDLE_WAIT_TIMEOUT = 0.5
+# 窗口失去焦点或切到后台时的帧率
+BACKGROUND_FPS = 5
+# 模拟频率。移动速度都是按每1/60秒设定的，弱机可以调到20~30，步长按比例放大
+TICK_RATE = 60
+TICK_SCALE = 60 / TICK_RATE
+# 模拟线程模式：模拟在后台线程按TICK_RATE固定步长推进，主线程只处理事件、画最新的快照
+# （SDL的窗口和事件只能在主线程用）。画面再卡模拟也照样稳定。设置FANGZHOU_SIM_THREAD=1打开
+SIM_THREAD = os.environ.get("FANGZHOU_SIM_THREAD") == "1"
+# 模拟落后超过这么多帧就不追了（比如刚从后台切回来），从当前时间重新计时
+SIM_MAX_LAG_TICKS = 5
+
+class GameClock:
+    """对局计时。平时就是game_clock.time()；自动对局时切成模拟时间，每个tick手动往前拨，
+    这样一局可以比真实时间快很多倍跑完"""
+    def __init__(self):
+        self.simulated = None
+    
+    def time(self):
+        if self.simulated is None:
+            return time.time()
+        return self.simulated
+    
+    def simulate(self, start):
+        self.simulated = start
+    
+    def advance(self, seconds):
+        self.simulated += seconds
+
+game_clock = GameClock()
+
+# 只让游戏用到的事件进队列。鼠标移动不需要事件，瞄准时直接读鼠标位置
+ALLOWED_EVENTS = [
+    pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEWHEEL,
+    pygame.WINDOWFOCUSLOST, pygame.WINDOWFOCUSGAINED, pygame.WINDOWMINIMIZED,
+    pygame.WINDOWHIDDEN, pygame.WINDOWRESTORED, pygame.WINDOWSHOWN, pygame.WINDOWEXPOSED,
+    pygame.APP_WILLENTERBACKGROUND, pygame.APP_DIDENTERBACKGROUND, pygame.APP_DIDENTERFOREGROUND
+]
+
+# 文字渲染缓存的最大条数
+TEXT_CACHE_SIZE = 256
+# 半透明的界面底板和遮罩：名字 -> (宽, 高, 颜色)，宽高为None时跟屏幕一样
+UI_SURFACES = {
+    "top_bar": (None, 80, (0, 0, 0, 150)),
+    "extract_timer": (300, 60, (0, 0, 0, 150)),
+    "inventory_shade": (None, None, (0, 0, 0, 180)),
+    "stash_shade": (None, None, (0, 0, 0, 200)),
+    "dead_shade": (None, None, (50, 0, 0, 200)),
+    "success_shade": (None, None, (0, 50, 0, 200)),
+}
+
+COLORS = {
+    "white": (255, 255, 255),
+    "black": (0, 0, 0),
+    "red": (255, 0, 0),
+    "green": (0, 255, 0),
+    "blue": (0, 0, 255),
+    "purple": (128, 0, 128),
+    "gold": (255, 215, 0),
+    "ammo": (255, 215, 0),
+    "health": (50, 205, 50),
+    "container": (70, 130, 180),
+    "grid": (100, 100, 120),
+    "money": (255, 215, 0),
+    "wall": (50, 50, 80)
+}
+
+ITEM_VALUES = {
+    "海盗银币": 13000,
+    "溶解液": 3600,
+    "鼠标": 1000,
+    "间谍笔": 32000,
+    "海盗金币": 65000,
+    "非洲之星": 13460000,
+    "步战车": 30610
+}
+
+# 普通物品在容器里的刷新权重
+COMMON_ITEM_WEIGHTS = {
+    "海盗银币": 40,
+    "溶解液": 30,
+    "鼠标": 30,
+    "间谍笔": 10,  # 降低间谍笔刷新率
+    "海盗金币": 5  # 海盗金币刷新率更低
+}
+
+# 稀有物品每个容器的基础出现概率（另有保底，见Container.generate_items）
+RARE_ITEM_CHANCES = {
+    "非洲之星": 0.01,
+    "步战车": 0.02
+}
+
+# 武器数据。pellets每发弹丸数，spread散布角（弧度），burst一次扳机打几发、burst_interval
+# 连发间隔（秒），fire_rate每秒可扣扳机次数，magazine弹匣容量，reload_time换弹时间（秒），
+# hitscan为True时即时命中、射程为range，否则按speed发射子弹
+WEAPONS = {
+    "步枪": {"pellets": 1, "spread": 0.0, "burst": 1, "burst_interval": 0.0, "fire_rate": 6,
+             "damage": 25, "speed": 15, "magazine": 60, "reload_time": 3.5, "hitscan": False, "range": 0},
+    "霰弹枪": {"pellets": 12, "spread": math.radians(24), "burst": 1, "burst_interval": 0.0, "fire_rate": 1.2,
+               "damage": 10, "speed": 14, "magazine": 8, "reload_time": 3.0, "hitscan": False, "range": 0},
+    "冲锋枪": {"pellets": 1, "spread": math.radians(4), "burst": 3, "burst_interval": 0.06, "fire_rate": 3,
+               "damage": 18, "speed": 16, "magazine": 45, "reload_time": 2.5, "hitscan": False, "range": 0},
+    "狙击枪": {"pellets": 1, "spread": 0.0, "burst": 1, "burst_interval": 0.0, "fire_rate": 0.8,
+               "damage": 100, "speed": 0, "magazine": 5, "reload_time": 3.0, "hitscan": True, "range": 1400},
+}
+WEAPON_ORDER = ["步枪", "霰弹枪", "冲锋枪", "狙击枪"]
+# 即时命中弹道的显示时间（秒）
+TRACER_TIME = 0.08
+
+def save_havoc_coins(coins, stash):
+    """保存哈弗币和仓库到文件"""
+    start = time.perf_counter()
+    try:
+        with open(SAVE_FILE, 'w') as f:
+            json.dump({"havoc_coins": coins, "stash": stash.to_list()}, f)
+    except Exception as e:
+        print(f"保存数据失败: {e}")
+    telemetry.observe("save.coins_ms", (time.perf_counter() - start) * 1000)
+
+def load_havoc_coins():
+    """从文件加载哈弗币"""
+    try:
+        if os.path.exists(SAVE_FILE):
+            with open(SAVE_FILE, 'r') as f:
+                data = json.load(f)
+                return data.get("havoc_coins", 0)
+    except Exception as e:
+        print(f"加载数据失败: {e}")
+    return 0
+
+def load_stash():
+    """从文件加载仓库，没有存档或读取失败时返回空仓库"""
+    try:
+        if os.path.exists(SAVE_FILE):
+            with open(SAVE_FILE, 'r') as f:
+                data = json.load(f)
+                return Stash({"name": name, "value": value, "color": tuple(color)}
+                             for name, value, color in data.get("stash", []))
+    except Exception as e:
+        print(f"加载仓库失败: {e}")
+    return Stash()
+
+# 局内存档：二进制格式，快速存档和崩溃后的自动存档共用
+RAID_SAVE_FILE = "raid_autosave.bin"
+SAVE_STATE_MAGIC = b"FKZS"
+SAVE_STATE_VERSION = 1  # 格式变了就加一，旧版本的存档直接作废
+AUTOSAVE_INTERVAL = 10  # 秒
+
+class SaveWriter:
+    """把存档字段按struct格式依次打包，数组整段写入"""
+    def __init__(self):
+        self.parts = []
+    
+    def pack(self, fmt, *values):
+        self.parts.append(struct.pack(fmt, *values))
+    
+    def string(self, text):
+        data = text.encode("utf-8")
+        self.pack("<H", len(data))
+        self.parts.append(data)
+    
+    def blob(self, data):
+        self.pack("<I", len(data))
+        self.parts.append(data)
+    
+    def item(self, item):
+        """背包/容器里的一格，空格子只写一个0"""
+        if item is None:
+            self.pack("<B", 0)
+            return
+        self.pack("<B", 1)
+        self.string(item["name"])
+        self.pack("<I3B", item["value"], *item["color"])
+    
+    def getvalue(self):
+        return b"".join(self.parts)
+
+class SaveReader:
+    """按写入顺序读回SaveWriter打包的字段"""
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+    
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+    
+    def string(self):
+        (length,) = self.unpack("<H")
+        text = self.data[self.offset:self.offset + length].decode("utf-8")
+        self.offset += length
+        return text
+    
+    def blob(self):
+        (length,) = self.unpack("<I")
+        data = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return data
+    
+    def item(self):
+        (present,) = self.unpack("<B")
+        if not present:
+            return None
+        name = self.string()
+        value, r, g, b = self.unpack("<I3B")
+        return {"name": name, "value": value, "color": (r, g, b)}
+    
+    def doubles(self, column):
+        """把一段array('d')原样读进column（原地替换内容）"""
+        del column[:]
+        column.frombytes(self.blob())
+
+def shift_times(column, offset):
+    """读档时把存的时间戳整体平移到现在（子弹过期、敌人攻击冷却等）"""
+    if np is not None and len(column):
+        np.frombuffer(column)[:] += offset
+        return
+    for i in range(len(column)):
+        column[i] += offset
+
+class Autosaver:
+    """后台线程写局内存档。
+    
+    主线程只负责打包（几毫秒），写盘在这里做，不卡帧。先写临时文件再替换，
+    写到一半崩溃也不会留下坏档。discard之后，之前提交但还没写的存档都作废。
+    path为None时不读写任何文件（自动对局用）。
+    """
+    def __init__(self, path=RAID_SAVE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.pending = None
+        self.generation = 0
+        self.exists = path is not None and os.path.exists(path)
+        self.writes = 0
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def submit(self, data):
+        """交给后台线程写，只保留最新的一份"""
+        with self.lock:
+            self.pending = (self.generation, data)
+        self.wakeup.set()
+    
+    def save_now(self, data):
+        """在当前线程立即写（退出、切后台时用）"""
+        with self.lock:
+            self.pending = None
+            generation = self.generation
+        self.write(generation, data)
+    
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            with self.lock:
+                pending, self.pending = self.pending, None
+            if pending is not None:
+                self.write(*pending)
+    
+    def write(self, generation, data):
+        with self.io_lock:
+            if generation != self.generation or self.path is None:
+                return
+            temp_path = self.path + ".tmp"
+            start = time.perf_counter()
+            try:
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+                self.exists = True
+                self.writes += 1
+            except Exception as e:
+                print(f"自动存档失败: {e}")
+            telemetry.observe("save.raid_write_ms", (time.perf_counter() - start) * 1000)
+    
+    def load(self):
+        """读出存档的字节，没有存档返回None"""
+        if self.path is None:
+            return None
+        with self.io_lock:
+            try:
+                with open(self.path, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+    
+    def discard(self):
+        """这一局结束了，删掉存档"""
+        with self.lock:
+            self.pending = None
+            self.generation += 1
+        if self.path is None:
+            return
+        with self.io_lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"删除存档失败: {e}")
+            self.exists = False
+
+# 性能遥测：计数器和直方图定期写成JSONL，把试玩设备上的数据收回来离线对比各个版本
+# 设置环境变量FANGZHOU_TELEMETRY=1打开，默认关闭
+TELEMETRY = os.environ.get("FANGZHOU_TELEMETRY") == "1"
+TELEMETRY_DIR = "telemetry"
+TELEMETRY_FLUSH_INTERVAL = 5.0  # 秒
+TELEMETRY_MAX_BYTES = 1 << 20  # 单个文件写满就换下一个
+TELEMETRY_MAX_FILES = 8  # 最多保留几个文件，多了删最老的
+# 直方图各桶的上界（毫秒），比最后一个还大的值进最后一个桶
+TELEMETRY_PLATFORM = "desktop"
+TELEMETRY_BUCKETS = (0.5, 1, 2, 4, 8, 12, 16.7, 25, 33.3, 50, 100, 250)
+
+def build_id():
+    """源文件内容的短哈希，用来区分不同版本采到的数据"""
+    try:
+        with open(os.path.abspath(__file__), "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()[:12]
+    except Exception:
+        return "unknown"
+
+class Histogram:
+    """固定分桶的直方图，只记各桶计数、总和和最大值"""
+    def __init__(self):
+        self.counts = [0] * (len(TELEMETRY_BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+    
+    def add(self, value):
+        self.counts[bisect.bisect_left(TELEMETRY_BUCKETS, value)] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+    
+    def to_dict(self):
+        return {"buckets": TELEMETRY_BUCKETS, "counts": self.counts, "count": sum(self.counts),
+                "sum": round(self.total, 3), "max": round(self.max, 3)}
+
+class Telemetry:
+    """性能遥测。
+    
+    count()累加计数器，gauge()记当前值（实体数量等），observe()往直方图里加一个样本，
+    event()记一条单独的记录（比如一局结束）。后台线程每隔TELEMETRY_FLUSH_INTERVAL秒
+    把这段时间的数据写成一行JSON，文件写满了轮换。没打开时各方法直接返回，
+    要先算数据才能记录的地方用 if telemetry.enabled: 包起来。
+    """
+    def __init__(self, enabled=TELEMETRY, directory=TELEMETRY_DIR):
+        self.enabled = enabled
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.events = []
+        self.session = f"{int(time.time())}-{os.getpid()}"
+        self.file_index = 0
+        self.window_start = time.time()
+        self.stopped = threading.Event()
+        self.thread = None
+        if enabled:
+            self.build = build_id()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+    
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def gauge(self, name, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[name] = value
+    
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(value)
+    
+    def event(self, name, **fields):
+        if not self.enabled:
+            return
+        fields["event"] = name
+        fields["t"] = round(time.time(), 3)
+        with self.lock:
+            self.events.append(fields)
+    
+    def take(self):
+        """取走这一段的数据，返回要写的记录（没有新数据返回空列表）"""
+        with self.lock:
+            counters, self.counters = self.counters, {}
+            histograms, self.histograms = self.histograms, {}
+            events, self.events = self.events, []
+            gauges = dict(self.gauges)
+        now = time.time()
+        interval, self.window_start = now - self.window_start, now
+        header = {"session": self.session, "build": self.build, "platform": TELEMETRY_PLATFORM}
+        records = [dict(header, **event) for event in events]
+        if counters or histograms:
+            records.append(dict(header, t=round(now, 3), interval=round(interval, 3), counters=counters,
+                                gauges=gauges,
+                                histograms={name: h.to_dict() for name, h in histograms.items()}))
+        return records
+    
+    def run(self):
+        while not self.stopped.wait(TELEMETRY_FLUSH_INTERVAL):
+            self.flush()
+    
+    def flush(self):
+        records = self.take()
+        if not records:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.current_path(), "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"写遥测数据失败: {e}")
+    
+    def current_path(self):
+        """当前要写的文件，写满了换下一个，并删掉超出数量的旧文件"""
+        path = os.path.join(self.directory, f"telemetry-{self.session}-{self.file_index}.jsonl")
+        if os.path.exists(path) and os.path.getsize(path) >= TELEMETRY_MAX_BYTES:
+            self.file_index += 1
+            path = os.path.join(self.directory, f"telemetry-{self.session}-{self.file_index}.jsonl")
+            files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.startswith("telemetry-") and name.endswith(".jsonl")]
+            files.sort(key=os.path.getmtime)
+            for old in files[:max(0, len(files) - TELEMETRY_MAX_FILES + 1)]:
+                os.remove(old)
+        return path
+    
+    def close(self):
+        """退出前把剩下的数据写掉"""
+        if not self.enabled:
+            return
+        self.stopped.set()
+        self.thread.join(timeout=1.0)
+        self.flush()
+
+telemetry = Telemetry()
+
+# 音效：启动时全部读进内存，局内只按名字排队，不读盘也不新建对象。FANGZHOU_AUDIO=0关掉
+AUDIO = os.environ.get("FANGZHOU_AUDIO") != "0"
+AUDIO_SAMPLE_RATE = 22050
+AUDIO_BUFFER = 512  # 混音缓冲（采样数），越小延迟越低
+AUDIO_CHANNELS = 12  # 混音通道池大小，都在响时按优先级抢
+# 有sounds/<名字>.wav或.ogg就用文件，没有就按下面的参数合成
+SOUND_DIR = "sounds"
+# 名字: (优先级, 音量, (波形, 起始频率, 结束频率, 时长秒))，优先级高的能抢低的通道
+SOUND_EFFECTS = {
+    "shoot": (2, 0.35, ("square", 900, 180, 0.08)),
+    "sniper": (3, 0.5, ("noise", 1600, 120, 0.35)),
+    "enemy_shoot": (1, 0.2, ("square", 620, 160, 0.07)),
+    "hit": (2, 0.3, ("noise", 2400, 600, 0.05)),
+    "enemy_die": (3, 0.45, ("saw", 320, 60, 0.25)),
+    "player_hit": (4, 0.5, ("square", 240, 110, 0.15)),
+    "reload": (3, 0.4, ("noise", 3000, 900, 0.2)),
+    "reload_done": (3, 0.4, ("square", 2200, 2200, 0.05)),
+    "extract": (5, 0.6, ("sine", 440, 880, 0.6)),
+    "death": (5, 0.6, ("saw", 330, 55, 0.8)),
+}
+# 同一帧里同一个音效触发多次只播一次，每多一次音量加这么多（最多到1.0）
+SOUND_MERGE_GAIN = 0.15
+
+def synth_clip(wave, start_freq, end_freq, duration, rate=AUDIO_SAMPLE_RATE):
+    """合成一段16位单声道音效：频率从start_freq线性滑到end_freq，起音5毫秒，之后指数衰减。
+    noise是每半个周期换一个随机值的噪声，频率越高越沙。种子固定，每次启动音色一样"""
+    count = int(duration * rate)
+    attack = max(1, int(0.005 * rate))
+    if np is not None:
+        index = np.arange(count)
+        progress = index / count
+        cycles = np.cumsum(start_freq + (end_freq - start_freq) * progress) / rate
+        phase = cycles % 1.0
+        if wave == "sine":
+            value = np.sin(2 * math.pi * phase)
+        elif wave == "square":
+            value = np.where(phase < 0.5, 1.0, -1.0)
+        elif wave == "saw":
+            value = 2 * phase - 1
+        else:
+            steps = (cycles * 2).astype(np.int64)
+            value = np.random.default_rng(count).uniform(-1, 1, steps[-1] + 1)[steps]
+        envelope = np.minimum(1.0, index / attack) * np.exp(-5 * progress)
+        return (value * envelope * 32767).astype(np.int16).tobytes()
+    noise = random.Random(count)  # 单独的随机数，不影响对局的随机序列
+    samples = array("h", bytes(2 * count))
+    cycles = 0.0
+    held_step, held = -1, 0.0
+    for i in range(count):
+        progress = i / count
+        cycles += (start_freq + (end_freq - start_freq) * progress) / rate
+        phase = cycles % 1.0
+        if wave == "sine":
+            value = math.sin(2 * math.pi * phase)
+        elif wave == "square":
+            value = 1.0 if phase < 0.5 else -1.0
+        elif wave == "saw":
+            value = 2 * phase - 1
+        else:
+            if int(cycles * 2) != held_step:
+                held_step, held = int(cycles * 2), noise.uniform(-1, 1)
+            value = held
+        samples[i] = int(value * min(1.0, i / attack) * math.exp(-5 * progress) * 32767)
+    return samples.tobytes()
+
+class SoundBank:
+    """音效库和混音通道池。
+    
+    load()在启动时把所有音效读进内存（文件或合成）。局内play()只给这一帧的计数加一，
+    flush()每帧一次：同一个音效这一帧不管触发多少次只播一次，次数多就大声一点。
+    播放时先找空闲通道，没有就抢优先级最低、最早开始的那个；新音效优先级更低就丢掉。
+    混音器初始化失败（没有声卡、无头运行）就静音，play()什么也不做。
+    """
+    def __init__(self):
+        self.enabled = False
+        self.names = list(SOUND_EFFECTS)
+        self.ids = {name: index for index, name in enumerate(self.names)}
+        self.priorities = [SOUND_EFFECTS[name][0] for name in self.names]
+        self.volumes = [SOUND_EFFECTS[name][1] for name in self.names]
+        self.sounds = [None] * len(self.names)
+        self.pending = [0] * len(self.names)  # 这一帧每个音效触发了几次
+        self.channels = []
+        self.channel_priority = []
+        self.channel_serial = []  # 开始播放的先后，抢通道时先抢早的
+        self.serial = 0
+        self.played = 0
+        self.merged = 0
+        self.stolen = 0
+        self.dropped = 0
+    
+    def load(self):
+        """初始化混音器，把所有音效读进内存"""
+        if not AUDIO:
+            return
+        start = time.perf_counter()
+        try:
+            # 格式固定成16位单声道，合成的数据不用再转换
+            pygame.mixer.init(AUDIO_SAMPLE_RATE, -16, 1, AUDIO_BUFFER, allowedchanges=0)
+            pygame.mixer.set_num_channels(AUDIO_CHANNELS)
+            self.channels = [pygame.mixer.Channel(i) for i in range(AUDIO_CHANNELS)]
+            self.channel_priority = [0] * AUDIO_CHANNELS
+            self.channel_serial = [0] * AUDIO_CHANNELS
+            for index, name in enumerate(self.names):
+                self.sounds[index] = self.load_clip(name)
+            self.enabled = True
+        except Exception as e:
+            print(f"初始化音效失败，静音运行: {e}")
+        startup_profiler.add("音效加载", time.perf_counter() - start)
+    
+    def load_clip(self, name):
+        for ext in (".wav", ".ogg"):
+            path = os.path.join(SOUND_DIR, name + ext)
+            if os.path.exists(path):
+                return pygame.mixer.Sound(path)
+        return pygame.mixer.Sound(buffer=synth_clip(*SOUND_EFFECTS[name][2]))
+    
+    def play(self, name):
+        """这一帧要播name，真正播放在flush()里"""
+        if self.enabled:
+            self.pending[self.ids[name]] += 1
+    
+    def flush(self):
+        """播放这一帧排队的音效，每个音效一次"""
+        if not self.enabled:
+            return
+        pending = self.pending
+        for index in range(len(pending)):
+            count = pending[index]
+            if count:
+                pending[index] = 0
+                self.merged += count - 1
+                self.start(index, count)
+    
+    def pick_channel(self, priority):
+        """空闲通道优先；都在响就挑优先级最低、最早开始的那个，它比新音效优先级还高就返回-1"""
+        victim = -1
+        for slot, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return slot
+            if victim < 0 or self.channel_priority[slot] < self.channel_priority[victim] or (
+                    self.channel_priority[slot] == self.channel_priority[victim] and
+                    self.channel_serial[slot] < self.channel_serial[victim]):
+                victim = slot
+        if victim < 0 or self.channel_priority[victim] > priority:
+            return -1
+        self.stolen += 1
+        return victim
+    
+    def start(self, index, count):
+        priority = self.priorities[index]
+        slot = self.pick_channel(priority)
+        if slot < 0:
+            self.dropped += 1
+            return
+        channel = self.channels[slot]
+        channel.play(self.sounds[index])
+        channel.set_volume(min(1.0, self.volumes[index] * (1 + SOUND_MERGE_GAIN * (count - 1))))
+        self.serial += 1
+        self.channel_priority[slot] = priority
+        self.channel_serial[slot] = self.serial
+        self.played += 1
+        if telemetry.enabled:
+            telemetry.count("audio.played")
+    
+    def close(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        if telemetry.enabled:
+            telemetry.count("audio.merged", self.merged)
+            telemetry.count("audio.stolen", self.stolen)
+            telemetry.count("audio.dropped", self.dropped)
+        pygame.mixer.quit()
+
+sounds = SoundBank()
+
+class TickInput:
+    """一帧的玩家操作。键鼠输入先整理成它，再交给Game.update处理"""
+    def __init__(self):
+        self.clear()
+    
+    def clear(self):
+        self.move_x = 0
+        self.move_y = 0
+        self.aim_angle = None  # None表示保持原来的朝向
+        self.fire = False
+        self.clear_presses()
+    
+    def clear_presses(self):
+        """只清掉这一帧按下的按键（只触发一次）。移动、瞄准、开火保持到下次采样"""
+        self.reload = False
+        self.interact = False
+        self.toggle_inventory = False
+        self.weapon = None  # 要换到的武器（WEAPON_ORDER下标）
+
+PLAYER_SIZE = 30
+PLAYER_SPEED = 5
+INVENTORY_SIZE = 25
+
+class Player:
+    def __init__(self, projectiles):
+        self.projectiles = projectiles
+        self.reset()
+        
+    def reset(self):
+        self.x, self.y = screen_width // 2, screen_height // 2
+        self.speed = PLAYER_SPEED
+        self.health = 100
+        self.max_health = 100
+        self.reloading = False
+        self.reload_start = 0
+        # 各武器弹匣里剩的子弹，换枪时保留
+        self.magazines = {name: WEAPONS[name]["magazine"] for name in WEAPON_ORDER}
+        self.weapon_name = None
+        self.burst_left = 0  # 这次连发还剩几发
+        self.next_burst = 0
+        self.rounds_fired = 0  # 累计打出的发数（一次霰弹算一发）
+        self.hitscan_shots = []  # 等待Game结算的即时命中射线
+        self.rect = pygame.Rect(self.x - 15, self.y - 15, 30, 30)
+        self.last_shot = 0
+        self.inventory = [None] * INVENTORY_SIZE
+        self.last_damage_time = 0
+        self.damage_cooldown = 1.0
+        self.shooting = False
+        self.last_reload_progress = 0
+        self.facing_angle = 0  # 玩家朝向角度
+        self.equip(WEAPON_ORDER[0])
+        
+    def move(self, tick_input):
+        """按输入移动、转向，挡在空气墙以内。联机客户端也用它做本地预测"""
+        self.x += tick_input.move_x * self.speed * TICK_SCALE
+        self.y += tick_input.move_y * self.speed * TICK_SCALE
+        if tick_input.aim_angle is not None:
+            self.facing_angle = tick_input.aim_angle
+        
+        # 空气墙碰撞检测（边界外50像素）
+        wall_padding = 50
+        if self.x < wall_padding:
+            self.x = wall_padding
+        elif self.x > screen_width - wall_padding:
+            self.x = screen_width - wall_padding
+        if self.y < wall_padding:
+            self.y = wall_padding
+        elif self.y > screen_height - wall_padding:
+            self.y = screen_height - wall_padding
+        
+        self.rect.center = (self.x, self.y)
+    
+    def update(self, tick_input, can_shoot=True):
+        self.move(tick_input)
+        
+        if self.reloading:
+            current_time = game_clock.time()
+            reload_progress = (current_time - self.reload_start) / self.reload_time
+            
+            if reload_progress <= 1.0:
+                self.last_reload_progress = reload_progress
+            else:
+                self.ammo = self.max_ammo
+                self.reloading = False
+                sounds.play("reload_done")
+        
+        self.continue_burst()
+        self.shooting = tick_input.fire and can_shoot
+        if self.shooting:
+            self.shoot(self.facing_angle)
+    
+    def save(self, writer):
+        """写入存档：位置、血量、武器弹药、冷却时间和背包"""
+        writer.pack("<5di", self.x, self.y, self.facing_angle, self.last_shot, self.last_damage_time, self.health)
+        writer.pack("<B?dH", WEAPON_ORDER.index(self.weapon_name), self.reloading, self.reload_start, self.ammo)
+        writer.pack(f"<{len(WEAPON_ORDER)}H", *(self.magazines[name] for name in WEAPON_ORDER))
+        writer.pack("<B", len(self.inventory))
+        for item in self.inventory:
+            writer.item(item)
+    
+    def load(self, reader, time_offset):
+        """读回save写的内容，time_offset把存档里的时间戳平移到现在"""
+        self.reset()
+        self.x, self.y, self.facing_angle, last_shot, last_damage_time, self.health = reader.unpack("<5di")
+        weapon, reloading, reload_start, ammo = reader.unpack("<B?dH")
+        counts = reader.unpack(f"<{len(WEAPON_ORDER)}H")
+        self.magazines = dict(zip(WEAPON_ORDER, counts))
+        self.weapon_name = None  # 不让equip把默认武器的弹药写回弹匣
+        self.equip(WEAPON_ORDER[weapon])
+        self.ammo = ammo
+        self.reloading = reloading
+        self.reload_start = reload_start + time_offset
+        self.last_shot = last_shot + time_offset
+        self.last_damage_time = last_damage_time + time_offset
+        (size,) = reader.unpack("<B")
+        self.inventory = [reader.item() for _ in range(size)]
+        self.rect.center = (self.x, self.y)
+    
+    def equip(self, name):
+        """换武器。原来弹匣里的子弹留着，正在进行的换弹和连发作废"""
+        if self.weapon_name is not None:
+            self.magazines[self.weapon_name] = self.ammo
+        self.weapon_name = name
+        self.weapon = WEAPONS[name]
+        self.ammo = self.magazines[name]
+        self.max_ammo = self.weapon["magazine"]
+        self.reload_time = self.weapon["reload_time"]
+        self.fire_rate = self.weapon["fire_rate"]
+        self.reloading = False
+        self.burst_left = 0
+    
+    def shoot(self, angle):
+        """扣一次扳机（受射速限制），真正开火时返回True。连发的后几发在update里打出"""
+        if self.reloading or self.ammo <= 0:
+            return False
+        now = game_clock.time()
+        if now - self.last_shot < 1 / self.fire_rate:
+            return False
+        self.last_shot = now
+        self.facing_angle = angle  # 更新玩家朝向
+        self.fire_round(angle, now)
+        self.burst_left = self.weapon["burst"] - 1
+        self.next_burst = now + self.weapon["burst_interval"]
+        return True
+    
+    def fire_round(self, angle, now):
+        """打出一发：霰弹的所有弹丸一次批量生成；即时命中武器只记下射线，由Game统一结算"""
+        weapon = self.weapon
+        self.ammo -= 1
+        self.rounds_fired += 1
+        angles = [angle + (random.random() - 0.5) * weapon["spread"] for _ in range(weapon["pellets"])]
+        if weapon["hitscan"]:
+            self.hitscan_shots.append((self.x, self.y, angles, weapon["range"], weapon["damage"]))
+        else:
+            self.projectiles.spawn_many(self.x, self.y, angles, weapon["speed"], weapon["damage"],
+                                        OWNER_PLAYER, now)
+    
+    def continue_burst(self):
+        if self.burst_left <= 0:
+            return
+        if self.reloading or self.ammo <= 0:
+            self.burst_left = 0
+            return
+        now = game_clock.time()
+        if now >= self.next_burst:
+            self.fire_round(self.facing_angle, now)
+            self.burst_left -= 1
+            self.next_burst += self.weapon["burst_interval"]
+    
+    def take_damage(self, amount):
+        now = game_clock.time()
+        if now - self.last_damage_time >= self.damage_cooldown:
+            self.last_damage_time = now
+            self.health -= amount
+            return self.health <= 0
+        return False
+    
+    def heal(self):
+        if self.health <= 50:
+            self.health = min(self.max_health, self.health + 50)
+        else:
+            self.health = self.max_health
+    
+    def can_pickup(self):
+        return None in self.inventory
+    
+    def add_to_inventory(self, item):
+        for i, slot in enumerate(self.inventory):
+            if slot is None:
+                self.inventory[i] = item
+                return True
+        return False
+
+# 敌人、医疗包的碰撞尺寸（正方形边长）
+ENEMY_SIZE = 30
+ENEMY_SPEED = 2
+ENEMY_DAMAGE = 15
+ENEMY_SPAWN_INTERVAL = 60  # 每隔多少秒刷一波敌人
+MEDKIT_SIZE = 30
+
+class EntityStore:
+    """实体组件的稠密存储。
+    
+    每个组件一列：数值连续存放在array('d')里，其他对象放在列表里，同一行属于同一个实体。
+    删除时把最后一行搬到空位（O(1)），各系统按行遍历即可；边遍历边删除时要倒序遍历，
+    或者删完立即跳出。实体ID不复用，rows记录ID到当前行号的映射。
+    """
+    def __init__(self, numeric, objects=()):
+        self.numeric = tuple(numeric)
+        self.objects = tuple(objects)
+        self.next_id = 1
+        self.clear()
+    
+    def clear(self):
+        self.columns = {}
+        for name in self.numeric:
+            self.columns[name] = array("d")
+        for name in self.objects:
+            self.columns[name] = []
+        self.ids = []  # 行号 -> 实体ID
+        self.rows = {}  # 实体ID -> 行号
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __getitem__(self, name):
+        """取一整列组件，例如store["x"]"""
+        return self.columns[name]
+    
+    def add(self, **values):
+        entity_id = self.next_id
+        self.next_id += 1
+        self.rows[entity_id] = len(self.ids)
+        self.ids.append(entity_id)
+        for name in self.numeric:
+            self.columns[name].append(values.get(name, 0))
+        for name in self.objects:
+            self.columns[name].append(values.get(name))
+        return entity_id
+    
+    def remove_row(self, row):
+        last = len(self.ids) - 1
+        entity_id = self.ids[row]
+        if row != last:
+            moved = self.ids[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+            for column in self.columns.values():
+                column[row] = column[last]
+        for column in self.columns.values():
+            column.pop()
+        self.ids.pop()
+        del self.rows[entity_id]
+    
+    def remove(self, entity_id):
+        self.remove_row(self.rows[entity_id])
+    
+    def save(self, writer):
+        """整列写入存档，只支持数值列（对象列读回来是None）"""
+        writer.pack("<II", len(self.ids), self.next_id)
+        writer.blob(array("q", self.ids).tobytes())
+        for name in self.numeric:
+            writer.blob(self.columns[name].tobytes())
+    
+    def load(self, reader):
+        self.clear()
+        count, self.next_id = reader.unpack("<II")
+        ids = array("q")
+        ids.frombytes(reader.blob())
+        self.ids = ids.tolist()
+        self.rows = {entity_id: row for row, entity_id in enumerate(self.ids)}
+        for name in self.numeric:
+            reader.doubles(self.columns[name])
+        for name in self.objects:
+            self.columns[name] = [None] * count
+
+class Enemies(EntityStore):
+    """所有敌人的组件：位置、血量、移动速度、伤害、攻击冷却和包抄方向(±1)"""
+    def __init__(self):
+        super().__init__(("x", "y", "health", "speed", "damage", "attack_cooldown", "last_attack",
+                          "flank"))
+    
+    def spawn(self, x, y):
+        return self.add(x=x, y=y, health=100, speed=ENEMY_SPEED, damage=ENEMY_DAMAGE,
+                        attack_cooldown=1.0, last_attack=0, flank=random.choice((-1, 1)))
+
+class Medkits(EntityStore):
+    """场上的医疗包，只有位置"""
+    def __init__(self):
+        super().__init__(("x", "y"))
+
+# 敌人群体转向：彼此分开、绕开容器、贴近玩家时向两侧包抄
+SEPARATION_RADIUS = 45  # 小于这个距离的敌人互相推开，也是邻居网格的格子边长
+SEPARATION_WEIGHT = 3.0
+AVOID_RADIUS = 60  # 离容器中心小于这个距离就绕开
+AVOID_WEIGHT = 1.0
+FLANK_RANGE = 250  # 离玩家小于这个距离开始向自己那一侧包抄
+FLANK_WEIGHT = 0.8
+
+def neighbor_pairs_np(xs, ys, cell):
+    """用均匀网格找出所有可能相邻（同格或相邻格）的点对，返回索引数组(i, j)，不含i==j"""
+    n = len(xs)
+    cx = np.floor(xs / cell).astype(np.int64)
+    cy = np.floor(ys / cell).astype(np.int64)
+    # 把二维格子编号压成一个整数，按它排序后同一格的点连在一起
+    span = int(cy.max() - cy.min()) + 3
+    base_y = cy.min() - 1
+    keys = cx * span + (cy - base_y)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    pairs_i, pairs_j = [], []
+    for ox in (-1, 0, 1):
+        for oy in (-1, 0, 1):
+            wanted = (cx + ox) * span + (cy + oy - base_y)
+            lo = np.searchsorted(sorted_keys, wanted, "left")
+            counts = np.searchsorted(sorted_keys, wanted, "right") - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            pairs_i.append(np.repeat(np.arange(n), counts))
+            pairs_j.append(order[starts + np.arange(total)])
+    if not pairs_i:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+    keep = i != j
+    return i[keep], j[keep]
+
+def enemy_steering_np(xs, ys, flank, target_x, target_y, obstacles, group=None):
+    """所有敌人的移动方向（单位向量），一次向量化算完。obstacles是容器中心点列表。
+    
+    group是每个敌人所属的局号（批量对局用），不同局的敌人互不推挤，目标也可以按敌人给数组。
+    """
+    dx, dy = target_x - xs, target_y - ys
+    dist = np.hypot(dx, dy)
+    safe = np.where(dist > 0, dist, 1.0)
+    seek_x = np.where(dist > 0, dx / safe, 0.0)
+    seek_y = np.where(dist > 0, dy / safe, 0.0)
+    
+    # 包抄：越靠近玩家，越往自己那一侧（flank为±1）绕
+    side = flank * FLANK_WEIGHT * np.clip(1 - dist / FLANK_RANGE, 0, 1)
+    steer_x = seek_x - seek_y * side
+    steer_y = seek_y + seek_x * side
+    
+    # 分离：邻居越近推得越狠。不同局的敌人在网格里按局号错开，不会成为邻居
+    grid_y = ys if group is None else ys + group * (screen_height * 4)
+    i, j = neighbor_pairs_np(xs, grid_y, SEPARATION_RADIUS)
+    if len(i):
+        px, py = xs[i] - xs[j], ys[i] - ys[j]
+        d = np.hypot(px, py)
+        near = (d > 0) & (d < SEPARATION_RADIUS)
+        weight = np.where(near, (1 - d / SEPARATION_RADIUS) / np.where(d > 0, d, 1.0), 0.0)
+        steer_x += SEPARATION_WEIGHT * np.bincount(i, px * weight, len(xs))
+        steer_y += SEPARATION_WEIGHT * np.bincount(i, py * weight, len(xs))
+    
+    # 绕开容器
+    if obstacles:
+        ox = np.array([o[0] for o in obstacles], dtype=float)[None, :]
+        oy = np.array([o[1] for o in obstacles], dtype=float)[None, :]
+        px, py = xs[:, None] - ox, ys[:, None] - oy
+        d = np.hypot(px, py)
+        weight = np.where((d > 0) & (d < AVOID_RADIUS),
+                          (1 - d / AVOID_RADIUS) / np.where(d > 0, d, 1.0), 0.0)
+        steer_x += AVOID_WEIGHT * (px * weight).sum(axis=1)
+        steer_y += AVOID_WEIGHT * (py * weight).sum(axis=1)
+    
+    length = np.hypot(steer_x, steer_y)
+    length = np.where(length > 0, length, 1.0)
+    return steer_x / length, steer_y / length
+
+def enemy_steering(xs, ys, flank, target_x, target_y, obstacles):
+    """enemy_steering_np的纯Python版，没装NumPy时用"""
+    n = len(xs)
+    buckets = {}
+    for row in range(n):
+        key = (int(xs[row] // SEPARATION_RADIUS), int(ys[row] // SEPARATION_RADIUS))
+        buckets.setdefault(key, []).append(row)
+    
+    dir_x, dir_y = [0.0] * n, [0.0] * n
+    for row in range(n):
+        x, y = xs[row], ys[row]
+        dx, dy = target_x - x, target_y - y
+        dist = math.sqrt(dx*dx + dy*dy)
+        seek_x, seek_y = (dx / dist, dy / dist) if dist > 0 else (0.0, 0.0)
+        side = flank[row] * FLANK_WEIGHT * min(1.0, max(0.0, 1 - dist / FLANK_RANGE))
+        steer_x = seek_x - seek_y * side
+        steer_y = seek_y + seek_x * side
+        
+        cell_x, cell_y = int(x // SEPARATION_RADIUS), int(y // SEPARATION_RADIUS)
+        for ox in (-1, 0, 1):
+            for oy in (-1, 0, 1):
+                for other in buckets.get((cell_x + ox, cell_y + oy), ()):
+                    if other == row:
+                        continue
+                    px, py = x - xs[other], y - ys[other]
+                    d = math.sqrt(px*px + py*py)
+                    if 0 < d < SEPARATION_RADIUS:
+                        weight = SEPARATION_WEIGHT * (1 - d / SEPARATION_RADIUS) / d
+                        steer_x += px * weight
+                        steer_y += py * weight
+        
+        for obstacle_x, obstacle_y in obstacles:
+            px, py = x - obstacle_x, y - obstacle_y
+            d = math.sqrt(px*px + py*py)
+            if 0 < d < AVOID_RADIUS:
+                weight = AVOID_WEIGHT * (1 - d / AVOID_RADIUS) / d
+                steer_x += px * weight
+                steer_y += py * weight
+        
+        length = math.sqrt(steer_x*steer_x + steer_y*steer_y)
+        if length > 0:
+            dir_x[row], dir_y[row] = steer_x / length, steer_y / length
+    return dir_x, dir_y
+
+# 子弹的发射方
+OWNER_PLAYER = 0
+OWNER_ENEMY = 1
+# 全场同时存在的子弹上限，满了覆盖最老的
+PROJECTILE_CAPACITY = 1024
+# 子弹存活时间（秒）
+PROJECTILE_TTL = 3.0
+
+class Projectiles:
+    """全场子弹的固定容量环形缓冲区。
+    
+    子弹按发射顺序写进环里：tail是最老的一颗，head是下一个写入位置，
+    满了就覆盖最老的一颗，所以内存是固定的。每颗子弹带发射方(owner)和过期时间，
+    发射它的敌人死了子弹也照样飞。
+    """
+    def __init__(self, capacity=PROJECTILE_CAPACITY):
+        self.capacity = capacity
+        zeros = bytes(8 * capacity)
+        self.x = array("d", zeros)
+        self.y = array("d", zeros)
+        self.vx = array("d", zeros)
+        self.vy = array("d", zeros)
+        self.damage = array("d", zeros)
+        self.expire = array("d", zeros)
+        self.owner = bytearray(capacity)
+        self.alive = bytearray(capacity)
+        self.clear()
+    
+    def clear(self):
+        for slot in range(self.capacity):
+            self.alive[slot] = 0
+        self.head = 0
+        self.tail = 0
+        self.span = 0  # tail到head之间的槽数（含中间已失效的）
+        self.count = 0  # 存活的子弹数
+    
+    def __len__(self):
+        return self.count
+    
+    def spawn(self, x, y, angle, speed, damage, owner, now):
+        telemetry.count("bullets.spawned")
+        if self.span == self.capacity:
+            telemetry.count("bullets.overwritten")
+            self.free(self.tail)
+        slot = self.head
+        self.x[slot] = x
+        self.y[slot] = y
+        self.vx[slot] = math.cos(angle) * speed * TICK_SCALE
+        self.vy[slot] = math.sin(angle) * speed * TICK_SCALE
+        self.damage[slot] = damage
+        self.expire[slot] = now + PROJECTILE_TTL
+        self.owner[slot] = owner
+        self.alive[slot] = 1
+        self.head = (slot + 1) % self.capacity
+        self.span += 1
+        self.count += 1
+        return slot
+    
+    def spawn_many(self, x, y, angles, speed, damage, owner, now):
+        """从同一点一次发射一批子弹（霰弹），有NumPy时整批写入"""
+        count = min(len(angles), self.capacity)
+        if np is None or count == 1:
+            for angle in angles[:count]:
+                self.spawn(x, y, angle, speed, damage, owner, now)
+            return
+        telemetry.count("bullets.spawned", count)
+        while self.span + count > self.capacity:
+            telemetry.count("bullets.overwritten")
+            self.free(self.tail)
+        index = (self.head + np.arange(count)) % self.capacity
+        directions = np.array(angles[:count], dtype=float)
+        np.frombuffer(self.x)[index] = x
+        np.frombuffer(self.y)[index] = y
+        np.frombuffer(self.vx)[index] = np.cos(directions) * speed * TICK_SCALE
+        np.frombuffer(self.vy)[index] = np.sin(directions) * speed * TICK_SCALE
+        np.frombuffer(self.damage)[index] = damage
+        np.frombuffer(self.expire)[index] = now + PROJECTILE_TTL
+        np.frombuffer(self.owner, dtype=np.uint8)[index] = owner
+        np.frombuffer(self.alive, dtype=np.uint8)[index] = 1
+        self.head = (self.head + count) % self.capacity
+        self.span += count
+        self.count += count
+    
+    def free(self, slot):
+        if not self.alive[slot]:
+            return
+        self.alive[slot] = 0
+        self.count -= 1
+        # 从最老的一端回收连续失效的槽
+        while self.span > 0 and not self.alive[self.tail]:
+            self.tail = (self.tail + 1) % self.capacity
+            self.span -= 1
+    
+    def slots(self):
+        """按发射先后列出存活子弹的槽位"""
+        alive = self.alive
+        capacity = self.capacity
+        start = self.tail
+        return [slot for slot in ((start + k) % capacity for k in range(self.span)) if alive[slot]]
+    
+    def save(self, writer):
+        writer.pack("<4I", self.capacity, self.head, self.tail, self.span)
+        for column in (self.x, self.y, self.vx, self.vy, self.damage, self.expire):
+            writer.blob(column.tobytes())
+        writer.blob(bytes(self.owner))
+        writer.blob(bytes(self.alive))
+    
+    def load(self, reader, time_offset):
+        capacity, self.head, self.tail, self.span = reader.unpack("<4I")
+        if capacity != self.capacity:
+            raise ValueError(f"子弹容量不一致: {capacity}")
+        for column in (self.x, self.y, self.vx, self.vy, self.damage, self.expire):
+            reader.doubles(column)
+        self.owner[:] = reader.blob()
+        self.alive[:] = reader.blob()
+        self.count = self.alive.count(1)
+        shift_times(self.expire, time_offset)
+
+# 粒子上限，满了覆盖最老的
+PARTICLE_CAPACITY = 2048
+# 粒子调色板，emit时用下标选颜色
+PARTICLE_COLORS = [(255, 215, 0), (255, 240, 180), (255, 60, 40), (255, 140, 0)]
+SPARK, FLASH, BLOOD, EMBER = range(4)
+# 每秒速度衰减到原来的多少
+PARTICLE_DRAG = 0.05
+
+class Particles:
+    """命中火花、枪口火光、击杀碎片等粒子特效。
+    
+    位置、速度、剩余寿命、颜色存在预分配的NumPy数组里，按环形顺序写入，满了覆盖最老的，
+    所以数量有硬上限。每帧一次向量化积分，寿命到了的自然失效；绘制时用预先画好的小方块
+    精灵一次blits。没装NumPy时不显示粒子。
+    """
+    def __init__(self, capacity=PARTICLE_CAPACITY):
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.life = np.zeros(capacity)  # 剩余寿命（秒），<=0表示已失效
+        self.max_life = np.ones(capacity)
+        self.color = np.zeros(capacity, dtype=np.uint8)
+        self.head = 0
+        self.sprites = {}
+        self.sprite_scale = None
+    
+    def clear(self):
+        self.life[:] = 0
+        self.head = 0
+    
+    def emit(self, x, y, count, color, speed, life, angle=0.0, spread=2 * math.pi):
+        """在(x, y)一次放出count个粒子，方向在angle两侧各spread/2内随机"""
+        count = min(count, self.capacity)
+        index = (self.head + np.arange(count)) % self.capacity
+        self.head = (self.head + count) % self.capacity
+        directions = angle + (np.random.random(count) - 0.5) * spread
+        speeds = speed * (0.3 + 0.7 * np.random.random(count)) * TICK_SCALE
+        self.x[index] = x
+        self.y[index] = y
+        self.vx[index] = np.cos(directions) * speeds
+        self.vy[index] = np.sin(directions) * speeds
+        lives = life * (0.5 + 0.5 * np.random.random(count))
+        self.life[index] = lives
+        self.max_life[index] = lives
+        self.color[index] = color
+    
+    def step(self, dt):
+        live = self.life > 0
+        if not live.any():
+            return
+        drag = PARTICLE_DRAG ** dt
+        self.x[live] += self.vx[live]
+        self.y[live] += self.vy[live]
+        self.vx[live] *= drag
+        self.vy[live] *= drag
+        self.life[live] -= dt
+    
+    def copy_to(self, other):
+        """把画图要用的几列抄给other（快照里的粒子），不分配新数组"""
+        np.copyto(other.x, self.x)
+        np.copyto(other.y, self.y)
+        np.copyto(other.life, self.life)
+        np.copyto(other.max_life, self.max_life)
+        np.copyto(other.color, self.color)
+    
+    def build_sprites(self, scale):
+        """所有颜色、大小的粒子小图一次建好，渲染比例变了才重建，画的时候不再新建表面"""
+        self.sprites = {}
+        self.sprite_scale = scale
+        for color, rgb in enumerate(PARTICLE_COLORS):
+            for big in (False, True):
+                size = max(1, round((4 if big else 2) * scale))
+                surf = pygame.Surface((size, size))
+                surf.fill(rgb)
+                self.sprites[(color, big)] = surf
+    
+    def draw(self, target, scale=1.0):
+        """画到target上，scale是target相对逻辑坐标的缩放"""
+        live = np.flatnonzero(self.life > 0)
+        if not len(live):
+            return
+        # 寿命还剩一半以上的画大一点
+        big = (self.life[live] * 2 > self.max_life[live]).tolist()
+        colors = self.color[live].tolist()
+        xs = (self.x[live] * scale).astype(np.int32).tolist()
+        ys = (self.y[live] * scale).astype(np.int32).tolist()
+        if scale != self.sprite_scale:
+            self.build_sprites(scale)
+        sprites = self.sprites
+        target.blits([(sprites[c, b], (x, y)) for c, b, x, y in zip(colors, big, xs, ys)],
+                     doreturn=False)
+
+# 子弹命中敌人的半径
+ENEMY_HIT_RADIUS = 20
+# sweep_projectiles的结果：没打中，其余值是被打中敌人的实体ID（从1开始）
+HIT_NONE = -1
+
+def segment_circle_t(x0, y0, x1, y1, cx, cy, radius):
+    """线段(x0,y0)->(x1,y1)第一次碰到圆的位置（0~1的比例），碰不到返回None"""
+    dx, dy = x1 - x0, y1 - y0
+    fx, fy = x0 - cx, y0 - cy
+    c = fx*fx + fy*fy - radius*radius
+    if c <= 0:
+        return 0.0  # 起点就在圆内
+    a = dx*dx + dy*dy
+    b = fx*dx + fy*dy
+    disc = b*b - a*c
+    if a == 0 or disc < 0:
+        return None
+    t = (-b - math.sqrt(disc)) / a
+    return t if 0 <= t <= 1 else None
+
+def segment_box_t(x0, y0, x1, y1, left, top, right, bottom):
+    """线段第一次进入矩形的位置（0~1的比例），碰不到返回None"""
+    t_enter, t_exit = 0.0, 1.0
+    for start, delta, low, high in ((x0, x1 - x0, left, right), (y0, y1 - y0, top, bottom)):
+        if delta == 0:
+            if start < low or start >= high:
+                return None
+            continue
+        t1 = (low - start) / delta
+        t2 = (high - start) / delta
+        if t1 > t2:
+            t1, t2 = t2, t1
+        t_enter = max(t_enter, t1)
+        t_exit = min(t_exit, t2)
+        if t_enter > t_exit:
+            return None
+    return t_enter
+
+def segment_circle_t_np(x0, y0, x1, y1, cx, cy, radius):
+    """segment_circle_t的NumPy版，参数可以广播（如N×1的线段对1×M的圆），碰不到为inf"""
+    dx, dy = x1 - x0, y1 - y0
+    fx, fy = x0 - cx, y0 - cy
+    a = dx*dx + dy*dy
+    b = fx*dx + fy*dy
+    c = fx*fx + fy*fy - radius*radius
+    disc = b*b - a*c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (-b - np.sqrt(disc)) / a
+    t = np.where((disc >= 0) & (a > 0) & (t >= 0) & (t <= 1), t, np.inf)
+    return np.where(c <= 0, 0.0, t)
+
+def segment_box_t_np(x0, y0, x1, y1, left, top, right, bottom):
+    """segment_box_t的NumPy版，x0..y1是数组，矩形是一个，碰不到为inf"""
+    t_enter = np.zeros(np.shape(x0))
+    t_exit = np.ones(np.shape(x0))
+    inside = np.ones(np.shape(x0), dtype=bool)
+    for start, end, low, high in ((x0, x1, left, right), (y0, y1, top, bottom)):
+        delta = end - start
+        still = delta == 0
+        inside &= ~still | ((start >= low) & (start < high))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t1 = (low - start) / delta
+            t2 = (high - start) / delta
+        t_enter = np.where(still, t_enter, np.maximum(t_enter, np.minimum(t1, t2)))
+        t_exit = np.where(still, t_exit, np.minimum(t_exit, np.maximum(t1, t2)))
+    return np.where(inside & (t_enter <= t_exit), t_enter, np.inf)
+
+def trace_hitscan(shots, boxes, enemies):
+    """即时命中射线：先被boxes（墙、容器）截短，再一次对所有敌人求交。
+    
+    shots是Player.hitscan_shots里的(x, y, 各弹丸角度, 射程, 伤害)，返回每条射线的
+    (起点x, 起点y, 终点x, 终点y, 伤害, 打中的敌人编号或HIT_NONE)。
+    """
+    rays = []
+    for x, y, angles, length, damage in shots:
+        for angle in angles:
+            rays.append((x, y, x + math.cos(angle) * length, y + math.sin(angle) * length, damage))
+    enemy_x, enemy_y, enemy_ids = enemies["x"], enemies["y"], enemies.ids
+    
+    if np is not None:
+        x0, y0, x1, y1, damages = np.array(rays, dtype=float).T
+        reach = np.ones(len(rays))
+        for box in boxes:
+            reach = np.minimum(reach, segment_box_t_np(x0, y0, x1, y1, *box))
+        x1 = x0 + (x1 - x0) * reach
+        y1 = y0 + (y1 - y0) * reach
+        targets = [HIT_NONE] * len(rays)
+        if len(enemy_ids):
+            t = segment_circle_t_np(x0[:, None], y0[:, None], x1[:, None], y1[:, None],
+                                    np.array(enemy_x)[None, :], np.array(enemy_y)[None, :],
+                                    ENEMY_HIT_RADIUS)
+            first = t.argmin(axis=1)
+            first_t = t[np.arange(len(rays)), first]
+            hit = np.isfinite(first_t)
+            targets = np.where(hit, np.array(enemy_ids, dtype=np.int64)[first], HIT_NONE).tolist()
+            # 打中的弹道画到命中点为止
+            stop = np.where(hit, first_t, 1.0)
+            x1 = x0 + (x1 - x0) * stop
+            y1 = y0 + (y1 - y0) * stop
+        return list(zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist(), damages.tolist(), targets))
+    
+    results = []
+    for x0, y0, x1, y1, damage in rays:
+        reach = 1.0
+        for box in boxes:
+            t = segment_box_t(x0, y0, x1, y1, *box)
+            if t is not None and t < reach:
+                reach = t
+        x1, y1 = x0 + (x1 - x0) * reach, y0 + (y1 - y0) * reach
+        target, best = HIT_NONE, None
+        for row in range(len(enemy_ids)):
+            t = segment_circle_t(x0, y0, x1, y1, enemy_x[row], enemy_y[row], ENEMY_HIT_RADIUS)
+            if t is not None and (best is None or t < best):
+                target, best = enemy_ids[row], t
+        if best is not None:
+            x1, y1 = x0 + (x1 - x0) * best, y0 + (y1 - y0) * best
+        results.append((x0, y0, x1, y1, damage, target))
+    return results
+
+# 视线检测网格的格子边长（像素）
+LOS_CELL = 25
+# 视线缓存的最大条数，满了清空重来
+LOS_CACHE_SIZE = 65536
+
+class OccupancyGrid:
+    """关卡几何（空气墙、容器）的占用网格，按行存在bytearray里。
+    
+    网格外当作墙。几何每变一次version加一，用到它的缓存据此失效。
+    """
+    def __init__(self, cell=LOS_CELL):
+        self.cell = cell
+        self.cols = 0
+        self.rows = 0
+        self.cells = bytearray()
+        self.version = 0
+    
+    def reset(self, width, height):
+        self.cols = -(-width // self.cell)
+        self.rows = -(-height // self.cell)
+        self.cells = bytearray(self.cols * self.rows)
+        self.version += 1
+    
+    def fill_rect(self, rect):
+        x, y, w, h = rect
+        c0, r0 = max(0, x // self.cell), max(0, y // self.cell)
+        c1 = min(self.cols - 1, (x + w - 1) // self.cell)
+        r1 = min(self.rows - 1, (y + h - 1) // self.cell)
+        for r in range(r0, r1 + 1):
+            start = r * self.cols
+            self.cells[start + c0:start + c1 + 1] = b"\x01" * (c1 - c0 + 1)
+        self.version += 1
+    
+    def blocked(self, c, r):
+        if c < 0 or r < 0 or c >= self.cols or r >= self.rows:
+            return True
+        return self.cells[r * self.cols + c] != 0
+
+class LineOfSight:
+    """在占用网格上用DDA做视线检测。
+    
+    结果按(起点格, 终点格)缓存，几何不变就一直有效，所以敌人再多、每帧查询再多，
+    真正走射线的只有新出现的格子组合。起点和终点所在的格子本身不算遮挡，
+    站在容器上不会挡住自己的视线。
+    """
+    def __init__(self, grid):
+        self.grid = grid
+        self.cache = {}
+        self.version = None
+        self.rays = 0  # 实际走过的射线数
+    
+    def cell_of(self, x, y):
+        return int(x // self.grid.cell), int(y // self.grid.cell)
+    
+    def ray_clear(self, c0, r0, c1, r1):
+        """从格子(c0,r0)中心到(c1,r1)中心，中间经过的格子都空才返回True"""
+        self.rays += 1
+        dc, dr = c1 - c0, r1 - r0
+        step_c = 1 if dc > 0 else -1
+        step_r = 1 if dr > 0 else -1
+        # t从0到1走完整条射线，t_delta是跨过一格的t，从格子中心出发先走半格
+        t_delta_c = 1 / abs(dc) if dc else math.inf
+        t_delta_r = 1 / abs(dr) if dr else math.inf
+        t_max_c = t_delta_c / 2
+        t_max_r = t_delta_r / 2
+        c, r = c0, r0
+        for _ in range(abs(dc) + abs(dr)):
+            if t_max_c < t_max_r:
+                c += step_c
+                t_max_c += t_delta_c
+            elif t_max_r < t_max_c:
+                r += step_r
+                t_max_r += t_delta_r
+            else:
+                # 正好穿过格子角，斜着走一步
+                c += step_c
+                r += step_r
+                t_max_c += t_delta_c
+                t_max_r += t_delta_r
+            if c == c1 and r == r1:
+                return True
+            if self.grid.blocked(c, r):
+                return False
+        return True
+    
+    def can_see_many(self, xs, ys, target_x, target_y):
+        """一批点分别能否看到目标点，返回bool列表"""
+        if self.version != self.grid.version or len(self.cache) >= LOS_CACHE_SIZE:
+            self.cache.clear()
+            self.version = self.grid.version
+        cache = self.cache
+        target = self.cell_of(target_x, target_y)
+        result = []
+        for x, y in zip(xs, ys):
+            key = self.cell_of(x, y) + target
+            seen = cache.get(key)
+            if seen is None:
+                seen = key[:2] == target or self.ray_clear(*key)
+                cache[key] = seen
+            result.append(seen)
+        return result
+
+# 战争迷雾：只照亮玩家朝向前方的视野锥，默认关闭
+FOG_OF_WAR = False
+FOG_RANGE = 600  # 视野距离
+FOG_FOV = math.radians(100)  # 视野锥张角
+FOG_RAYS = 64  # 视野锥内均匀投射的射线数（另外还有指向障碍物角点的射线）
+FOG_ALPHA = 220  # 视野外的遮罩不透明度
+# 玩家移动或转身超过这些阈值才重算遮罩
+FOG_MOVE_THRESHOLD = 6
+FOG_TURN_THRESHOLD = math.radians(2)
+
+class FogOfWar:
+    """视野锥战争迷雾。
+    
+    从玩家位置向视野锥内投射射线，被空气墙和容器挡住的部分留在阴影里，得到可见多边形，
+    再画进一张整屏的半透明遮罩。只有玩家移动或转身超过阈值、几何或缩放变化时才重算，
+    平时每帧只贴这一张遮罩。
+    """
+    def __init__(self):
+        self.mask = None
+        self.key = None  # 上次重算时的(x, y, 朝向, 几何版本, 缩放)
+        self.polygon = []
+        self.rebuilds = 0
+    
+    def stale(self, x, y, angle, version, scale):
+        if self.key is None:
+            return True
+        old_x, old_y, old_angle, old_version, old_scale = self.key
+        turn = abs((angle - old_angle + math.pi) % (2 * math.pi) - math.pi)
+        return (version != old_version or scale != old_scale or turn > FOG_TURN_THRESHOLD or
+                (x - old_x)**2 + (y - old_y)**2 > FOG_MOVE_THRESHOLD**2)
+    
+    def visible_polygon(self, x, y, angle, obstacles):
+        # 站在容器上时不让它挡住自己
+        boxes = [(r.left, r.top, r.right, r.bottom) for r in obstacles if not r.collidepoint(x, y)]
+        half = FOG_FOV / 2
+        offsets = [-half + FOG_FOV * i / FOG_RAYS for i in range(FOG_RAYS + 1)]
+        # 再向每个角点左右各打一条射线，阴影边缘才准
+        for left, top, right, bottom in boxes:
+            for cx, cy in ((left, top), (right, top), (left, bottom), (right, bottom)):
+                offset = (math.atan2(cy - y, cx - x) - angle + math.pi) % (2 * math.pi) - math.pi
+                if abs(offset) < half:
+                    offsets.append(offset - 0.0005)
+                    offsets.append(offset + 0.0005)
+        offsets.sort()
+        
+        points = [(x, y)]
+        for offset in offsets:
+            end_x = x + math.cos(angle + offset) * FOG_RANGE
+            end_y = y + math.sin(angle + offset) * FOG_RANGE
+            nearest = 1.0
+            for box in boxes:
+                t = segment_box_t(x, y, end_x, end_y, *box)
+                if t is not None and t < nearest:
+                    nearest = t
+            points.append((x + (end_x - x) * nearest, y + (end_y - y) * nearest))
+        return points
+    
+    def update(self, x, y, angle, obstacles, version, scale=1.0):
+        """返回当前的遮罩，需要时先重算。scale是遮罩相对屏幕的分辨率"""
+        if not self.stale(x, y, angle, version, scale):
+            return self.mask
+        self.key = (x, y, angle, version, scale)
+        self.polygon = self.visible_polygon(x, y, angle, obstacles)
+        size = (max(1, round(screen_width * scale)), max(1, round(screen_height * scale)))
+        if self.mask is None or self.mask.get_size() != size:
+            self.mask = pygame.Surface(size, pygame.SRCALPHA)
+        self.mask.fill((0, 0, 0, FOG_ALPHA))
+        # 在SRCALPHA表面上画透明色是直接写入，相当于把可见区域挖掉
+        pygame.draw.polygon(self.mask, (0, 0, 0, 0), [(px * scale, py * scale) for px, py in self.polygon])
+        self.rebuilds += 1
+        return self.mask
+
+GRID_TITLE_HEIGHT = 40  # 网格面板上方标题栏的高度
+GRID_HIGHLIGHT = (100, 100, 200)
+
+class GridPanel:
+    """背包/容器的格子面板（保留模式）。
+    
+    整个面板画在一张缓存表面上，每格记住上次画的内容，sync()时只重画变化的格子；
+    点击检测用同一套格子几何。
+    """
+    def __init__(self, x, y, width, height, cols, rows, title):
+        self.x = x
+        self.y = y
+        self.cols = cols
+        self.rows = rows
+        self.cell_width = width // cols
+        self.cell_height = height // rows
+        self.width = width
+        self.height = height
+        self.title = title
+        self.base = None  # 空面板（背景、边框、格线、标题）
+        self.surface = None
+        self.cells = [None] * (cols * rows)  # 每格上次画的内容
+        self.redraws = 0
+    
+    def set_title(self, title):
+        if title != self.title:
+            self.title = title
+            self.base = None
+    
+    def cell_rect(self, index):
+        """格子在面板表面上的位置"""
+        row, col = divmod(index, self.cols)
+        return pygame.Rect(col * self.cell_width, GRID_TITLE_HEIGHT + row * self.cell_height,
+                           self.cell_width, self.cell_height)
+    
+    def cell_at(self, pos):
+        """屏幕坐标落在哪一格，不在格子里返回None"""
+        px = pos[0] - self.x
+        py = pos[1] - self.y
+        if not (0 <= px < self.cols * self.cell_width and 0 <= py < self.rows * self.cell_height):
+            return None
+        return int(py // self.cell_height) * self.cols + int(px // self.cell_width)
+    
+    def build(self):
+        size = (self.width, self.height + GRID_TITLE_HEIGHT)
+        self.base = pygame.Surface(size, pygame.SRCALPHA)
+        box = (0, GRID_TITLE_HEIGHT, self.width, self.height)
+        pygame.draw.rect(self.base, (50, 50, 80), box, border_radius=10)
+        pygame.draw.rect(self.base, COLORS["blue"], box, 2, border_radius=10)
+        
+        title_text = large_font.render(self.title, True, COLORS["white"])
+        self.base.blit(title_text, (self.width//2 - title_text.get_width()//2, 0))
+        
+        for col in range(self.cols + 1):
+            pygame.draw.line(self.base, COLORS["grid"],
+                             (col * self.cell_width, GRID_TITLE_HEIGHT),
+                             (col * self.cell_width, GRID_TITLE_HEIGHT + self.height), 1)
+        for row in range(self.rows + 1):
+            pygame.draw.line(self.base, COLORS["grid"],
+                             (0, GRID_TITLE_HEIGHT + row * self.cell_height),
+                             (self.width, GRID_TITLE_HEIGHT + row * self.cell_height), 1)
+        
+        self.surface = self.base.copy()
+        self.cells = [None] * len(self.cells)
+    
+    def sync(self, items, selected_index=None):
+        """把物品列表同步到缓存表面，只重画内容变了的格子"""
+        if self.base is None:
+            self.build()
+        changed = False
+        for i in range(len(self.cells)):
+            item = items[i] if i < len(items) else None
+            if item is None:
+                key = None
+            else:
+                key = (item["name"], item["value"], item["color"], i == selected_index)
+            if key == self.cells[i]:
+                continue
+            self.cells[i] = key
+            self.draw_cell(i, item, key)
+            changed = True
+        return changed
+    
+    def draw_cell(self, index, item, key):
+        rect = self.cell_rect(index)
+        self.surface.fill((0, 0, 0, 0), rect)
+        self.surface.blit(self.base, rect, rect)
+        self.redraws += 1
+        if item is None:
+            return
+        
+        # 高亮显示选中的物品
+        if key[3]:
+            pygame.draw.rect(self.surface, GRID_HIGHLIGHT, rect)
+        
+        item_text = font.render(item["name"], True, item["color"])
+        self.surface.blit(item_text, (rect.x + 10, rect.y + 10))
+        
+        value_text = font.render(f"¥{item['value']:,}", True, COLORS["money"])
+        self.surface.blit(value_text, (rect.x + 10, rect.y + 30))
+    
+    def draw(self):
+        screen.blit(self.surface, (self.x, self.y - GRID_TITLE_HEIGHT))
+
+STASH_CELL_WIDTH = 140
+STASH_ROW_HEIGHT = 60
+STASH_ROW_CACHE = 64  # 最多缓存多少行画好的表面
+STASH_SORTS = ("入库顺序", "价值")
+
+class Stash:
+    """局外仓库，跨局保存带出来的物品。
+    
+    物品按入库顺序存放，另外按名称建索引；筛选直接取索引，按价值排序是把各名称
+    已排好的下标列表归并起来。结果缓存到仓库内容变化为止。
+    """
+    def __init__(self, items=()):
+        self.items = []
+        self.by_name = {}  # 名称 -> 这种物品在items里的下标（升序）
+        self.version = 0
+        self.views = {}
+        for item in items:
+            self.add(item)
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def add(self, item):
+        self.by_name.setdefault(item["name"], []).append(len(self.items))
+        self.items.append(item)
+        self.version += 1
+        self.views.clear()
+    
+    def remove(self, index):
+        """取出一件物品。后面物品的下标都变了，索引整个重建"""
+        item = self.items.pop(index)
+        self.by_name = {}
+        for i, other in enumerate(self.items):
+            self.by_name.setdefault(other["name"], []).append(i)
+        self.version += 1
+        self.views.clear()
+        return item
+    
+    def names(self):
+        """仓库里有的物品名称，价值高的在前"""
+        return sorted(self.by_name, key=lambda name: -max(self.items[i]["value"] for i in self.by_name[name]))
+    
+    def view(self, name=None, sort=0):
+        """筛选、排序后的物品下标列表。name为None不筛选，sort是STASH_SORTS的下标"""
+        key = (name, sort)
+        view = self.views.get(key)
+        if view is not None:
+            return view
+        if sort == 0:
+            if name is None:
+                view = list(range(len(self.items)))
+            else:
+                view = self.by_name.get(name, [])
+        else:
+            by_value = lambda i: -self.items[i]["value"]
+            if name is None:
+                view = list(heapq.merge(*(self.view(other, sort) for other in self.by_name), key=by_value))
+            else:
+                view = sorted(self.by_name.get(name, []), key=by_value)
+        self.views[key] = view
+        return view
+    
+    def to_list(self):
+        return [[item["name"], item["value"], list(item["color"])] for item in self.items]
+
+class StashPanel:
+    """仓库界面：虚拟滚动网格，只画、只检测可见的行，每行画好后缓存成一张表面"""
+    def __init__(self, x, y, width, height, stash):
+        self.stash = stash
+        self.rect = pygame.Rect(x, y, width, height)
+        self.cols = max(1, width // STASH_CELL_WIDTH)
+        self.cell_width = width // self.cols
+        self.scroll = 0
+        self.filter = None
+        self.sort = 0
+        self.selected = None  # 选中的是视图里的第几个
+        self.rows = {}  # 行号 -> 画好的表面，按最近使用排序
+        self.rows_key = None
+        self.rows_rendered = 0
+    
+    def view(self):
+        return self.stash.view(self.filter, self.sort)
+    
+    def row_count(self):
+        return (len(self.view()) + self.cols - 1) // self.cols
+    
+    def scroll_by(self, dy):
+        max_scroll = max(0, self.row_count() * STASH_ROW_HEIGHT - self.rect.height)
+        self.scroll = min(max(self.scroll + dy, 0), max_scroll)
+    
+    def cycle_filter(self):
+        """在“全部”和仓库里有的各种物品之间切换筛选"""
+        options = [None] + self.stash.names()
+        current = options.index(self.filter) if self.filter in options else 0
+        self.filter = options[(current + 1) % len(options)]
+        self.scroll = 0
+        self.selected = None
+    
+    def toggle_sort(self):
+        self.sort = (self.sort + 1) % len(STASH_SORTS)
+        self.scroll = 0
+        self.selected = None
+    
+    def cell_at(self, pos):
+        """屏幕坐标落在视图的第几个物品上，没有返回None"""
+        px = pos[0] - self.rect.x
+        py = pos[1] - self.rect.y
+        if not (0 <= px < self.cols * self.cell_width and 0 <= py < self.rect.height):
+            return None
+        index = int((py + self.scroll) // STASH_ROW_HEIGHT) * self.cols + int(px // self.cell_width)
+        return index if index < len(self.view()) else None
+    
+    def header(self):
+        name = self.filter if self.filter is not None else "全部"
+        return f"仓库 {len(self.stash)}件 | 筛选: {name} | 排序: {STASH_SORTS[self.sort]}"
+    
+    def render_key(self):
+        """界面上会变化的内容，空闲界面靠它判断要不要重绘"""
+        return (self.stash.version, self.filter, self.sort, self.scroll, self.selected)
+    
+    def row_surface(self, row, scale=1.0):
+        key = (self.stash.version, self.filter, self.sort, self.selected, scale)
+        if key != self.rows_key:
+            self.rows.clear()
+            self.rows_key = key
+        surf = self.rows.pop(row, None)
+        if surf is None:
+            surf = self.render_row(row)
+            if scale != 1.0:
+                w, h = surf.get_size()
+                surf = pygame.transform.smoothscale(surf, (max(1, round(w * scale)), max(1, round(h * scale))))
+            if len(self.rows) >= STASH_ROW_CACHE:
+                del self.rows[next(iter(self.rows))]
+        self.rows[row] = surf
+        return surf
+    
+    def render_row(self, row):
+        self.rows_rendered += 1
+        view = self.view()
+        surf = pygame.Surface((self.rect.width, STASH_ROW_HEIGHT))
+        surf.fill((50, 50, 80))
+        for col in range(self.cols):
+            index = row * self.cols + col
+            cell = pygame.Rect(col * self.cell_width, 0, self.cell_width, STASH_ROW_HEIGHT)
+            if index < len(view):
+                item = self.stash.items[view[index]]
+                if index == self.selected:
+                    pygame.draw.rect(surf, GRID_HIGHLIGHT, cell)
+                surf.blit(font.render(item["name"], True, item["color"]), (cell.x + 8, cell.y + 6))
+                surf.blit(font.render(f"¥{item['value']:,}", True, COLORS["money"]), (cell.x + 8, cell.y + 30))
+            pygame.draw.rect(surf, COLORS["grid"], cell, 1)
+        return surf
+    
+    def visible_rows(self):
+        first = int(self.scroll // STASH_ROW_HEIGHT)
+        last = min(self.row_count(), int((self.scroll + self.rect.height) // STASH_ROW_HEIGHT) + 1)
+        return range(first, last)
+    
+    def draw_rows(self, target, scale=1.0):
+        """把可见的行贴到target上，坐标按scale换算"""
+        x, y, w, h = self.rect
+        clip = pygame.Rect(round(x * scale), round(y * scale), round(w * scale), round(h * scale))
+        target.set_clip(clip)
+        for row in self.visible_rows():
+            top = y + row * STASH_ROW_HEIGHT - self.scroll
+            target.blit(self.row_surface(row, scale), (round(x * scale), round(top * scale)))
+        target.set_clip(None)
+    
+    def draw(self):
+        pygame.draw.rect(screen, (50, 50, 80), self.rect)
+        self.draw_rows(screen)
+        pygame.draw.rect(screen, COLORS["blue"], self.rect.inflate(4, 4), 2, border_radius=10)
+        title = large_font.render(self.header(), True, COLORS["white"])
+        screen.blit(title, (self.rect.x, self.rect.y - 50))
+
+CONTAINER_MAX_ITEMS = 7
+
+class Container:
+    def __init__(self, x, y, name, loot):
+        self.x, self.y = x, y
+        self.name = name
+        self.rect = pygame.Rect(x - 25, y - 25, 50, 50)
+        self.items = []
+        self.grid_size = 5
+        self.max_items = CONTAINER_MAX_ITEMS
+        if loot is not None:  # 读档时传None，物品由存档填入
+            self.generate_items(loot)
+        self.is_open = False
+        
+    def generate_items(self, loot):
+        """生成物品。loot记录稀有物品的保底计数和本局是否已出（即RaidLevel）"""
+        common_items = [
+            {"name": "海盗银币", "color": COLORS["blue"], "value": ITEM_VALUES["海盗银币"]},
+            {"name": "溶解液", "color": COLORS["green"], "value": ITEM_VALUES["溶解液"]},
+            {"name": "鼠标", "color": COLORS["white"], "value": ITEM_VALUES["鼠标"]},
+            {"name": "间谍笔", "color": COLORS["purple"], "value": ITEM_VALUES["间谍笔"]},
+            {"name": "海盗金币", "color": COLORS["gold"], "value": ITEM_VALUES["海盗金币"]}
+        ]
+        
+        rare_items = [
+            {"name": "非洲之星", "color": COLORS["red"], "value": ITEM_VALUES["非洲之星"]},
+            {"name": "步战车", "color": COLORS["red"], "value": ITEM_VALUES["步战车"]}
+        ]
+        
+        # 生成3-7个物品
+        num_items = random.randint(3, self.max_items)
+        
+        # 非洲之星生成逻辑 (1%基础概率，100局保底)
+        if not loot.africa_star_spawned and (random.random() < RARE_ITEM_CHANCES["非洲之星"] or loot.africa_star_counter >= 100):
+            self.items.append(rare_items[0])
+            loot.africa_star_spawned = True
+            loot.africa_star_counter = 0
+            num_items -= 1
+        
+        # 步战车生成逻辑 (2%基础概率，50局保底)
+        if not loot.tank_spawned and (random.random() < RARE_ITEM_CHANCES["步战车"] or loot.tank_counter >= 50):
+            self.items.append(rare_items[1])
+            loot.tank_spawned = True
+            loot.tank_counter = 0
+            num_items -= 1
+        
+        # 生成普通物品（使用加权随机）
+        weights = [COMMON_ITEM_WEIGHTS[item["name"]] for item in common_items]
+        for _ in range(num_items):
+            item = random.choices(common_items, weights=weights, k=1)[0].copy()
+            self.items.append(item)
+    
+    def transfer_item(self, grid_index, player):
+        """把物品放进玩家背包，返回转移的物品，失败返回None"""
+        if 0 <= grid_index < len(self.items) and player.can_pickup():
+            transferred_item = self.items.pop(grid_index)
+            if player.add_to_inventory(transferred_item):
+                return transferred_item
+        return None
+    
+    def receive_item(self, item):
+        if len(self.items) < self.max_items:
+            self.items.append(item)
+            return True
+        return False
+
+def wall_rects():
+    """四周空气墙的矩形"""
+    wall_padding = 50
+    return [
+        pygame.Rect(0, 0, screen_width, wall_padding),  # 上墙
+        pygame.Rect(0, 0, wall_padding, screen_height),  # 左墙
+        pygame.Rect(screen_width - wall_padding, 0, wall_padding, screen_height),  # 右墙
+        pygame.Rect(0, screen_height - wall_padding, screen_width, wall_padding)  # 下墙
+    ]
+
+def random_edge_position():
+    """在屏幕四边外随机取一个敌人出生点"""
+    side = random.randint(0, 3)
+    padding = 100
+    if side == 0:  # 上
+        x = random.randint(padding, screen_width - padding)
+        y = -50
+    elif side == 1:  # 右
+        x = screen_width + 50
+        y = random.randint(padding, screen_height - padding)
+    elif side == 2:  # 下
+        x = random.randint(padding, screen_width - padding)
+        y = screen_height + 50
+    else:  # 左
+        x = -50
+        y = random.randint(padding, screen_height - padding)
+    return x, y
+
+# 更自然分散的容器分布
+CONTAINER_LAYOUT = [
+    ("衣服", (200, 150)),  # 左上
+    ("衣柜", (1000, 180)),  # 右上
+    ("武器箱", (250, 550)),   # 左下
+    ("高级储物箱", (950, 600)),   # 右下
+    ("收纳盒", (600, 300)),   # 中上
+    ("野外物资箱", (650, 500))    # 中下
+]
+EXTRACT_ZONE = (screen_width - 150, screen_height - 150, 100, 100)
+EXTRACTION_TIME = 10  # 在撤离点站满多少秒算撤离成功
+
+class RaidLevel:
+    """一局的关卡数据：容器、物资、初始敌人和撤离点。
+    
+    不读写Game，可以放在后台线程里生成。生成容器物资时借用本对象记录
+    稀有物品的保底状态，换入游戏时由Game.apply_level接管。
+    """
+    def __init__(self, africa_star_counter, tank_counter):
+        self.africa_star_counter = africa_star_counter
+        self.tank_counter = tank_counter
+        self.africa_star_spawned = False
+        self.tank_spawned = False
+        self.containers = []
+        self.enemies = Enemies()
+        
+        for name, pos in CONTAINER_LAYOUT:
+            self.containers.append(Container(pos[0], pos[1], name, self))
+        
+        self.extract_zone = pygame.Rect(EXTRACT_ZONE)
+        
+        for _ in range(5):
+            x, y = random_edge_position()
+            self.enemies.spawn(x, y)
+
+class LevelPregenerator:
+    """在结算/菜单界面用后台线程预生成下一局，开局时直接换入"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.ready = None  # (保底计数, RaidLevel)
+    
+    def request(self, africa_star_counter, tank_counter):
+        key = (africa_star_counter, tank_counter)
+        with self.lock:
+            if self.thread is not None or (self.ready is not None and self.ready[0] == key):
+                return
+            self.thread = threading.Thread(target=self._build, args=(key,), daemon=True)
+            self.thread.start()
+    
+    def _build(self, key):
+        try:
+            level = RaidLevel(*key)
+        except Exception as e:
+            print(f"预生成关卡失败: {e}")
+            level = None
+        with self.lock:
+            self.ready = (key, level) if level is not None else None
+            self.thread = None
+    
+    def take(self, africa_star_counter, tank_counter):
+        """取走预生成的关卡；还在生成就等它完成，保底计数对不上则返回None"""
+        with self.lock:
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+        with self.lock:
+            ready, self.ready = self.ready, None
+        if ready is not None and ready[0] == (africa_star_counter, tank_counter):
+            return ready[1]
+        return None
+
+class RaidSnapshot:
+    """一帧局内画面要用的全部数据。
+    
+    模拟这边把状态抄进来，画的时候只读它，不碰Game里正在被模拟改动的对象。
+    各列预先分配、反复复用，每帧抄一遍不产生新对象。
+    """
+    def __init__(self):
+        self.raid_start = None  # 属于哪一局，刚开局还没抄到新数据时不画旧局的画面
+        self.state = GameState.PLAYING
+        self.player_rect = pygame.Rect(0, 0, 0, 0)
+        self.player_x = 0.0
+        self.player_y = 0.0
+        self.facing_angle = 0.0
+        self.health = 0
+        self.max_health = 1
+        self.weapon_name = None
+        self.ammo = 0
+        self.max_ammo = 0
+        self.reloading = False
+        self.reload_progress = 0.0
+        self.enemy_x = array("d")
+        self.enemy_y = array("d")
+        self.enemy_health = array("d")
+        self.medkit_x = array("d")
+        self.medkit_y = array("d")
+        zeros = bytes(8 * PROJECTILE_CAPACITY)
+        self.bullet_x = array("d", zeros)
+        self.bullet_y = array("d", zeros)
+        self.bullet_owner = bytearray(PROJECTILE_CAPACITY)
+        self.bullet_count = 0
+        self.tracers = []
+        self.particles = Particles() if np is not None else None
+        self.extract_zone = pygame.Rect(0, 0, 0, 0)
+        # 容器的位置和名字抄成两列，Rect反复复用
+        self.container_rects = []
+        self.container_names = []
+        self.container_open = -1  # 玩家旁边的容器在上面两列里的下标，没有为-1
+        self.container_is_open = False
+        self.container_items = []
+        self.inventory = []
+        self.inventory_open = False
+        self.raid_value = 0
+        self.extract_remaining = 0.0
+        self.fog_obstacles = ()
+        self.occupancy_version = 0
+    
+    def capture(self, game):
+        """从game抄一份当前的局内状态"""
+        player = game.player
+        self.raid_start = game.raid_start
+        self.state = game.state
+        self.player_rect.update(player.rect)
+        self.player_x = player.x
+        self.player_y = player.y
+        self.facing_angle = player.facing_angle
+        self.health = player.health
+        self.max_health = player.max_health
+        self.weapon_name = player.weapon_name
+        self.ammo = player.ammo
+        self.max_ammo = player.max_ammo
+        self.reloading = player.reloading
+        self.reload_progress = player.last_reload_progress
+        self.enemy_x[:] = game.enemies["x"]
+        self.enemy_y[:] = game.enemies["y"]
+        self.enemy_health[:] = game.enemies["health"]
+        self.medkit_x[:] = game.medkits["x"]
+        self.medkit_y[:] = game.medkits["y"]
+        projectiles = game.projectiles
+        count = 0
+        for slot in projectiles.slots():
+            self.bullet_x[count] = projectiles.x[slot]
+            self.bullet_y[count] = projectiles.y[slot]
+            self.bullet_owner[count] = projectiles.owner[slot]
+            count += 1
+        self.bullet_count = count
+        self.tracers[:] = game.tracers
+        if self.particles is not None and game.particles is not None:
+            game.particles.copy_to(self.particles)
+        self.extract_zone.update(game.extract_zone)
+        containers = game.containers
+        rects = self.container_rects
+        while len(rects) < len(containers):
+            rects.append(pygame.Rect(0, 0, 0, 0))
+        del rects[len(containers):]
+        for rect, container in zip(rects, containers):
+            rect.update(container.rect)
+        self.container_names[:] = [container.name for container in containers]
+        container = game.container_open
+        self.container_open = containers.index(container) if container is not None else -1
+        self.container_is_open = container is not None and container.is_open
+        if self.container_is_open:
+            self.container_items[:] = container.items
+        self.inventory[:] = player.inventory
+        self.inventory_open = game.inventory_open
+        self.raid_value = game.current_raid_value
+        if game.state == GameState.EXTRACTING:
+            self.extract_remaining = max(0, game.extraction_time - (game_clock.time() - game.extraction_start))
+        self.fog_obstacles = wall_rects() + rects
+        self.occupancy_version = game.occupancy.version
+
+class SnapshotBuffer:
+    """模拟线程和主线程之间的三缓冲。
+    
+    模拟线程往back里抄，抄完publish()和ready交换；主线程latest()时把ready换到front来画。
+    两边各自只碰自己手里那一份，交换在锁里完成，所以正在画的快照不会被改写，
+    模拟也不用等画完。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.back = RaidSnapshot()
+        self.ready = RaidSnapshot()
+        self.front = RaidSnapshot()
+        self.fresh = False
+    
+    def publish(self):
+        with self.lock:
+            self.back, self.ready = self.ready, self.back
+            self.fresh = True
+    
+    def latest(self):
+        """最新发布的快照，没有新的返回None"""
+        with self.lock:
+            if not self.fresh:
+                return None
+            self.front, self.ready = self.ready, self.front
+            self.fresh = False
+            return self.front
+
+# 世界推进：单人的Game和联机的CoopServer共用同一套规则。
+# world要有enemies、projectiles、sight、containers、obstacle_boxes、last_enemy_spawn
+# 和damage_enemy(row, amount)；players只放活着的玩家
+def obstacle_boxes(containers):
+    """挡子弹和射线的几何（空气墙和容器）打包成(左, 上, 右, 下)，几何变了才需要重算"""
+    return [(r.left, r.top, r.right, r.bottom) for r in wall_rects() + [c.rect for c in containers]]
+
+def resolve_hitscan(world, player, now):
+    """结算一个玩家这一帧的即时命中射击，打中的敌人交给world.damage_enemy，返回trace_hitscan的弹道"""
+    shots = player.hitscan_shots
+    if not shots:
+        return []
+    player.hitscan_shots = []
+    # 玩家站在里面的格子（比如贴着容器）不挡自己的枪
+    x, y = player.x, player.y
+    boxes = [box for box in world.obstacle_boxes
+             if not (box[0] <= x < box[2] and box[1] <= y < box[3])]
+    traces = trace_hitscan(shots, boxes, world.enemies)
+    for *_, damage, target in traces:
+        row = world.enemies.rows.get(target)
+        if row is not None:
+            world.damage_enemy(row, damage)
+    return traces
+
+def move_enemies(world, players, now):
+    """敌人AI：成群追向最近的玩家（互相分开、绕开容器、包抄），进入射程、看得到并且冷却好了就朝它开火。
+    返回这一帧开火的敌人数"""
+    enemies = world.enemies
+    count = len(enemies)
+    if not players or not count:
+        return 0
+    xs, ys = enemies["x"], enemies["y"]
+    flank = enemies["flank"]
+    px = [player.x for player in players]
+    py = [player.y for player in players]
+    obstacles = [(container.x, container.y) for container in world.containers]
+    if len(players) == 1:
+        nearest = [0] * count
+        if np is not None:
+            dir_x, dir_y = enemy_steering_np(np.array(xs), np.array(ys), np.array(flank), px[0], py[0], obstacles)
+            dir_x, dir_y = dir_x.tolist(), dir_y.tolist()
+        else:
+            dir_x, dir_y = enemy_steering(xs, ys, flank, px[0], py[0], obstacles)
+    elif np is not None:
+        ex, ey = np.array(xs), np.array(ys)
+        tx, ty = np.array(px), np.array(py)
+        nearest = ((ex[:, None] - tx) ** 2 + (ey[:, None] - ty) ** 2).argmin(axis=1)
+        dir_x, dir_y = enemy_steering_np(ex, ey, np.array(flank), tx[nearest], ty[nearest], obstacles)
+        nearest, dir_x, dir_y = nearest.tolist(), dir_x.tolist(), dir_y.tolist()
+    else:
+        nearest = [min(range(len(players)), key=lambda k: (px[k] - xs[row]) ** 2 + (py[k] - ys[row]) ** 2)
+                   for row in range(count)]
+        dir_x, dir_y = [0.0] * count, [0.0] * count
+        # 纯Python版一次只能追一个目标，按追的玩家分组算（组与组之间不互相推开）
+        for k in set(nearest):
+            rows = [row for row in range(count) if nearest[row] == k]
+            group_x, group_y = enemy_steering([xs[r] for r in rows], [ys[r] for r in rows],
+                                              [flank[r] for r in rows], px[k], py[k], obstacles)
+            for row, gx, gy in zip(rows, group_x, group_y):
+                dir_x[row], dir_y[row] = gx, gy
+    speeds = enemies["speed"]
+    for row in range(count):
+        xs[row] += dir_x[row] * speeds[row] * TICK_SCALE
+        ys[row] += dir_y[row] * speeds[row] * TICK_SCALE
+    
+    # 每个玩家对所有敌人的视线一次查完
+    visible = [world.sight.can_see_many(xs, ys, x, y) for x, y in zip(px, py)]
+    damages = enemies["damage"]
+    cooldowns = enemies["attack_cooldown"]
+    last_attacks = enemies["last_attack"]
+    fired = 0
+    for row in range(count):
+        k = nearest[row]
+        dx, dy = px[k] - xs[row], py[k] - ys[row]
+        if now - last_attacks[row] >= cooldowns[row] and dx*dx + dy*dy < 300*300 and visible[k][row]:
+            last_attacks[row] = now
+            world.projectiles.spawn(xs[row], ys[row], math.atan2(dy, dx), 10, damages[row],
+                                    OWNER_ENEMY, now)
+            fired += 1
+    return fired
+
+def sweep_projectiles(world, slots, players):
+    """子弹前进一步，返回每颗子弹这一步路径上最先碰到的敌人编号（没有为HIT_NONE）和玩家下标（没有为-1）。
+    
+    用这一步的线段做碰撞，不是只看终点，低帧率、高速子弹也不会穿过目标。
+    有NumPy时所有子弹对所有敌人一次算完。
+    """
+    projectiles = world.projectiles
+    enemies = world.enemies
+    boxes = [(p.rect.left, p.rect.top, p.rect.right, p.rect.bottom) for p in players]
+    if np is not None:
+        index = np.array(slots, dtype=np.intp)
+        xs = np.frombuffer(projectiles.x)
+        ys = np.frombuffer(projectiles.y)
+        x0, y0 = xs[index], ys[index]
+        x1 = x0 + np.frombuffer(projectiles.vx)[index]
+        y1 = y0 + np.frombuffer(projectiles.vy)[index]
+        xs[index], ys[index] = x1, y1
+        
+        targets = np.full(len(slots), HIT_NONE, dtype=np.int64)
+        victims = np.full(len(slots), -1, dtype=np.int64)
+        mine = np.frombuffer(projectiles.owner, dtype=np.uint8)[index] == OWNER_PLAYER
+        if mine.any() and len(enemies):
+            t = segment_circle_t_np(x0[mine, None], y0[mine, None], x1[mine, None], y1[mine, None],
+                                    np.array(enemies["x"])[None, :],
+                                    np.array(enemies["y"])[None, :], ENEMY_HIT_RADIUS)
+            first = t.argmin(axis=1)
+            hit = np.isfinite(t[np.arange(len(first)), first])
+            ids = np.array(enemies.ids, dtype=np.int64)
+            targets[mine] = np.where(hit, ids[first], HIT_NONE)
+        theirs = ~mine
+        if theirs.any() and boxes:
+            t = np.stack([segment_box_t_np(x0[theirs], y0[theirs], x1[theirs], y1[theirs], *box)
+                          for box in boxes], axis=1)
+            first = t.argmin(axis=1)
+            victims[theirs] = np.where(np.isfinite(t[np.arange(len(first)), first]), first, -1)
+        return targets.tolist(), victims.tolist()
+    
+    targets, victims = [], []
+    enemy_x, enemy_y, enemy_ids = enemies["x"], enemies["y"], enemies.ids
+    for slot in slots:
+        x0, y0 = projectiles.x[slot], projectiles.y[slot]
+        x1, y1 = x0 + projectiles.vx[slot], y0 + projectiles.vy[slot]
+        projectiles.x[slot], projectiles.y[slot] = x1, y1
+        target, victim, best = HIT_NONE, -1, None
+        if projectiles.owner[slot] == OWNER_PLAYER:
+            for row in range(len(enemy_ids)):
+                t = segment_circle_t(x0, y0, x1, y1, enemy_x[row], enemy_y[row], ENEMY_HIT_RADIUS)
+                if t is not None and (best is None or t < best):
+                    best, target = t, enemy_ids[row]
+        else:
+            for k, box in enumerate(boxes):
+                t = segment_box_t(x0, y0, x1, y1, *box)
+                if t is not None and (best is None or t < best):
+                    best, victim = t, k
+        targets.append(target)
+        victims.append(victim)
+    return targets, victims
+
+def update_projectiles(world, players, now):
+    """所有子弹一次遍历：移动、过期、命中、出界。返回打中玩家的子弹数和这一帧被打死的玩家下标"""
+    projectiles = world.projectiles
+    slots = projectiles.slots()
+    if not slots:
+        return 0, []
+    targets, victims = sweep_projectiles(world, slots, players)
+    expired = hits = out = struck = 0
+    killed = []
+    for slot, target, victim in zip(slots, targets, victims):
+        if now >= projectiles.expire[slot]:
+            projectiles.free(slot)
+            expired += 1
+            continue
+        
+        if victim >= 0:
+            projectiles.free(slot)
+            hits += 1
+            struck += 1
+            # 同一帧里已经被前面的子弹打死的玩家不再结算
+            if victim not in killed and players[victim].take_damage(int(projectiles.damage[slot])):
+                killed.append(victim)
+            continue
+        if target != HIT_NONE:
+            # 同一帧里目标可能已经被前面的子弹打死，那这颗就继续飞
+            row = world.enemies.rows.get(target)
+            if row is not None:
+                world.damage_enemy(row, projectiles.damage[slot])
+                projectiles.free(slot)
+                hits += 1
+                continue
+        
+        x, y = projectiles.x[slot], projectiles.y[slot]
+        if x < 0 or x > screen_width or y < 0 or y > screen_height:
+            projectiles.free(slot)
+            out += 1
+    if telemetry.enabled:
+        telemetry.count("bullets.expired", expired)
+        telemetry.count("bullets.hit", hits)
+        telemetry.count("bullets.out_of_bounds", out)
+    return struck, killed
+
+def spawn_enemy_wave(world, now, interval, wave, limit=None):
+    """距上一波满interval秒就从四边刷wave个敌人，场上最多limit个（None为不限），返回刷了几个"""
+    if now - world.last_enemy_spawn < interval:
+        return 0
+    count = wave if limit is None else min(wave, limit - len(world.enemies))
+    if count <= 0:
+        return 0
+    for _ in range(count):
+        x, y = random_edge_position()
+        world.enemies.spawn(x, y)
+    world.last_enemy_spawn = now
+    return count
+
+class Game:
+    def __init__(self, autosave=True):
+        # 初始化时加载保存的哈弗币
+        self.havoc_coins = load_havoc_coins()
+        self.level_pregen = LevelPregenerator()
+        # 局内存档：定时打包，后台线程写盘（自动对局时关掉）
+        self.raid_start = 0
+        self.autosaver = Autosaver(RAID_SAVE_FILE if autosave else None)
+        self.last_autosave = 0
+        # 自动对局不写哈弗币和仓库，免得覆盖玩家的存档
+        self.persistent = autosave
+        self.reset_game()
+        
+        # 窗口状态：失去焦点时降帧，不可见时不绘制
+        self.window_focused = True
+        self.window_visible = True
+        self.force_redraw = True
+        self.last_render_key = None
+        
+        # 战争迷雾（FOG_OF_WAR打开时才有）
+        self.fog = FogOfWar() if FOG_OF_WAR else None
+        
+        # 背包和容器的格子面板，缓存画好的表面，点击检测也用它们的格子几何
+        self.backpack_panel = GridPanel(50, 100, screen_width//2 - 100, screen_height - 200, 5, 5, "背包")
+        self.container_panel = GridPanel(screen_width//2 + 50, 100, screen_width//2 - 100, screen_height - 200, 5, 5, "")
+        
+        # 局外仓库
+        self.stash = load_stash()
+        self.stash_panel = StashPanel(100, 120, screen_width - 200, screen_height - 240, self.stash)
+        self.stash_open = False
+        
+        # 输入：事件里记下按键，每帧整理成一个TickInput交给update
+        self.tick_input = TickInput()
+        # 模拟线程模式：sim_lock保护世界状态，局内画面经三缓冲的快照交给主线程
+        self.sim_lock = threading.Lock()
+        self.sim_running = False
+        self.snapshots = SnapshotBuffer()
+        self.raid_view = RaidSnapshot()  # 单线程时每帧现抄一份来画
+        self.ui = {}  # 界面底板和遮罩，见build_ui()
+        self.ui_size = None
+        # 画出来的文字按(字体, 内容, 颜色)缓存，见text()
+        self.text_cache = {}
+        self.text_hits = 0
+        self.text_misses = 0
+        # 画医疗包、敌人时挪来挪去的矩形，不用每个实体新建一个
+        self.medkit_rect = pygame.Rect(0, 0, MEDKIT_SIZE, MEDKIT_SIZE)
+        self.enemy_rect = pygame.Rect(0, 0, ENEMY_SIZE, ENEMY_SIZE)
+    
+    def reset_game(self):
+        """回到菜单的初始状态，不生成关卡（开局时由start_raid换入）"""
+        self.state = GameState.MENU
+        self.projectiles = Projectiles()
+        self.particles = Particles() if np is not None else None
+        self.occupancy = OccupancyGrid()
+        self.sight = LineOfSight(self.occupancy)
+        self.player = Player(self.projectiles)
+        self.players = [self.player]  # 交给共用的世界推进函数
+        self.tracers = []  # 即时命中弹道：(起点x, 起点y, 终点x, 终点y, 消失时间)
+        self.enemies = Enemies()
+        self.containers = []
+        self.obstacle_boxes = []
+        self.medkits = Medkits()
+        self.extract_zone = None
+        self.last_enemy_spawn = 0
+        self.enemy_spawn_interval = ENEMY_SPAWN_INTERVAL
+        self.last_medkit_spawn = 0
+        self.medkit_spawn_interval = 30
+        self.extraction_start = 0
+        self.extraction_time = EXTRACTION_TIME
+        self.container_open = None
+        self.inventory_open = False
+        self.trigger_held = False  # 左键是否按住
+        self.current_raid_value = 0
+        self.extracted_value = 0
+        self.africa_star_counter = 0
+        self.tank_counter = 0
+        self.africa_star_spawned = False
+        self.tank_spawned = False
+    
+    def setup_level(self):
+        """换入下一局的关卡，只在start_raid里调用：预生成的关卡只在这里取走"""
+        self.medkits.clear()
+        self.current_raid_value = 0
+        self.extracted_value = 0
+        self.africa_star_counter += 1
+        self.tank_counter += 1
+        
+        # 优先使用后台线程预生成好的关卡，没有才当场生成
+        level = self.level_pregen.take(self.africa_star_counter, self.tank_counter)
+        if level is None:
+            level = RaidLevel(self.africa_star_counter, self.tank_counter)
+        self.apply_level(level)
+    
+    def apply_level(self, level):
+        """把生成好的关卡一次性换入游戏（只在主线程调用）"""
+        self.containers = level.containers
+        self.enemies = level.enemies
+        self.extract_zone = level.extract_zone
+        self.africa_star_counter = level.africa_star_counter
+        self.tank_counter = level.tank_counter
+        self.africa_star_spawned = level.africa_star_spawned
+        self.tank_spawned = level.tank_spawned
+        # 关卡可能早就生成好了，刷怪计时从开局算起
+        self.last_enemy_spawn = game_clock.time()
+        self.build_occupancy()
+    
+    def fog_obstacles(self):
+        """挡视线的几何：空气墙和容器"""
+        return wall_rects() + [container.rect for container in self.containers]
+    
+    def build_occupancy(self):
+        """按空气墙和容器重建视线检测用的占用网格（几何变了才需要调用）"""
+        self.occupancy.reset(screen_width, screen_height)
+        for wall in wall_rects():
+            self.occupancy.fill_rect(wall)
+        for container in self.containers:
+            self.occupancy.fill_rect(container.rect)
+        self.obstacle_boxes = obstacle_boxes(self.containers)
+    
+    def take_from_container(self, index):
+        """从打开的容器拿一件物品到背包，返回拿到的物品"""
+        item = self.container_open.transfer_item(index, self.player)
+        if item is not None:
+            self.current_raid_value += item["value"]
+        return item
+    
+    def pack_state(self):
+        """把整局状态打包成二进制存档，几千个实体也只要几毫秒"""
+        start = time.perf_counter()
+        writer = SaveWriter()
+        writer.pack("<4sHd", SAVE_STATE_MAGIC, SAVE_STATE_VERSION, game_clock.time())
+        writer.pack("<Bq", self.state, self.current_raid_value)
+        writer.pack("<II??", self.africa_star_counter, self.tank_counter,
+                    self.africa_star_spawned, self.tank_spawned)
+        writer.pack("<3d", self.last_enemy_spawn, self.last_medkit_spawn, self.extraction_start)
+        writer.pack("<4i", *self.extract_zone)
+        # 随机数状态也存下来，读档后刷出的敌人和物品和不读档时一样
+        _, internal, gauss = random.getstate()
+        writer.pack("<H", len(internal))
+        writer.pack(f"<{len(internal)}I", *internal)
+        writer.pack("<?d", gauss is not None, gauss or 0.0)
+        self.player.save(writer)
+        self.enemies.save(writer)
+        self.medkits.save(writer)
+        self.projectiles.save(writer)
+        writer.pack("<H", len(self.containers))
+        for container in self.containers:
+            writer.pack("<2d?", container.x, container.y, container.is_open)
+            writer.string(container.name)
+            writer.pack("<B", len(container.items))
+            for item in container.items:
+                writer.item(item)
+        data = writer.getvalue()
+        telemetry.observe("save.raid_pack_ms", (time.perf_counter() - start) * 1000)
+        return data
+    
+    def restore_state(self, data):
+        """读回pack_state的存档，格式不对抛ValueError。粒子和弹道这类纯画面的东西不存"""
+        reader = SaveReader(data)
+        magic, version, saved_at = reader.unpack("<4sHd")
+        if magic != SAVE_STATE_MAGIC or version != SAVE_STATE_VERSION:
+            raise ValueError(f"不支持的存档格式（版本{version}）")
+        time_offset = game_clock.time() - saved_at
+        self.reset_game()
+        state, self.current_raid_value = reader.unpack("<Bq")
+        (self.africa_star_counter, self.tank_counter,
+         self.africa_star_spawned, self.tank_spawned) = reader.unpack("<II??")
+        last_enemy_spawn, last_medkit_spawn, extraction_start = reader.unpack("<3d")
+        self.last_enemy_spawn = last_enemy_spawn + time_offset
+        self.last_medkit_spawn = last_medkit_spawn + time_offset
+        self.extraction_start = extraction_start + time_offset
+        self.extract_zone = pygame.Rect(reader.unpack("<4i"))
+        (length,) = reader.unpack("<H")
+        internal = reader.unpack(f"<{length}I")
+        has_gauss, gauss = reader.unpack("<?d")
+        random.setstate((3, internal, gauss if has_gauss else None))
+        self.player.load(reader, time_offset)
+        self.enemies.load(reader)
+        shift_times(self.enemies["last_attack"], time_offset)
+        self.medkits.load(reader)
+        self.projectiles.load(reader, time_offset)
+        (count,) = reader.unpack("<H")
+        self.containers = []
+        for _ in range(count):
+            x, y, is_open = reader.unpack("<2d?")
+            container = Container(x, y, reader.string(), None)
+            container.is_open = is_open
+            (size,) = reader.unpack("<B")
+            container.items = [reader.item() for _ in range(size)]
+            self.containers.append(container)
+        self.build_occupancy()
+        self.state = state
+    
+    def autosave(self, now):
+        """交给后台线程写自动存档"""
+        self.last_autosave = now
+        if self.autosaver.path is not None:
+            self.autosaver.submit(self.pack_state())
+    
+    def save_raid_now(self):
+        """局内时立即写存档（快速存档、退出、切后台）"""
+        if self.state in (GameState.PLAYING, GameState.EXTRACTING):
+            self.last_autosave = game_clock.time()
+            self.autosaver.save_now(self.pack_state())
+    
+    def start_raid(self):
+        """开始新的一局，上一局没打完的存档作废"""
+        self.autosaver.discard()
+        self.reset_game()
+        self.setup_level()
+        self.state = GameState.PLAYING
+        self.last_autosave = game_clock.time()
+        self.raid_start = self.last_autosave
+        telemetry.event("raid_start", resumed=False)
+    
+    def raid_over(self, outcome):
+        """一局结束（outcome是"dead"或"extracted"）：删掉局内存档，记一条遥测"""
+        self.autosaver.discard()
+        telemetry.event("raid_end", outcome=outcome, duration=round(game_clock.time() - self.raid_start, 2),
+                        extracted_value=self.extracted_value, raid_value=self.current_raid_value,
+                        enemies=len(self.enemies))
+    
+    def resume_raid(self):
+        """从局内存档继续，成功返回True"""
+        data = self.autosaver.load()
+        if data is None:
+            return False
+        try:
+            self.restore_state(data)
+        except Exception as e:
+            print(f"读取存档失败: {e}")
+            self.reset_game()
+            self.autosaver.discard()
+            return False
+        self.last_autosave = game_clock.time()
+        self.raid_start = self.last_autosave
+        telemetry.event("raid_start", resumed=True)
+        return True
+    
+    def next_level_counters(self):
+        """下一局开局时的保底计数（reset_game会先清零，setup_level再加一）"""
+        return 1, 1
+    
+    def spawn_medkit(self):
+        valid_position = False
+        while not valid_position:
+            x = random.randint(50, screen_width - 50)
+            y = random.randint(50, screen_height - 50)
+            new_rect = pygame.Rect(x - 15, y - 15, 30, 30)
+            
+            valid_position = True
+            for container in self.containers:
+                if new_rect.colliderect(container.rect):
+                    valid_position = False
+                    break
+            
+            if valid_position:
+                self.medkits.add(x=x, y=y)
+                self.last_medkit_spawn = game_clock.time()
+                break
+    
+    def damage_enemy(self, row, amount):
+        """扣血，血量归零就删掉这个敌人，返回是否击杀"""
+        health = self.enemies["health"]
+        health[row] -= amount
+        killed = health[row] <= 0
+        if self.particles is not None:
+            x, y = self.enemies["x"][row], self.enemies["y"][row]
+            self.particles.emit(x, y, 6, SPARK, 4, 0.25)
+            if killed:
+                self.particles.emit(x, y, 24, BLOOD, 5, 0.6)
+                self.particles.emit(x, y, 10, EMBER, 2, 0.9)
+        sounds.play("enemy_die" if killed else "hit")
+        if killed:
+            self.enemies.remove_row(row)
+        return killed
+    
+    def muzzle_flash(self):
+        if self.particles is not None:
+            player = self.player
+            x = player.x + math.cos(player.facing_angle) * 20
+            y = player.y + math.sin(player.facing_angle) * 20
+            self.particles.emit(x, y, 5, FLASH, 4, 0.08, player.facing_angle, 0.6)
+    
+    def pickup_medkits(self):
+        """玩家碰到医疗包就回血"""
+        medkits = self.medkits
+        xs, ys = medkits["x"], medkits["y"]
+        player_x, player_y = self.player.rect.center
+        reach = (MEDKIT_SIZE + self.player.rect.width) / 2
+        # 倒序遍历：删除时搬过来的最后一行已经检查过
+        for row in range(len(medkits) - 1, -1, -1):
+            if abs(xs[row] - player_x) < reach and abs(ys[row] - player_y) < reach:
+                self.player.heal()
+                medkits.remove_row(row)
+    
+    def handle_stash_event(self, event):
+        """仓库界面：滚轮/翻页键滚动，Tab筛选，S排序，右键卖出，B或Esc关闭"""
+        panel = self.stash_panel
+        if event.type == pygame.MOUSEWHEEL:
+            panel.scroll_by(-event.y * STASH_ROW_HEIGHT)
+        elif event.type == pygame.KEYDOWN:
+            if event.key in (pygame.K_b, pygame.K_ESCAPE):
+                self.stash_open = False
+            elif event.key == pygame.K_TAB:
+                panel.cycle_filter()
+            elif event.key == pygame.K_s:
+                panel.toggle_sort()
+            elif event.key == pygame.K_PAGEDOWN:
+                panel.scroll_by(panel.rect.height)
+            elif event.key == pygame.K_PAGEUP:
+                panel.scroll_by(-panel.rect.height)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+            clicked = panel.cell_at(event.pos)
+            if clicked is not None:
+                self.sell_stash_item(panel.view()[clicked])
+    
+    def sell_stash_item(self, index):
+        """卖掉仓库里的一件物品换成哈弗币"""
+        item = self.stash.remove(index)
+        self.havoc_coins += item["value"]
+        self.stash_panel.selected = None
+        self.stash_panel.scroll_by(0)
+        self.save_progress()
+    
+    def save_progress(self):
+        """哈弗币和仓库立刻写盘（带出物资、卖出、切后台时）"""
+        if self.persistent:
+            save_havoc_coins(self.havoc_coins, self.stash)
+    
+    def calculate_inventory_value(self):
+        total = 0
+        for item in self.player.inventory:
+            if item is not None:
+                total += item["value"]
+        return total
+    
+    def wait_events(self, timeout):
+        """阻塞等待事件，超时返回空列表，等待期间不占CPU"""
+        event = pygame.event.wait(int(timeout * 1000))
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+    
+    def handle_window_event(self, event):
+        """处理焦点、最小化、切后台等窗口事件，处理了返回True"""
+        if event.type == pygame.WINDOWFOCUSLOST:
+            self.window_focused = False
+        elif event.type == pygame.WINDOWFOCUSGAINED:
+            self.window_focused = True
+            self.force_redraw = True
+        elif event.type in (pygame.WINDOWMINIMIZED, pygame.WINDOWHIDDEN,
+                            pygame.APP_WILLENTERBACKGROUND, pygame.APP_DIDENTERBACKGROUND):
+            self.window_visible = False
+            if event.type == pygame.APP_WILLENTERBACKGROUND:
+                # 切到后台后系统随时可能杀掉进程，先存档
+                self.save_raid_now()
+                self.save_progress()
+        elif event.type in (pygame.WINDOWRESTORED, pygame.WINDOWSHOWN,
+                            pygame.APP_DIDENTERFOREGROUND):
+            self.window_visible = True
+            self.force_redraw = True
+        elif event.type == pygame.WINDOWEXPOSED:
+            self.force_redraw = True
+        else:
+            return False
+        return True
+    
+    def collect_input(self):
+        """把这一帧的键盘、鼠标状态整理进tick_input（要调SDL，只在主线程调用）"""
+        tick_input = self.tick_input
+        keys = pygame.key.get_pressed()
+        tick_input.move_x = keys[pygame.K_d] - keys[pygame.K_a]
+        tick_input.move_y = keys[pygame.K_s] - keys[pygame.K_w]
+        mouse_x, mouse_y = pygame.mouse.get_pos()
+        tick_input.aim_angle = math.atan2(mouse_y - self.player.y, mouse_x - self.player.x)
+        tick_input.fire = self.trigger_held
+        return tick_input
+    
+    def apply_actions(self, tick_input):
+        """处理这一帧按下的换弹、背包、互动键"""
+        if tick_input.reload and not self.player.reloading and self.player.ammo < self.player.max_ammo:
+            self.player.reloading = True
+            self.player.reload_start = game_clock.time()
+            sounds.play("reload")
+        
+        if tick_input.toggle_inventory:
+            self.inventory_open = not self.inventory_open
+        
+        if tick_input.weapon is not None:
+            self.player.equip(WEAPON_ORDER[tick_input.weapon])
+        
+        if tick_input.interact and self.container_open:
+            if self.container_open.is_open:
+                self.container_open.is_open = False
+                self.inventory_open = False
+            else:
+                self.container_open.is_open = True
+                self.inventory_open = True
+    
+    def handle_events(self, events=None):
+        if events is None:
+            events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.QUIT:
+                # 退出时保存哈弗币，局内的话顺便存档
+                save_havoc_coins(self.havoc_coins, self.stash)
+                self.save_raid_now()
+                return False
+            
+            if self.handle_window_event(event):
+                continue
+            
+            if self.state == GameState.MENU and self.stash_open:
+                self.handle_stash_event(event)
+            
+            elif self.state == GameState.MENU:
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
+                    self.start_raid()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_b:
+                    self.stash_open = True
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
+                    self.resume_raid()
+            
+            elif self.state in [GameState.PLAYING, GameState.EXTRACTING]:
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_r:
+                        self.tick_input.reload = True
+                    
+                    if event.key == pygame.K_e:
+                        self.tick_input.toggle_inventory = True
+                    
+                    if event.key == pygame.K_f:
+                        self.tick_input.interact = True
+                    
+                    # 数字键换枪
+                    if pygame.K_1 <= event.key < pygame.K_1 + len(WEAPON_ORDER):
+                        self.tick_input.weapon = event.key - pygame.K_1
+                    
+                    # F5快速存档，F9读档
+                    if event.key == pygame.K_F5:
+                        self.save_raid_now()
+                    elif event.key == pygame.K_F9:
+                        self.resume_raid()
+                
+                # 修改：左键射击
+                if event.type == pygame.MOUSEBUTTONDOWN and not self.inventory_open:
+                    if event.button == 1:  # 左键射击
+                        self.trigger_held = True
+                
+                if event.type == pygame.MOUSEBUTTONUP:
+                    if event.button == 1:  # 左键释放
+                        self.trigger_held = False
+                
+                if event.type == pygame.MOUSEBUTTONDOWN and self.inventory_open:
+                    mouse_pos = pygame.mouse.get_pos()
+                    
+                    clicked_index = self.backpack_panel.cell_at(mouse_pos)
+                    if clicked_index is not None:
+                        # 右键点击背包物品放回容器
+                        if event.button == 3 and clicked_index < len(self.player.inventory):
+                            if self.container_open and self.container_open.is_open:
+                                # 将物品转移到容器中
+                                item = self.player.inventory[clicked_index]
+                                if item is not None and len(self.container_open.items) < self.container_open.max_items:
+                                    self.container_open.items.append(item)
+                                    self.player.inventory[clicked_index] = None
+                                    self.current_raid_value -= item["value"]
+                    
+                    if self.container_open and self.container_open.is_open:
+                        clicked_index = self.container_panel.cell_at(mouse_pos)
+                        if clicked_index is not None:
+                            # 左键点击容器物品拾取
+                            if event.button == 1 and clicked_index < len(self.container_open.items):
+                                self.take_from_container(clicked_index)
+            
+            elif self.state in (GameState.DEAD, GameState.SUCCESS):
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_v:
+                    self.reset_game()
+        
+        return True
+    
+    def update(self, tick_input=None):
+        """推进一帧，最后播放这一帧攒下的音效"""
+        self.update_world(tick_input)
+        sounds.flush()
+    
+    def update_world(self, tick_input=None):
+        if self.state in [GameState.PLAYING, GameState.EXTRACTING]:
+            if tick_input is None:
+                tick_input = self.collect_input()
+            self.apply_actions(tick_input)
+            can_shoot = not self.inventory_open
+            rounds_before = self.player.rounds_fired
+            self.player.update(tick_input, can_shoot)
+            if self.player.rounds_fired > rounds_before:
+                self.muzzle_flash()
+                sounds.play("sniper" if self.player.weapon["hitscan"] else "shoot")
+            
+            current_time = game_clock.time()
+            for x0, y0, x1, y1, _, _ in resolve_hitscan(self, self.player, current_time):
+                self.tracers.append((x0, y0, x1, y1, current_time + TRACER_TIME))
+            if move_enemies(self, self.players, current_time):
+                sounds.play("enemy_shoot")
+            struck, killed = update_projectiles(self, self.players, current_time)
+            if struck:
+                sounds.play("player_hit")
+            if killed:
+                sounds.play("death")
+                self.state = GameState.DEAD
+                self.extracted_value = 0
+                self.raid_over("dead")
+            if self.particles is not None:
+                self.particles.step(1 / TICK_RATE)
+            if self.tracers:
+                self.tracers = [tracer for tracer in self.tracers if tracer[4] > current_time]
+            
+            spawn_enemy_wave(self, current_time, self.enemy_spawn_interval, 5)
+            
+            if (len(self.medkits) == 0 and 
+                current_time - self.last_medkit_spawn >= self.medkit_spawn_interval):
+                self.spawn_medkit()
+            
+            self.pickup_medkits()
+            
+            self.container_open = None
+            for container in self.containers:
+                if self.player.rect.colliderect(container.rect):
+                    self.container_open = container
+                    break
+            
+            if self.player.rect.colliderect(self.extract_zone):
+                if self.state != GameState.EXTRACTING:
+                    self.state = GameState.EXTRACTING
+                    self.extraction_start = current_time
+            else:
+                if self.state == GameState.EXTRACTING:
+                    self.state = GameState.PLAYING
+            
+            if (self.state == GameState.EXTRACTING and 
+                current_time - self.extraction_start >= self.extraction_time):
+                self.state = GameState.SUCCESS
+                if self.player.reloading:
+                    self.player.ammo = self.player.max_ammo
+                    self.player.reloading = False
+                
+                # 带出的物品存进仓库，在仓库里卖掉才换成哈弗币
+                self.extracted_value = self.calculate_inventory_value()
+                for item in self.player.inventory:
+                    if item is not None:
+                        self.stash.add(item)
+                # 先把仓库写盘再删局内存档，中途崩溃或被系统杀掉也不丢东西
+                self.save_progress()
+                self.raid_over("extracted")
+                sounds.play("extract")
+            
+            if (self.state in (GameState.PLAYING, GameState.EXTRACTING) and
+                current_time - self.last_autosave >= AUTOSAVE_INTERVAL):
+                self.autosave(current_time)
+        
+        elif self.state in (GameState.MENU, GameState.DEAD, GameState.SUCCESS):
+            # 玩家在菜单/结算界面时，后台预生成下一局
+            self.level_pregen.request(*self.next_level_counters())
+    
+    def build_ui(self):
+        """半透明的界面底板和遮罩，屏幕尺寸变了才重建，平时每帧直接贴"""
+        size = screen.get_size()
+        if self.ui_size == size:
+            return
+        self.ui_size = size
+        self.ui = {}
+        for name, (width, height, color) in UI_SURFACES.items():
+            surf = pygame.Surface((width or size[0], height or size[1]), pygame.SRCALPHA)
+            surf.fill(color)
+            self.ui[name] = surf
+    
+    def text(self, text_font, text, color):
+        """渲染文字，结果按(字体, 内容, 颜色)缓存"""
+        key = (text_font, text, color)
+        surf = self.text_cache.get(key)
+        if surf is not None:
+            self.text_hits += 1
+            return surf
+        self.text_misses += 1
+        if len(self.text_cache) >= TEXT_CACHE_SIZE:
+            # 数值类文字会不断变化，满了整个清掉，比逐个淘汰简单
+            self.text_cache.clear()
+        surf = text_font.render(text, True, color)
+        self.text_cache[key] = surf
+        return surf
+    
+    def draw(self, view=None):
+        """画一帧。局内画面只读view（RaidSnapshot）；不传就先从当前状态抄一份（单线程模式）"""
+        state = self.state if view is None else view.state
+        self.build_ui()
+        screen.fill(COLORS["black"])
+        
+        # 绘制空气墙
+        for wall in wall_rects():
+            pygame.draw.rect(screen, COLORS["wall"], wall)
+        
+        if state == GameState.MENU:
+            screen.fill((20, 20, 40))
+            
+            title = self.text(large_font, "方块洲行动（内测版）", COLORS["white"])
+            subtitle = self.text(font, "代号: DRO", (200, 50, 50))
+            start = self.text(large_font, "按Enter键开始行动", COLORS["green"])
+            
+            coins_text = self.text(large_font, f"方块币: ¥{self.havoc_coins:,}", COLORS["money"])
+            
+            screen.blit(title, (screen_width//2 - title.get_width()//2, screen_height//3))
+            screen.blit(subtitle, (screen_width//2 - subtitle.get_width()//2, screen_height//3 + 60))
+            screen.blit(start, (screen_width//2 - start.get_width()//2, screen_height//2 + 100))
+            screen.blit(coins_text, (screen_width//2 - coins_text.get_width()//2, screen_height//2 + 180))
+            
+            stash_text = self.text(font, f"按B打开仓库（{len(self.stash)}件）", COLORS["white"])
+            screen.blit(stash_text, (screen_width//2 - stash_text.get_width()//2, screen_height//2 + 240))
+            
+            if self.autosaver.exists:
+                resume_text = self.text(font, "按C继续上一局", COLORS["green"])
+                screen.blit(resume_text, (screen_width//2 - resume_text.get_width()//2, screen_height//2 + 290))
+            
+            if self.stash_open:
+                screen.blit(self.ui["stash_shade"], (0, 0))
+                self.stash_panel.draw()
+                tip = self.text(font, "滚轮/PgUp/PgDn滚动 | Tab筛选 | S排序 | 右键卖出 | B关闭", COLORS["white"])
+                screen.blit(tip, (100, screen_height - 90))
+        
+        elif state in [GameState.PLAYING, GameState.EXTRACTING]:
+            if view is None:
+                view = self.raid_view
+                view.capture(self)
+            pygame.draw.rect(screen, COLORS["green"], view.extract_zone, border_radius=5)
+            
+            for index, rect in enumerate(view.container_rects):
+                color = COLORS["container"] if index == view.container_open else COLORS["white"]
+                pygame.draw.rect(screen, color, rect, 2, border_radius=5)
+                
+                name_text = self.text(font, view.container_names[index], COLORS["white"])
+                screen.blit(name_text, (rect.centerx - name_text.get_width()//2, 
+                                      rect.y - 30))
+            
+            medkit_x, medkit_y = view.medkit_x, view.medkit_y
+            medkit = self.medkit_rect
+            for row in range(len(medkit_x)):
+                medkit.center = (medkit_x[row], medkit_y[row])
+                pygame.draw.rect(screen, COLORS["health"], medkit, border_radius=3)
+                pygame.draw.line(screen, COLORS["white"], 
+                               (medkit.x + 5, medkit.centery), 
+                               (medkit.right - 5, medkit.centery), 3)
+                pygame.draw.line(screen, COLORS["white"], 
+                               (medkit.centerx, medkit.y + 5), 
+                               (medkit.centerx, medkit.bottom - 5), 3)
+            
+            pygame.draw.rect(screen, COLORS["white"], view.player_rect, border_radius=3)
+            end_x = view.player_x + math.cos(view.facing_angle) * 25
+            end_y = view.player_y + math.sin(view.facing_angle) * 25
+            pygame.draw.line(screen, COLORS["red"], (view.player_x, view.player_y), (end_x, end_y), 2)
+            
+            enemy_x, enemy_y = view.enemy_x, view.enemy_y
+            enemy_health = view.enemy_health
+            enemy_rect = self.enemy_rect
+            for row in range(len(enemy_x)):
+                enemy_rect.center = (enemy_x[row], enemy_y[row])
+                pygame.draw.rect(screen, COLORS["red"], enemy_rect, border_radius=3)
+                pygame.draw.rect(screen, COLORS["black"], 
+                               (enemy_rect.x, enemy_rect.y - 12, enemy_rect.width, 6))
+                pygame.draw.rect(screen, COLORS["health"], 
+                               (enemy_rect.x, enemy_rect.y - 12, 
+                                enemy_rect.width * (enemy_health[row] / 100), 6))
+            
+            for i in range(view.bullet_count):
+                center = (int(view.bullet_x[i]), int(view.bullet_y[i]))
+                if view.bullet_owner[i] == OWNER_PLAYER:
+                    pygame.draw.circle(screen, COLORS["ammo"], center, 4)
+                else:
+                    pygame.draw.circle(screen, (255, 100, 100), center, 3)
+            
+            for x0, y0, x1, y1, _ in view.tracers:
+                pygame.draw.line(screen, (255, 240, 180), (x0, y0), (x1, y1), 2)
+            
+            if view.particles is not None:
+                view.particles.draw(screen)
+            
+            if self.fog is not None:
+                mask = self.fog.update(view.player_x, view.player_y, view.facing_angle,
+                                       view.fog_obstacles, view.occupancy_version)
+                screen.blit(mask, (0, 0))
+            
+            screen.blit(self.ui["top_bar"], (0, 0))
+            
+            health_text = self.text(font, f"生命: {view.health}/{view.max_health}", COLORS["white"])
+            pygame.draw.rect(screen, (50, 50, 50), (120, 30, 200, 20))
+            pygame.draw.rect(screen, COLORS["health"], 
+                           (120, 30, 200 * (view.health / view.max_health), 20))
+            screen.blit(health_text, (20, 30))
+            
+            ammo_text = self.text(font, f"{view.weapon_name} 弹药: {view.ammo}/{view.max_ammo}", COLORS["ammo"])
+            screen.blit(ammo_text, (20, 55))
+            
+            value_text = self.text(font, f"物资价值: ¥{view.raid_value:,}", COLORS["money"])
+            screen.blit(value_text, (screen_width - value_text.get_width() - 20, 30))
+            
+            # 添加操作提示
+            controls_text = self.text(font, "左键射击 | R换弹 | F互动 | E背包 | 1-4换枪", COLORS["white"])
+            screen.blit(controls_text, (screen_width//2 - controls_text.get_width()//2, screen_height - 30))
+            
+            if view.reloading:
+                reload_progress = view.reload_progress
+                pygame.draw.rect(screen, (80, 80, 80), 
+                               (screen_width//2 - 150, 50, 300, 20), border_radius=10)
+                pygame.draw.rect(screen, (0, 150, 255), 
+                               (screen_width//2 - 150, 50, 300 * reload_progress, 20), border_radius=10)
+                reload_text = self.text(large_font, "换弹中...", COLORS["white"])
+                screen.blit(reload_text, (screen_width//2 - reload_text.get_width()//2, 15))
+            
+            if view.container_open >= 0 and not view.container_is_open:
+                prompt = self.text(large_font, f"按F打开{view.container_names[view.container_open]}",
+                               COLORS["white"])
+                screen.blit(prompt, (screen_width//2 - prompt.get_width()//2, screen_height - 120))
+            
+            if view.inventory_open:
+                screen.blit(self.ui["inventory_shade"], (0, 0))
+                
+                self.backpack_panel.sync(view.inventory)
+                self.backpack_panel.draw()
+                
+                # 添加背包操作提示
+                backpack_tip = self.text(font, "右键放回物品", COLORS["white"])
+                screen.blit(backpack_tip, (50, screen_height - 80))
+                
+                if view.container_is_open:
+                    self.container_panel.set_title(view.container_names[view.container_open])
+                    self.container_panel.sync(view.container_items)
+                    self.container_panel.draw()
+                    
+                    # 添加容器操作提示
+                    container_tip = self.text(font, "左键拾取物品到背包", COLORS["white"])
+                    screen.blit(container_tip, (screen_width//2 + 50, screen_height - 80))
+            
+            if view.state == GameState.EXTRACTING:
+                remaining = view.extract_remaining
+                screen.blit(self.ui["extract_timer"], (screen_width//2 - 150, 20))
+                
+                extract_text = self.text(large_font, "撤离中", COLORS["green"])
+                time_text = self.text(large_font, f"{remaining:.1f}秒", COLORS["white"])
+                
+                screen.blit(extract_text, (screen_width//2 - extract_text.get_width()//2, 25))
+                screen.blit(time_text, (screen_width//2 - time_text.get_width()//2, 60))
+        
+        elif state == GameState.DEAD:
+            screen.blit(self.ui["dead_shade"], (0, 0))
+            
+            fail_text = self.text(large_font, "任务失败", COLORS["red"])
+            reason_text = self.text(font, "你已被敌人击毙", (200, 200, 200))
+            prompt = self.text(large_font, "按V键返回主菜单", COLORS["white"])
+            value_text = self.text(large_font, f"带出物资价值: ¥0", COLORS["money"])
+            
+            screen.blit(fail_text, (screen_width//2 - fail_text.get_width()//2, screen_height//2 - 80))
+            screen.blit(reason_text, (screen_width//2 - reason_text.get_width()//2, screen_height//2 - 30))
+            screen.blit(value_text, (screen_width//2 - value_text.get_width()//2, screen_height//2 + 10))
+            screen.blit(prompt, (screen_width//2 - prompt.get_width()//2, screen_height//2 + 80))
+        
+        elif state == GameState.SUCCESS:
+            screen.blit(self.ui["success_shade"], (0, 0))
+            
+            success_text = self.text(large_font, "任务完成", COLORS["green"])
+            reward_text = self.text(font, "成功撤离！", (200, 255, 200))
+            prompt = self.text(large_font, "按V键返回主菜单", COLORS["white"])
+            value_text = self.text(large_font, f"带出物资价值: ¥{self.extracted_value:,}", COLORS["money"])
+            coins_text = self.text(large_font, f"已存入仓库，仓库共{len(self.stash)}件", COLORS["money"])
+            
+            screen.blit(success_text, (screen_width//2 - success_text.get_width()//2, screen_height//2 - 120))
+            screen.blit(reward_text, (screen_width//2 - reward_text.get_width()//2, screen_height//2 - 70))
+            screen.blit(value_text, (screen_width//2 - value_text.get_width()//2, screen_height//2 - 20))
+            screen.blit(coins_text, (screen_width//2 - coins_text.get_width()//2, screen_height//2 + 30))
+            screen.blit(prompt, (screen_width//2 - prompt.get_width()//2, screen_height//2 + 100))
+        
+        pygame.display.flip()
+    
+    def idle_render_key(self):
+        """菜单/结算界面上会变化的内容，变了才需要重绘"""
+        return (self.state, self.havoc_coins, self.extracted_value,
+                self.stash_open, self.stash_panel.render_key(), self.autosaver.exists)
+    
+    def is_idle(self):
+        """处在菜单/结算界面，并且画面没有需要更新的内容"""
+        return (self.state in IDLE_STATES and not self.force_redraw and
+                self.idle_render_key() == self.last_render_key)
+    
+    def should_draw(self):
+        if not self.window_visible:
+            return False
+        if self.state not in IDLE_STATES:
+            # 战斗中每帧都画；回到空闲界面时一定重绘一次
+            self.last_render_key = None
+            return True
+        if self.is_idle():
+            return False
+        self.force_redraw = False
+        self.last_render_key = self.idle_render_key()
+        return True
+    
+    def record_telemetry(self, frame_start, update_start, draw_start, draw_end):
+        """每帧记一次：事件、更新、绘制各自的耗时，以及当前的实体数量"""
+        telemetry.observe("frame.events_ms", (update_start - frame_start) * 1000)
+        telemetry.observe("frame.update_ms", (draw_start - update_start) * 1000)
+        if draw_end > draw_start:
+            telemetry.observe("frame.draw_ms", (draw_end - draw_start) * 1000)
+        telemetry.observe("frame.total_ms", (draw_end - frame_start) * 1000)
+        self.record_gauges()
+    
+    def record_gauges(self):
+        """当前的状态、实体数量等"""
+        telemetry.gauge("state", self.state)
+        telemetry.gauge("entities.enemies", len(self.enemies))
+        telemetry.gauge("entities.bullets", len(self.projectiles))
+        telemetry.gauge("entities.particles", int((self.particles.life > 0).sum()) if self.particles is not None else 0)
+        telemetry.gauge("panel.redraws", self.backpack_panel.redraws + self.container_panel.redraws)
+        telemetry.gauge("text_cache.hits", self.text_hits)
+        telemetry.gauge("text_cache.misses", self.text_misses)
+        telemetry.gauge("text_cache.size", len(self.text_cache))
+    
+    def run(self):
+        if SIM_THREAD:
+            self.run_threaded()
+        else:
+            self.run_serial()
+        
+        # 游戏循环结束后保存哈弗币
+        save_havoc_coins(self.havoc_coins, self.stash)
+        sounds.close()
+        telemetry.close()
+        pygame.quit()
+    
+    def run_serial(self):
+        """单线程：每帧依次处理事件、推进模拟、绘制"""
+        running = True
+        while running:
+            if self.is_idle():
+                # 菜单/结算界面没有输入就阻塞等待，省电
+                events = self.wait_events(IDLE_WAIT_TIMEOUT)
+            else:
+                events = pygame.event.get()
+            frame_start = time.perf_counter()
+            running = self.handle_events(events)
+            update_start = time.perf_counter()
+            self.update()
+            self.tick_input.clear()
+            draw_start = draw_end = time.perf_counter()
+            if self.should_draw():
+                self.draw()
+                draw_end = time.perf_counter()
+            if telemetry.enabled:
+                self.record_telemetry(frame_start, update_start, draw_start, draw_end)
+            if not startup_profiler.reported:
+                startup_profiler.mark("首帧")
+                startup_profiler.report()
+            if self.window_focused and self.window_visible:
+                clock.tick(TICK_RATE)
+            else:
+                clock.tick(BACKGROUND_FPS)
+    
+    def simulate(self):
+        """模拟线程：按TICK_RATE固定步长推进，局内每一帧都抄成快照发布出去"""
+        next_tick = time.perf_counter()
+        while self.sim_running:
+            tick_start = time.perf_counter()
+            with self.sim_lock:
+                # 输入由主线程采样后锁存在tick_input里，模拟线程不碰SDL；
+                # 主线程没来得及重新采样时沿用上一次的移动和瞄准
+                self.update(self.tick_input)
+                self.tick_input.clear_presses()
+                if self.state in (GameState.PLAYING, GameState.EXTRACTING):
+                    self.snapshots.back.capture(self)
+                    self.snapshots.publish()
+            tick_end = time.perf_counter()
+            if telemetry.enabled:
+                telemetry.observe("sim.update_ms", (tick_end - tick_start) * 1000)
+                telemetry.observe("sim.late_ms", max(0, tick_start - next_tick) * 1000)
+            # 失去焦点或切到后台时和单线程模式一样降频
+            rate = TICK_RATE if self.window_focused and self.window_visible else BACKGROUND_FPS
+            next_tick += 1 / rate
+            delay = next_tick - tick_end
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -SIM_MAX_LAG_TICKS / rate:
+                next_tick = tick_end
+    
+    def run_threaded(self):
+        """模拟放到后台线程，主线程处理事件、画最新的快照。
+        
+        菜单和结算界面照旧在锁里直接画，这时模拟没什么事做；局内只画快照，
+        画得再慢也不会拖住模拟，模拟忙的时候画面也只是少画几帧。
+        """
+        # 默认5毫秒才切一次线程，模拟线程到点后可能要等主线程画完这么久，调小一点
+        sys.setswitchinterval(0.001)
+        self.sim_running = True
+        simulation = threading.Thread(target=self.simulate, daemon=True)
+        simulation.start()
+        running = True
+        while running:
+            with self.sim_lock:
+                idle = self.is_idle()
+            if idle:
+                events = self.wait_events(IDLE_WAIT_TIMEOUT)
+            else:
+                events = pygame.event.get()
+            frame_start = time.perf_counter()
+            with self.sim_lock:
+                running = self.handle_events(events)
+                in_raid = self.state in (GameState.PLAYING, GameState.EXTRACTING)
+                if in_raid:
+                    # 输入只在主线程采样，锁存给模拟线程
+                    self.collect_input()
+                    # 回到空闲界面时一定重绘一次
+                    self.last_render_key = None
+                elif self.should_draw():
+                    self.draw()
+                raid_start = self.raid_start
+                if telemetry.enabled:
+                    self.record_gauges()
+            draw_start = draw_end = time.perf_counter()
+            if in_raid and self.window_visible:
+                view = self.snapshots.latest()
+                if view is None and self.force_redraw:
+                    view = self.snapshots.front
+                # 刚开局、模拟还没抄出这一局的快照时先不画
+                if view is not None and view.raid_start == raid_start:
+                    self.force_redraw = False
+                    self.draw(view)
+                    draw_end = time.perf_counter()
+            if telemetry.enabled:
+                telemetry.observe("frame.events_ms", (draw_start - frame_start) * 1000)
+                if draw_end > draw_start:
+                    telemetry.observe("frame.draw_ms", (draw_end - draw_start) * 1000)
+            if not startup_profiler.reported:
+                startup_profiler.mark("首帧")
+                startup_profiler.report()
+            if self.window_focused and self.window_visible:
+                clock.tick(TICK_RATE)
+            else:
+                clock.tick(BACKGROUND_FPS)
+        
+        self.sim_running = False
+        simulation.join()
+
+# 局域网联机。服务器是权威的：客户端只发输入，世界状态都以服务器为准
+COOP_PORT = 47820
+# 每几个模拟帧给客户端发一次快照（60帧时每秒20次）
+COOP_SNAPSHOT_INTERVAL = 3
+# 一个快照包最多多少字节，留在常见MTU以内；每个客户端的带宽上限就是它乘以快照频率
+COOP_PACKET_BUDGET = 1200
+# 客户端这么久没发包就当它掉线了（秒）
+COOP_TIMEOUT = 5.0
+# 最多几个玩家，满了再来的加入请求直接忽略（每个玩家都要占内存、每帧都要给他打包快照）
+COOP_MAX_PLAYERS = 8
+COOP_RESPAWN_TIME = 3.0
+COOP_ENEMY_SPAWN_INTERVAL = 2.0
+
+MSG_JOIN = 1
+MSG_INPUT = 2
+MSG_SNAPSHOT = 3
+
+# 快照里的实体类别，数值越小发送优先级越高
+ENT_PLAYER = 1
+ENT_BULLET = 2
+ENT_ENEMY = 3
+ENT_REMOVE = 4
+
+# 输入包：类型、输入序号、确认收到的最新快照帧、移动x、移动y、瞄准角（毫弧度）、开火、换弹、换枪（-1不换）
+INPUT_FORMAT = struct.Struct("<BIIbbhbbb")
+# 快照包头：类型、帧号、你的玩家编号、处理到的你的输入序号、记录数
+SNAPSHOT_HEADER = struct.Struct("<BIHIH")
+# 类别、编号、x、y、朝向（毫弧度）、生命、弹药
+PLAYER_RECORD = struct.Struct("<BHhhhBB")
+# 类别、编号、x、y、生命
+ENEMY_RECORD = struct.Struct("<BHhhB")
+# 类别、编号、出生点x、出生点y、每帧速度x/y（×100）、发射方、出生帧。子弹匀速飞行，发一次就够
+BULLET_RECORD = struct.Struct("<BHhhhhBI")
+# 类别、被删实体的类别、编号
+REMOVE_RECORD = struct.Struct("<BBH")
+
+def clamp16(value):
+    return max(-32768, min(32767, int(value)))
+
+class CoopPeer:
+    """服务器这边记录的一个客户端"""
+    def __init__(self, addr, player_id, projectiles):
+        self.addr = addr
+        self.player_id = player_id
+        self.player = Player(projectiles)
+        self.input = TickInput()
+        self.input_seq = 0  # 已经用上的最新输入序号
+        self.last_heard = game_clock.time()
+        self.died_at = 0
+        self.acked = {}  # 客户端确认收到的各实体记录，增量以它为基准
+        self.sent = {}  # 快照帧号 -> 这个快照里发出的(键, 记录)，记录为None表示删除
+        self.last_sent = {}  # 键 -> 上次发给它的帧号
+        self.bytes_sent = 0
+
+class CoopServer:
+    """联机权威服务器，可以单独一个进程跑。
+    
+    客户端每帧用UDP发来输入，服务器按TICK_RATE推进世界，每COOP_SNAPSHOT_INTERVAL帧
+    给每个客户端发一个二进制快照。快照只带和该客户端已确认状态不同的实体，最久没更新
+    的优先，塞满COOP_PACKET_BUDGET字节为止，所以每个客户端的带宽和敌人、子弹数量无关。
+    """
+    def __init__(self, port=COOP_PORT, host="0.0.0.0", enemy_count=5):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        
+        level = RaidLevel(0, 0)
+        self.containers = level.containers
+        self.enemies = level.enemies
+        self.enemy_count = enemy_count
+        self.last_enemy_spawn = 0
+        self.projectiles = Projectiles()
+        self.occupancy = OccupancyGrid()
+        self.sight = LineOfSight(self.occupancy)
+        self.occupancy.reset(screen_width, screen_height)
+        for rect in wall_rects() + [container.rect for container in self.containers]:
+            self.occupancy.fill_rect(rect)
+        self.obstacle_boxes = obstacle_boxes(self.containers)
+        
+        self.peers = {}  # 地址 -> CoopPeer
+        self.next_player_id = 1
+        self.tick = 0
+        self.bullets = {}  # 子弹槽位 -> (编号, 打包好的出生记录)
+        self.bullet_serial = 0
+        self.bullet_head = 0
+        # 统计
+        self.tick_ms = []
+        self.net_ms = []  # 发快照（整理状态、求增量、打包发送）的耗时
+        self.entity_total = 0
+        self.bullet_total = 0
+    
+    def receive(self, now):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(512)
+            except BlockingIOError:
+                return
+            except ConnectionResetError:
+                # Windows上给已关闭的端口发过包，下一次收包会报这个错
+                continue
+            if not data:
+                continue
+            peer = self.peers.get(addr)
+            if data[0] == MSG_JOIN:
+                if peer is None:
+                    if len(self.peers) >= COOP_MAX_PLAYERS:
+                        continue
+                    peer = CoopPeer(addr, self.next_player_id, self.projectiles)
+                    self.next_player_id += 1
+                    self.peers[addr] = peer
+                    print(f"玩家{peer.player_id}加入: {addr[0]}:{addr[1]}")
+                peer.last_heard = now
+            elif data[0] == MSG_INPUT and peer is not None and len(data) == INPUT_FORMAT.size:
+                _, seq, ack, move_x, move_y, aim, fire, reload, weapon = INPUT_FORMAT.unpack(data)
+                peer.last_heard = now
+                self.acknowledge(peer, ack)
+                if seq <= peer.input_seq:
+                    continue  # 迟到的旧输入
+                peer.input_seq = seq
+                tick_input = peer.input
+                tick_input.move_x = max(-1, min(1, move_x))
+                tick_input.move_y = max(-1, min(1, move_y))
+                tick_input.aim_angle = aim / 1000
+                tick_input.fire = bool(fire)
+                # 换弹、换枪是一次性的，留到用掉为止
+                tick_input.reload = tick_input.reload or bool(reload)
+                if 0 <= weapon < len(WEAPON_ORDER):
+                    tick_input.weapon = weapon
+    
+    def acknowledge(self, peer, tick):
+        """客户端确认收到了第tick帧的快照，把那次发出的记录并入它的已确认状态"""
+        records = peer.sent.pop(tick, None)
+        if records is None:
+            return
+        for key, record in records:
+            if record is None:
+                peer.acked.pop(key, None)
+            else:
+                peer.acked[key] = record
+        # 更早的快照客户端已经不会再用了（它只处理比手上新的快照）
+        for old in [t for t in peer.sent if t < tick]:
+            del peer.sent[old]
+    
+    def step(self):
+        """推进一帧，返回这一帧的耗时（毫秒）"""
+        start = time.perf_counter()
+        now = game_clock.time()
+        self.tick += 1
+        self.receive(now)
+        self.update_players(now)
+        peers = self.alive_peers()
+        players = [peer.player for peer in peers]
+        move_enemies(self, players, now)
+        self.track_bullets()
+        _, killed = update_projectiles(self, players, now)
+        for k in killed:
+            peers[k].died_at = now
+        # 和单人一样按波刷怪，只是一波补到enemy_count为止
+        spawn_enemy_wave(self, now, COOP_ENEMY_SPAWN_INTERVAL, self.enemy_count, self.enemy_count)
+        
+        if self.tick % COOP_SNAPSHOT_INTERVAL == 0:
+            net_start = time.perf_counter()
+            state = self.world_state()
+            for peer in self.peers.values():
+                self.send_snapshot(peer, state)
+            self.net_ms.append((time.perf_counter() - net_start) * 1000)
+        
+        for addr in [addr for addr, peer in self.peers.items() if now - peer.last_heard > COOP_TIMEOUT]:
+            print(f"玩家{self.peers[addr].player_id}掉线")
+            del self.peers[addr]
+        
+        ms = (time.perf_counter() - start) * 1000
+        self.tick_ms.append(ms)
+        self.entity_total += len(self.enemies)
+        self.bullet_total += len(self.projectiles)
+        return ms
+    
+    def update_players(self, now):
+        for peer in self.peers.values():
+            player = peer.player
+            tick_input = peer.input
+            if player.health <= 0:
+                if now - peer.died_at >= COOP_RESPAWN_TIME:
+                    player.reset()
+                continue
+            if tick_input.weapon is not None:
+                player.equip(WEAPON_ORDER[tick_input.weapon])
+                tick_input.weapon = None
+            if tick_input.reload and not player.reloading and player.ammo < player.max_ammo:
+                player.reloading = True
+                player.reload_start = now
+            tick_input.reload = False
+            player.update(tick_input)
+            resolve_hitscan(self, player, now)
+    
+    def alive_peers(self):
+        return [peer for peer in self.peers.values() if peer.player.health > 0]
+    
+    def track_bullets(self):
+        """给这一帧新发射的子弹编号并打包出生记录，之后子弹匀速飞行，记录不再变化"""
+        projectiles = self.projectiles
+        slot = self.bullet_head
+        while slot != projectiles.head:
+            if projectiles.alive[slot]:
+                self.bullet_serial = (self.bullet_serial + 1) & 0xFFFF
+                self.bullets[slot] = (self.bullet_serial, BULLET_RECORD.pack(
+                    ENT_BULLET, self.bullet_serial,
+                    clamp16(projectiles.x[slot]), clamp16(projectiles.y[slot]),
+                    clamp16(projectiles.vx[slot] * 100), clamp16(projectiles.vy[slot] * 100),
+                    projectiles.owner[slot], self.tick))
+            slot = (slot + 1) % projectiles.capacity
+        self.bullet_head = projectiles.head
+    
+    def damage_enemy(self, row, amount):
+        health = self.enemies["health"]
+        health[row] -= amount
+        if health[row] <= 0:
+            self.enemies.remove_row(row)
+    
+    def world_state(self):
+        """当前世界每个实体的量化记录：{(类别, 编号): 打包好的bytes}。所有客户端共用一份"""
+        state = {}
+        for peer in self.peers.values():
+            player = peer.player
+            state[(ENT_PLAYER, peer.player_id)] = PLAYER_RECORD.pack(
+                ENT_PLAYER, peer.player_id, clamp16(player.x), clamp16(player.y),
+                int(math.remainder(player.facing_angle, math.tau) * 1000),
+                max(0, min(255, player.health)), max(0, min(255, player.ammo)))
+        enemies = self.enemies
+        xs, ys, health = enemies["x"], enemies["y"], enemies["health"]
+        if np is not None and len(enemies):
+            # 所有敌人的记录一次打包成一段bytes，再按记录长度切开
+            records = np.zeros(len(enemies), dtype=np.dtype(
+                [("kind", "u1"), ("id", "<u2"), ("x", "<i2"), ("y", "<i2"), ("health", "u1")]))
+            ids = np.array(enemies.ids, dtype=np.int64) & 0xFFFF
+            records["kind"] = ENT_ENEMY
+            records["id"] = ids
+            records["x"] = np.clip(np.array(xs), -32768, 32767)
+            records["y"] = np.clip(np.array(ys), -32768, 32767)
+            records["health"] = np.clip(np.array(health), 0, 255)
+            raw = records.tobytes()
+            size = ENEMY_RECORD.size
+            for row, key in enumerate(ids.tolist()):
+                state[(ENT_ENEMY, key)] = raw[row * size:(row + 1) * size]
+        else:
+            for row, entity_id in enumerate(enemies.ids):
+                key = entity_id & 0xFFFF
+                state[(ENT_ENEMY, key)] = ENEMY_RECORD.pack(
+                    ENT_ENEMY, key, clamp16(xs[row]), clamp16(ys[row]), max(0, min(255, int(health[row]))))
+        alive = self.projectiles.alive
+        for slot, (serial, record) in list(self.bullets.items()):
+            if alive[slot]:
+                state[(ENT_BULLET, serial)] = record
+            else:
+                del self.bullets[slot]
+        return state
+    
+    def send_snapshot(self, peer, state):
+        """给一个客户端发快照：只发和它已确认状态不同的实体，塞满预算为止"""
+        acked = peer.acked
+        last_sent = peer.last_sent
+        own = (ENT_PLAYER, peer.player_id)
+        removed = [key for key in acked if key not in state]
+        changed = [key for key, record in state.items() if acked.get(key) != record]
+        # 自己最优先，其次按类别（玩家、子弹、敌人），同类里最久没发过的先发。
+        # 一个包最多装得下这么多条，只挑出前面这些，不用整个排序
+        limit = COOP_PACKET_BUDGET // ENEMY_RECORD.size
+        changed = heapq.nsmallest(limit, changed, key=lambda key: (key != own, key[0], last_sent.get(key, 0)))
+        
+        parts = []
+        records = []
+        size = SNAPSHOT_HEADER.size
+        for key in removed:
+            if size + REMOVE_RECORD.size > COOP_PACKET_BUDGET:
+                break
+            parts.append(REMOVE_RECORD.pack(ENT_REMOVE, key[0], key[1]))
+            records.append((key, None))
+            last_sent.pop(key, None)
+            size += REMOVE_RECORD.size
+        for key in changed:
+            record = state[key]
+            if size + len(record) > COOP_PACKET_BUDGET:
+                break
+            parts.append(record)
+            records.append((key, record))
+            last_sent[key] = self.tick
+            size += len(record)
+        
+        packet = SNAPSHOT_HEADER.pack(MSG_SNAPSHOT, self.tick, peer.player_id, peer.input_seq, len(parts))
+        packet += b"".join(parts)
+        peer.sent[self.tick] = records
+        try:
+            self.sock.sendto(packet, peer.addr)
+        except OSError as e:
+            print(f"发送快照失败: {e}")
+            return
+        peer.bytes_sent += len(packet)
+    
+    def serve(self, seconds=None):
+        """按TICK_RATE固定帧率一直跑；seconds不为None时跑这么久就返回"""
+        interval = 1 / TICK_RATE
+        start = time.perf_counter()
+        next_tick = start
+        print(f"联机服务器已启动，端口 {self.port}")
+        while seconds is None or time.perf_counter() - start < seconds:
+            self.step()
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()  # 跟不上就不补帧了
+    
+    def stats(self):
+        ticks = sorted(self.tick_ms) or [0.0]
+        return {
+            "ticks": len(self.tick_ms),
+            "tick_ms": sum(ticks) / len(ticks),
+            "tick_p95": ticks[int(len(ticks) * 0.95)],
+            "net_ms": sum(self.net_ms) / max(1, len(self.net_ms)),
+            "enemies": self.entity_total / max(1, len(self.tick_ms)),
+            "bullets": self.bullet_total / max(1, len(self.tick_ms)),
+            "bytes_sent": [peer.bytes_sent for peer in self.peers.values()],
+        }
+
+class CoopClient:
+    """联机客户端：每帧发输入、收快照。自己的移动先在本地预测，收到快照后以服务器为准重放没确认的输入"""
+    def __init__(self, host="127.0.0.1", port=COOP_PORT):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.server = (host, port)
+        self.player = Player(Projectiles())  # 本地预测的自己，只用来算移动
+        self.player_id = None
+        self.tick = 0  # 收到的最新快照帧号
+        self.seq = 0
+        self.pending = []  # 服务器还没用上的输入：(序号, move_x, move_y, 瞄准角)
+        self.replay_input = TickInput()
+        self.players = {}  # 编号 -> (x, y, 朝向, 生命, 弹药)
+        self.enemies = {}  # 编号 -> (x, y, 生命)
+        self.bullets = {}  # 编号 -> (出生x, 出生y, vx, vy, 发射方, 出生帧)
+        # 统计
+        self.bytes_received = 0
+        self.snapshots = 0
+        self.correction_total = 0.0
+        self.correction_max = 0.0
+        self.sock.sendto(bytes([MSG_JOIN]), self.server)
+    
+    def send_input(self, tick_input):
+        if self.player_id is None:
+            # 还没收到过快照，继续请求加入
+            self.sock.sendto(bytes([MSG_JOIN]), self.server)
+            return
+        self.seq += 1
+        aim = tick_input.aim_angle if tick_input.aim_angle is not None else self.player.facing_angle
+        weapon = tick_input.weapon if tick_input.weapon is not None else -1
+        packet = INPUT_FORMAT.pack(MSG_INPUT, self.seq, self.tick, tick_input.move_x, tick_input.move_y,
+                                   int(math.remainder(aim, math.tau) * 1000),
+                                   bool(tick_input.fire), bool(tick_input.reload), weapon)
+        self.sock.sendto(packet, self.server)
+        self.pending.append((self.seq, tick_input.move_x, tick_input.move_y, aim))
+        self.player.move(tick_input)
+    
+    def receive(self):
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(COOP_PACKET_BUDGET + 64)
+            except BlockingIOError:
+                return
+            except ConnectionResetError:
+                continue
+            self.bytes_received += len(data)
+            if data and data[0] == MSG_SNAPSHOT and len(data) >= SNAPSHOT_HEADER.size:
+                self.apply_snapshot(data)
+    
+    def apply_snapshot(self, data):
+        _, tick, player_id, input_seq, count = SNAPSHOT_HEADER.unpack_from(data)
+        if tick <= self.tick:
+            return  # 乱序到达的旧快照直接丢掉；服务器收不到它的确认，会把内容重发
+        self.tick = tick
+        self.player_id = player_id
+        self.snapshots += 1
+        tables = {ENT_PLAYER: self.players, ENT_ENEMY: self.enemies, ENT_BULLET: self.bullets}
+        offset = SNAPSHOT_HEADER.size
+        for _ in range(count):
+            kind = data[offset]
+            if kind == ENT_PLAYER:
+                _, ident, x, y, angle, health, ammo = PLAYER_RECORD.unpack_from(data, offset)
+                self.players[ident] = (x, y, angle / 1000, health, ammo)
+                offset += PLAYER_RECORD.size
+            elif kind == ENT_ENEMY:
+                _, ident, x, y, health = ENEMY_RECORD.unpack_from(data, offset)
+                self.enemies[ident] = (x, y, health)
+                offset += ENEMY_RECORD.size
+            elif kind == ENT_BULLET:
+                _, ident, x, y, vx, vy, owner, born = BULLET_RECORD.unpack_from(data, offset)
+                self.bullets[ident] = (x, y, vx / 100, vy / 100, owner, born)
+                offset += BULLET_RECORD.size
+            elif kind == ENT_REMOVE:
+                _, removed, ident = REMOVE_RECORD.unpack_from(data, offset)
+                tables[removed].pop(ident, None)
+                offset += REMOVE_RECORD.size
+            else:
+                print(f"快照解析失败: 未知类别 {kind}")
+                break
+        self.reconcile(input_seq)
+    
+    def reconcile(self, input_seq):
+        """以服务器用完input_seq号输入后的位置为准，重放之后的输入"""
+        own = self.players.get(self.player_id)
+        if own is None:
+            return
+        self.pending = [entry for entry in self.pending if entry[0] > input_seq]
+        player = self.player
+        predicted_x, predicted_y = player.x, player.y
+        player.x, player.y = own[0], own[1]
+        replay = self.replay_input
+        for _, move_x, move_y, aim in self.pending:
+            replay.move_x, replay.move_y, replay.aim_angle = move_x, move_y, aim
+            player.move(replay)
+        correction = math.hypot(player.x - predicted_x, player.y - predicted_y)
+        self.correction_total += correction
+        self.correction_max = max(self.correction_max, correction)
+    
+    def bullet_positions(self):
+        """按出生记录外推出各子弹现在的位置：(x, y, 发射方)"""
+        positions = []
+        for x, y, vx, vy, owner, born in self.bullets.values():
+            steps = self.tick - born + 1
+            positions.append((x + vx * steps, y + vy * steps, owner))
+        return positions
+
+def run_coop_server(port=COOP_PORT, seconds=None, enemy_count=5, results=None):
+    """联机服务器进程的入口。results是multiprocessing.Queue时，启动后和结束后把端口、统计放进去"""
+    server = CoopServer(port, enemy_count=enemy_count)
+    if results is not None:
+        results.put(server.port)
+    server.serve(seconds)
+    if results is not None:
+        results.put(server.stats())
+
+def run_coop_loopback(client_count=2, seconds=3.0, enemy_counts=(10, 100, 400)):
+    """本机回环测试：起一个服务器进程和几个模拟客户端，按敌人数量打印服务器耗时和带宽"""
+    print(f"{client_count}个模拟客户端，每档{seconds:.0f}秒")
+    print("敌人  子弹  服务器每帧ms(平均/P95)  其中发快照ms  每客户端下行KB/s  预测修正px(平均/最大)")
+    for enemy_count in enemy_counts:
+        results = multiprocessing.Queue()
+        server = multiprocessing.Process(target=run_coop_server, args=(0, seconds + 1.0, enemy_count, results),
+                                         daemon=True)
+        server.start()
+        port = results.get(timeout=30)
+        clients = [CoopClient("127.0.0.1", port) for _ in range(client_count)]
+        bots = [TickInput() for _ in clients]
+        headings = [(0, 0)] * client_count
+        interval = 1 / TICK_RATE
+        start = time.perf_counter()
+        next_tick = start
+        while time.perf_counter() - start < seconds:
+            for k, (client, bot) in enumerate(zip(clients, bots)):
+                client.receive()
+                # 随机走动，朝最近的敌人开火
+                if random.random() < 0.05:
+                    headings[k] = (random.randint(-1, 1), random.randint(-1, 1))
+                bot.clear()
+                bot.move_x, bot.move_y = headings[k]
+                me = client.player
+                if client.enemies:
+                    x, y, _ = min(client.enemies.values(), key=lambda e: (e[0] - me.x) ** 2 + (e[1] - me.y) ** 2)
+                    bot.aim_angle = math.atan2(y - me.y, x - me.x)
+                    bot.fire = True
+                client.send_input(bot)
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        for client in clients:
+            client.receive()
+        stats = results.get(timeout=30)
+        server.join()
+        elapsed = time.perf_counter() - start
+        bandwidth = sum(client.bytes_received for client in clients) / client_count / elapsed / 1024
+        snapshots = max(1, sum(client.snapshots for client in clients))
+        correction = sum(client.correction_total for client in clients) / snapshots
+        correction_max = max(client.correction_max for client in clients)
+        print(f"{stats['enemies']:4.0f}  {stats['bullets']:4.0f}  {stats['tick_ms']:8.2f} / {stats['tick_p95']:<6.2f}"
+              f"      {stats['net_ms']:8.2f}     {bandwidth:12.1f}          {correction:.2f} / {correction_max:.1f}")
+
+# 自动对局：多进程无头跑很多局，脚本机器人代替玩家，用来调数值
+ROLLOUT_MAX_TIME = 600  # 一局最多模拟多少秒，超时算没撤出来
+BOT_FIRE_RANGE = 450  # 敌人进入这个距离、并且看得到就开火
+BOT_DANGER_RANGE = 200  # 敌人这么近时不搜容器，先打
+BOT_LOOT_DELAY = 0.5  # 每拿一件物品花的时间（秒），模拟玩家点选
+BOT_LOOT_TIME = 240  # 搜刮这么久就去撤离
+BOT_RETREAT_HEALTH = 40  # 血量低于这个就不搜了，直接撤离
+BOT_HEAL_HEALTH = 60  # 血量低于这个时先去捡医疗包
+
+def sign(value, dead_zone=4):
+    if value > dead_zone:
+        return 1
+    if value < -dead_zone:
+        return -1
+    return 0
+
+class RaidBot:
+    """自动对局用的脚本机器人：搜最近的容器，打看得到的敌人，搜完、背包满或残血就去撤离"""
+    def __init__(self, game):
+        self.game = game
+        self.start = game_clock.time()
+        self.next_loot = 0
+    
+    def nearest_enemy(self):
+        """最近的、射程内看得到的敌人，返回(x, y, 距离)，没有返回None"""
+        enemies = self.game.enemies
+        player = self.game.player
+        best = None
+        xs, ys = enemies["x"], enemies["y"]
+        visible = self.game.sight.can_see_many(xs, ys, player.x, player.y)
+        for row in range(len(enemies)):
+            dist = math.hypot(xs[row] - player.x, ys[row] - player.y)
+            if visible[row] and dist < BOT_FIRE_RANGE and (best is None or dist < best[2]):
+                best = (xs[row], ys[row], dist)
+        return best
+    
+    def should_extract(self):
+        player = self.game.player
+        return (not player.can_pickup() or player.health < BOT_RETREAT_HEALTH or
+                game_clock.time() - self.start > BOT_LOOT_TIME)
+    
+    def goal(self):
+        """这一帧要走向的位置"""
+        game = self.game
+        player = game.player
+        medkits = game.medkits
+        if player.health < BOT_HEAL_HEALTH and len(medkits):
+            return medkits["x"][0], medkits["y"][0]
+        if not self.should_extract():
+            looted = [c for c in game.containers if c.items]
+            if looted:
+                target = min(looted, key=lambda c: (c.x - player.x) ** 2 + (c.y - player.y) ** 2)
+                return target.x, target.y
+        return game.extract_zone.center
+    
+    def loot(self, tick_input, enemy):
+        """站在容器上时开箱、逐件拿东西，拿完或者有敌人贴脸就关上。返回是否还在搜"""
+        game = self.game
+        container = game.container_open
+        if container is None or self.should_extract():
+            if container is not None and container.is_open:
+                tick_input.interact = True
+            return False
+        threatened = enemy is not None and enemy[2] < BOT_DANGER_RANGE
+        busy = bool(container.items) and game.player.can_pickup() and not threatened
+        if container.is_open != busy:
+            tick_input.interact = True
+            self.next_loot = game_clock.time() + BOT_LOOT_DELAY
+        elif busy and game_clock.time() >= self.next_loot:
+            game.take_from_container(0)
+            self.next_loot = game_clock.time() + BOT_LOOT_DELAY
+        return busy
+    
+    def decide(self, tick_input):
+        """按当前局面填好这一帧的操作"""
+        player = self.game.player
+        tick_input.clear()
+        enemy = self.nearest_enemy()
+        if enemy is not None:
+            tick_input.aim_angle = math.atan2(enemy[1] - player.y, enemy[0] - player.x)
+            tick_input.fire = True
+        if player.ammo == 0 and not player.reloading:
+            tick_input.reload = True
+        if self.loot(tick_input, enemy):
+            return
+        goal_x, goal_y = self.goal()
+        tick_input.move_x = sign(goal_x - player.x)
+        tick_input.move_y = sign(goal_y - player.y)
+
+def boot_headless():
+    """无界面初始化（自动对局用）：虚拟显示驱动、内置字体、不显示启动画面"""
+    global screen, clock, font, large_font
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    # SDL默认把SIGTERM转成退出事件，无头进程没人处理事件，进程池就结束不了它
+    os.environ["SDL_NO_SIGNAL_HANDLERS"] = "1"
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((screen_width, screen_height))
+    clock = pygame.time.Clock()
+    font = pygame.font.Font(None, 24)
+    large_font = pygame.font.Font(None, 36)
+
+def apply_balance(settings):
+    """把调参覆盖到本进程的全局配置：enemy_spawn_interval、enemy_damage、item_values"""
+    global ENEMY_SPAWN_INTERVAL, ENEMY_DAMAGE
+    ENEMY_SPAWN_INTERVAL = settings.get("enemy_spawn_interval", ENEMY_SPAWN_INTERVAL)
+    ENEMY_DAMAGE = settings.get("enemy_damage", ENEMY_DAMAGE)
+    ITEM_VALUES.update(settings.get("item_values", {}))
+
+rollout_game = None  # 每个子进程复用一个Game
+
+def init_rollout_worker(settings):
+    global rollout_game
+    boot_headless()
+    apply_balance(settings)
+    game_clock.simulate(time.time())
+    rollout_game = Game(autosave=False)
+
+def run_rollout(seed):
+    """用模拟时钟无头跑一局，返回(结局, 用时秒, 带出价值)"""
+    game = rollout_game
+    random.seed(seed)
+    game.start_raid()
+    game.particles = None  # 纯画面效果，无头对局不需要
+    bot = RaidBot(game)
+    tick_input = TickInput()
+    start = game_clock.time()
+    step = 1 / TICK_RATE
+    while (game.state in (GameState.PLAYING, GameState.EXTRACTING) and
+           game_clock.time() - start < ROLLOUT_MAX_TIME):
+        bot.decide(tick_input)
+        game.update(tick_input)
+        game_clock.advance(step)
+    return game.state, game_clock.time() - start, game.extracted_value
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def distribution(values):
+    """平均值和P10/P50/P90，没有数据返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return (sum(ordered) / len(ordered), percentile(ordered, 0.1), percentile(ordered, 0.5),
+            percentile(ordered, 0.9))
+
+def run_rollouts(raids=200, workers=None, settings=None):
+    """在进程池里跑raids局，打印汇总报告并返回每局结果。每局的随机种子就是局号，结果可复现"""
+    workers = workers or os.cpu_count() or 1
+    settings = settings or {}
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(workers, initializer=init_rollout_worker, initargs=(settings,))
+    try:
+        results = pool.map(run_rollout, range(raids), chunksize=max(1, raids // (workers * 4)))
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.perf_counter() - start
+    
+    extracted = [r for r in results if r[0] == GameState.SUCCESS]
+    deaths = sum(1 for r in results if r[0] == GameState.DEAD)
+    simulated = sum(r[1] for r in results)
+    print(f"{raids}局，{workers}个进程，用时{elapsed:.1f}秒（模拟时间是真实时间的{simulated / elapsed:.0f}倍）")
+    if settings:
+        print(f"调参: {settings}")
+    print(f"撤离成功 {len(extracted) / raids:.1%} | 阵亡 {deaths / raids:.1%} | "
+          f"超时 {(raids - len(extracted) - deaths) / raids:.1%}")
+    for label, values in (("撤离用时(秒)", [r[1] for r in extracted]),
+                          ("带出价值", [r[2] for r in extracted]),
+                          ("每局期望价值", [r[2] for r in results])):
+        stats = distribution(values)
+        if stats is None:
+            print(f"{label}: 无数据")
+        else:
+            print(f"{label}: 平均 {stats[0]:,.0f} | P10 {stats[1]:,.0f} | P50 {stats[2]:,.0f} | P90 {stats[3]:,.0f}")
+    return results
+
+def parse_rollout_args(args):
+    """--rollouts [局数] [key=value ...]，workers=进程数，item_values.物品名=价值"""
+    raids, workers, settings = 200, None, {}
+    for arg in args:
+        if "=" not in arg:
+            raids = int(arg)
+            continue
+        key, value = arg.split("=", 1)
+        if key == "workers":
+            workers = int(value)
+        elif key.startswith("item_values."):
+            settings.setdefault("item_values", {})[key.split(".", 1)[1]] = int(value)
+        else:
+            settings[key] = float(value)
+    return raids, workers, settings
+
+# 批量对局：几百局同步推进（lockstep），状态都放在按局堆叠的NumPy数组里，给AI对手训练和测试用
+VEC_MAX_ENEMIES = 32  # 每局同时存在的敌人上限，满了这一波就少刷几个
+VEC_MAX_BULLETS = 64  # 每局子弹环形缓冲区的大小
+VEC_OBS_ENEMIES = 4  # 观测里带最近的几个敌人
+VEC_OBS_SIZE = 13 + 3 * VEC_OBS_ENEMIES
+VEC_MAX_TIME = 600  # 一局最多多少秒，到了就截断
+VEC_VALUE_SCALE = 100000  # 奖励里物资价值的单位
+VEC_EXTRACT_BONUS = 1.0
+VEC_DEATH_PENALTY = 1.0  # 阵亡时另外扣掉本局搜到的全部价值
+
+class VecRaids:
+    """N局同步推进的批量对局，规则照搬Game.update，但所有局一起按数组运算。
+    
+    动作是(N, 5)的数组：移动x、移动y（-1~1）、瞄准角、开火(>0.5)、搜刮(>0.5)。
+    step返回(观测, 奖励, 结束, 信息)，结束的局由调用方用reset(mask)重开。
+    比单局简化了：只用步枪，弹匣打空自动换弹，没有医疗包，视线只看容器挡没挡。
+    """
+    def __init__(self, env_count, seed=None):
+        if np is None:
+            raise RuntimeError("批量对局需要NumPy")
+        self.n = n = env_count
+        e, b = VEC_MAX_ENEMIES, VEC_MAX_BULLETS
+        self.rng = np.random.default_rng(seed)
+        self.container_x = np.array([pos[0] for _, pos in CONTAINER_LAYOUT], dtype=float)
+        self.container_y = np.array([pos[1] for _, pos in CONTAINER_LAYOUT], dtype=float)
+        self.obstacles = [pos for _, pos in CONTAINER_LAYOUT]
+        left, top, width, height = EXTRACT_ZONE
+        self.zone = (left, top, left + width, top + height)
+        self.weapon = WEAPONS[WEAPON_ORDER[0]]
+        self.fire_ticks = max(1, round(TICK_RATE / self.weapon["fire_rate"]))
+        self.reload_ticks = round(self.weapon["reload_time"] * TICK_RATE)
+        
+        # 玩家，每局一个
+        self.tick = np.zeros(n, dtype=np.int64)
+        self.px = np.zeros(n)
+        self.py = np.zeros(n)
+        self.health = np.zeros(n)
+        self.ammo = np.zeros(n, dtype=np.int64)
+        self.reload_left = np.zeros(n, dtype=np.int64)  # 换弹还剩几个tick
+        self.shot_ready = np.zeros(n, dtype=np.int64)  # 到这个tick才能再开枪
+        self.hurt_ready = np.zeros(n, dtype=np.int64)  # 受伤冷却
+        self.loot_ready = np.zeros(n, dtype=np.int64)
+        self.carried = np.zeros(n, dtype=np.int64)  # 背包里的物品数
+        self.value = np.zeros(n)  # 本局搜到的物资价值
+        self.in_zone = np.zeros(n, dtype=np.int64)  # 连续站在撤离点的tick数
+        self.next_wave = np.zeros(n, dtype=np.int64)
+        self.kills = np.zeros(n, dtype=np.int64)
+        
+        # 敌人，每局固定VEC_MAX_ENEMIES个槽位
+        self.ex = np.zeros((n, e))
+        self.ey = np.zeros((n, e))
+        self.ehealth = np.zeros((n, e))
+        self.eflank = np.zeros((n, e))
+        self.eattack = np.zeros((n, e), dtype=np.int64)  # 到这个tick才能再开火
+        self.ealive = np.zeros((n, e), dtype=bool)
+        
+        # 子弹，每局一个环形缓冲区，满了覆盖最老的
+        self.bx = np.zeros((n, b))
+        self.by = np.zeros((n, b))
+        self.bvx = np.zeros((n, b))
+        self.bvy = np.zeros((n, b))
+        self.bdamage = np.zeros((n, b))
+        self.bexpire = np.zeros((n, b), dtype=np.int64)
+        self.bmine = np.zeros((n, b), dtype=bool)
+        self.balive = np.zeros((n, b), dtype=bool)
+        self.bhead = np.zeros(n, dtype=np.int64)
+        
+        # 容器里的物品价值，每个容器只有前loot_count格有效
+        self.loot = np.zeros((n, len(CONTAINER_LAYOUT), CONTAINER_MAX_ITEMS))
+        self.loot_count = np.zeros((n, len(CONTAINER_LAYOUT)), dtype=np.int64)
+        self.reset()
+    
+    def reset(self, mask=None):
+        """重开mask为True的那些局（默认全部），返回所有局的观测"""
+        mask = np.ones(self.n, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        if mask.any():
+            self.tick[mask] = 0
+            self.px[mask] = screen_width // 2
+            self.py[mask] = screen_height // 2
+            self.health[mask] = 100
+            self.ammo[mask] = self.weapon["magazine"]
+            for column in (self.reload_left, self.shot_ready, self.hurt_ready, self.loot_ready,
+                           self.carried, self.value, self.in_zone, self.kills, self.bhead):
+                column[mask] = 0
+            self.next_wave[mask] = round(ENEMY_SPAWN_INTERVAL * TICK_RATE)
+            self.ealive[mask] = False
+            self.balive[mask] = False
+            self.spawn_enemies(mask, 5)
+            self.fill_containers(mask)
+        return self.observe()
+    
+    def fill_containers(self, mask):
+        """按Container.generate_items的权重和概率给这些局的容器装物资"""
+        rng = self.rng
+        shape = (int(mask.sum()), len(CONTAINER_LAYOUT))
+        names = list(COMMON_ITEM_WEIGHTS)
+        weights = np.array([COMMON_ITEM_WEIGHTS[name] for name in names], dtype=float)
+        values = np.array([ITEM_VALUES[name] for name in names], dtype=float)
+        loot = values[rng.choice(len(names), size=shape + (CONTAINER_MAX_ITEMS,), p=weights / weights.sum())]
+        # 稀有物品每局最多各出一个，放在容器底下的格子里
+        for slot, (name, chance) in enumerate(RARE_ITEM_CHANCES.items()):
+            roll = rng.random(shape) < chance
+            first = roll & (np.cumsum(roll, axis=1) == 1)
+            loot[..., slot] = np.where(first, ITEM_VALUES[name], loot[..., slot])
+        self.loot[mask] = loot
+        self.loot_count[mask] = rng.integers(3, CONTAINER_MAX_ITEMS + 1, size=shape)
+    
+    def spawn_enemies(self, mask, count):
+        """mask里的每局在屏幕外四边各刷最多count个敌人（受槽位上限限制）"""
+        free = ~self.ealive & mask[:, None]
+        new = free & (np.cumsum(free, axis=1) <= count)
+        total = int(new.sum())
+        if not total:
+            return
+        rng = self.rng
+        side = rng.integers(0, 4, total)
+        along_x = rng.uniform(100, screen_width - 100, total)
+        along_y = rng.uniform(100, screen_height - 100, total)
+        self.ex[new] = np.select([side == 0, side == 1, side == 2], [along_x, screen_width + 50, along_x], -50)
+        self.ey[new] = np.select([side == 0, side == 1, side == 2], [-50, along_y, screen_height + 50], along_y)
+        self.ehealth[new] = 100
+        self.eflank[new] = rng.choice((-1.0, 1.0), total)
+        self.eattack[new] = 0
+        self.ealive[new] = True
+    
+    def spawn_bullets(self, shooters, x, y, angle, speed, damage, mine):
+        """shooters是(N, K)的布尔矩阵，一局同一tick可以打出好几颗；x、y、angle和它同形状或可广播"""
+        env, col = np.nonzero(shooters)
+        if not len(env):
+            return
+        rank = np.cumsum(shooters, axis=1) - 1
+        slot = (self.bhead[env] + rank[env, col]) % VEC_MAX_BULLETS
+        angle = np.broadcast_to(angle, shooters.shape)[env, col]
+        self.bx[env, slot] = np.broadcast_to(x, shooters.shape)[env, col]
+        self.by[env, slot] = np.broadcast_to(y, shooters.shape)[env, col]
+        self.bvx[env, slot] = np.cos(angle) * speed * TICK_SCALE
+        self.bvy[env, slot] = np.sin(angle) * speed * TICK_SCALE
+        self.bdamage[env, slot] = damage
+        self.bexpire[env, slot] = self.tick[env] + round(PROJECTILE_TTL * TICK_RATE)
+        self.bmine[env, slot] = mine
+        self.balive[env, slot] = True
+        self.bhead = (self.bhead + shooters.sum(axis=1)) % VEC_MAX_BULLETS
+    
+    def line_of_sight(self, x0, y0, x1, y1):
+        """线段有没有被任何一个容器挡住，参数是同形状的数组"""
+        clear = np.ones(np.shape(x0), dtype=bool)
+        for cx, cy in self.obstacles:
+            t = segment_box_t_np(x0, y0, x1, y1, cx - 25, cy - 25, cx + 25, cy + 25)
+            clear &= ~np.isfinite(t)
+        return clear
+    
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=float)
+        move_x = np.clip(actions[:, 0], -1, 1)
+        move_y = np.clip(actions[:, 1], -1, 1)
+        aim = actions[:, 2]
+        fire = actions[:, 3] > 0.5
+        loot = actions[:, 4] > 0.5
+        tick = self.tick
+        envs = np.arange(self.n)
+        reward = np.zeros(self.n)
+        
+        # 玩家移动，挡在空气墙以内
+        wall_padding = 50
+        np.clip(self.px + move_x * PLAYER_SPEED * TICK_SCALE, wall_padding, screen_width - wall_padding, out=self.px)
+        np.clip(self.py + move_y * PLAYER_SPEED * TICK_SCALE, wall_padding, screen_height - wall_padding, out=self.py)
+        
+        # 搜刮：站在有东西的容器上，每隔一段时间拿一件；搜的时候不能开枪（和开着背包一样）
+        reach = (PLAYER_SIZE + 50) / 2
+        touching = ((np.abs(self.px[:, None] - self.container_x) < reach) &
+                    (np.abs(self.py[:, None] - self.container_y) < reach) & (self.loot_count > 0))
+        looting = loot & touching.any(axis=1) & (self.carried < INVENTORY_SIZE)
+        take = looting & (tick >= self.loot_ready)
+        if take.any():
+            env = envs[take]
+            box = touching[take].argmax(axis=1)
+            top = self.loot_count[env, box] - 1
+            gained = self.loot[env, box, top]
+            self.loot_count[env, box] = top
+            self.carried[env] += 1
+            self.value[env] += gained
+            reward[env] += gained / VEC_VALUE_SCALE
+            self.loot_ready[env] = tick[env] + round(BOT_LOOT_DELAY * TICK_RATE)
+        
+        # 换弹和开火
+        reloading = self.reload_left > 0
+        self.reload_left[reloading] -= 1
+        self.ammo[reloading & (self.reload_left == 0)] = self.weapon["magazine"]
+        shoot = fire & ~looting & (self.ammo > 0) & (self.reload_left == 0) & (tick >= self.shot_ready)
+        if shoot.any():
+            self.spawn_bullets(shoot[:, None], self.px[:, None], self.py[:, None], aim[:, None],
+                               self.weapon["speed"], self.weapon["damage"], True)
+            self.ammo[shoot] -= 1
+            self.shot_ready[shoot] = tick[shoot] + self.fire_ticks
+        self.reload_left[(self.ammo == 0) & (self.reload_left == 0)] = self.reload_ticks
+        
+        # 敌人移动：所有局的敌人摊平后一次算转向，按局号分组，不同局的敌人互不推挤
+        alive = self.ealive
+        env_of = np.nonzero(alive)[0]
+        if len(env_of):
+            xs, ys = self.ex[alive], self.ey[alive]
+            dir_x, dir_y = enemy_steering_np(xs, ys, self.eflank[alive], self.px[env_of], self.py[env_of],
+                                             self.obstacles, group=env_of)
+            self.ex[alive] = xs + dir_x * ENEMY_SPEED * TICK_SCALE
+            self.ey[alive] = ys + dir_y * ENEMY_SPEED * TICK_SCALE
+        
+        # 敌人开火：射程内、冷却好了并且看得到玩家（和move_enemies一样）
+        dx = self.px[:, None] - self.ex
+        dy = self.py[:, None] - self.ey
+        ready = alive & (np.hypot(dx, dy) < 300) & (tick[:, None] >= self.eattack)
+        if ready.any():
+            player_x = np.broadcast_to(self.px[:, None], ready.shape)[ready]
+            player_y = np.broadcast_to(self.py[:, None], ready.shape)[ready]
+            shooters = ready.copy()
+            shooters[ready] = self.line_of_sight(self.ex[ready], self.ey[ready], player_x, player_y)
+            self.spawn_bullets(shooters, self.ex, self.ey, np.arctan2(dy, dx), 10, ENEMY_DAMAGE, False)
+            self.eattack[shooters] = tick[np.nonzero(shooters)[0]] + TICK_RATE
+        
+        # 子弹：按这一步的线段做碰撞，和sweep_projectiles一样
+        live = self.balive
+        x0, y0 = self.bx.copy(), self.by.copy()
+        self.bx += self.bvx
+        self.by += self.bvy
+        x1, y1 = self.bx, self.by
+        # 大部分槽位是空的，只拿活着的玩家子弹去和它所在那局的敌人槽位比
+        bullet_env, bullet_slot = np.nonzero(live & self.bmine)
+        if len(bullet_env) and alive.any():
+            t = segment_circle_t_np(x0[bullet_env, bullet_slot, None], y0[bullet_env, bullet_slot, None],
+                                    x1[bullet_env, bullet_slot, None], y1[bullet_env, bullet_slot, None],
+                                    self.ex[bullet_env], self.ey[bullet_env], ENEMY_HIT_RADIUS)
+            t = np.where(alive[bullet_env], t, np.inf)
+            first = t.argmin(axis=1)
+            hit = np.isfinite(t[np.arange(len(first)), first])
+            hit_env, hit_slot = bullet_env[hit], bullet_slot[hit]
+            np.add.at(self.ehealth, (hit_env, first[hit]), -self.bdamage[hit_env, hit_slot])
+            live[hit_env, hit_slot] = False
+            killed = alive & (self.ehealth <= 0)
+            alive &= ~killed
+            self.kills += killed.sum(axis=1)
+        bullet_env, bullet_slot = np.nonzero(live & ~self.bmine)
+        if len(bullet_env):
+            half = PLAYER_SIZE / 2
+            player_x, player_y = self.px[bullet_env], self.py[bullet_env]
+            t = segment_box_t_np(x0[bullet_env, bullet_slot], y0[bullet_env, bullet_slot],
+                                 x1[bullet_env, bullet_slot], y1[bullet_env, bullet_slot],
+                                 player_x - half, player_y - half, player_x + half, player_y + half)
+            hit = np.zeros_like(live)
+            hit[bullet_env, bullet_slot] = np.isfinite(t)
+            live &= ~hit
+            # 受伤冷却内只吃一发
+            struck = hit.any(axis=1) & (tick >= self.hurt_ready)
+            damage = np.floor(np.where(hit, self.bdamage, 0).max(axis=1))
+            self.health[struck] -= damage[struck]
+            self.hurt_ready[struck] = tick[struck] + TICK_RATE
+            reward[struck] -= damage[struck] / 100
+        live &= ((tick[:, None] < self.bexpire) & (x1 >= 0) & (x1 <= screen_width) &
+                 (y1 >= 0) & (y1 <= screen_height))
+        
+        # 定时刷一波敌人
+        wave = tick >= self.next_wave
+        if wave.any():
+            self.spawn_enemies(wave, 5)
+            self.next_wave[wave] = tick[wave] + round(ENEMY_SPAWN_INTERVAL * TICK_RATE)
+        
+        # 撤离和阵亡
+        left, top, right, bottom = self.zone
+        half = PLAYER_SIZE / 2
+        inside = ((self.px + half > left) & (self.px - half < right) &
+                  (self.py + half > top) & (self.py - half < bottom))
+        self.in_zone = np.where(inside, self.in_zone + 1, 0)
+        extracted = self.in_zone >= EXTRACTION_TIME * TICK_RATE
+        dead = (self.health <= 0) & ~extracted
+        reward[extracted] += VEC_EXTRACT_BONUS
+        reward[dead] -= VEC_DEATH_PENALTY + self.value[dead] / VEC_VALUE_SCALE
+        self.tick += 1
+        done = extracted | dead | (self.tick >= VEC_MAX_TIME * TICK_RATE)
+        info = {"extracted": extracted, "dead": dead, "value": self.value.copy(),
+                "time": self.tick / TICK_RATE}
+        return self.observe(), reward, done, info
+    
+    def observe(self):
+        """每局一行观测(float32)：自身状态、撤离点、最近的有货容器、最近几个敌人（都是相对位置，按屏幕归一化）"""
+        obs = np.zeros((self.n, VEC_OBS_SIZE), dtype=np.float32)
+        w, h = screen_width, screen_height
+        left, top, right, bottom = self.zone
+        obs[:, 0] = self.px / w
+        obs[:, 1] = self.py / h
+        obs[:, 2] = self.health / 100
+        obs[:, 3] = self.ammo / self.weapon["magazine"]
+        obs[:, 4] = self.reload_left > 0
+        obs[:, 5] = self.carried / INVENTORY_SIZE
+        obs[:, 6] = self.value / VEC_VALUE_SCALE
+        obs[:, 7] = self.in_zone / (EXTRACTION_TIME * TICK_RATE)
+        obs[:, 8] = ((left + right) / 2 - self.px) / w
+        obs[:, 9] = ((top + bottom) / 2 - self.py) / h
+        
+        cdx = self.container_x - self.px[:, None]
+        cdy = self.container_y - self.py[:, None]
+        dist = np.where(self.loot_count > 0, np.hypot(cdx, cdy), np.inf)
+        nearest = dist.argmin(axis=1)
+        envs = np.arange(self.n)
+        found = np.isfinite(dist[envs, nearest])
+        obs[:, 10] = np.where(found, cdx[envs, nearest] / w, 0)
+        obs[:, 11] = np.where(found, cdy[envs, nearest] / h, 0)
+        obs[:, 12] = found
+        
+        edx = self.ex - self.px[:, None]
+        edy = self.ey - self.py[:, None]
+        dist = np.where(self.ealive, np.hypot(edx, edy), np.inf)
+        order = np.argsort(dist, axis=1)[:, :VEC_OBS_ENEMIES]
+        present = np.isfinite(np.take_along_axis(dist, order, axis=1))
+        obs[:, 13::3] = np.where(present, np.take_along_axis(edx, order, axis=1) / w, 0)
+        obs[:, 14::3] = np.where(present, np.take_along_axis(edy, order, axis=1) / h, 0)
+        obs[:, 15::3] = present
+        return obs
+
+def vec_bot_actions(obs):
+    """RaidBot的批量版，只看观测：向最近的有货容器走并搜刮，打最近的敌人，背包满或残血去撤离"""
+    n = len(obs)
+    actions = np.zeros((n, 5))
+    extract = (obs[:, 5] >= 1) | (obs[:, 2] * 100 < BOT_RETREAT_HEALTH) | (obs[:, 12] == 0)
+    goal_x = np.where(extract, obs[:, 8], obs[:, 10]) * screen_width
+    goal_y = np.where(extract, obs[:, 9], obs[:, 11]) * screen_height
+    actions[:, 0] = np.sign(goal_x) * (np.abs(goal_x) > 4)
+    actions[:, 1] = np.sign(goal_y) * (np.abs(goal_y) > 4)
+    enemy_x, enemy_y = obs[:, 13] * screen_width, obs[:, 14] * screen_height
+    in_range = (obs[:, 15] > 0) & (np.hypot(enemy_x, enemy_y) < BOT_FIRE_RANGE)
+    actions[:, 2] = np.arctan2(enemy_y, enemy_x)
+    actions[:, 3] = in_range
+    # 敌人贴脸时先打，不搜
+    actions[:, 4] = ~extract & ~(in_range & (np.hypot(enemy_x, enemy_y) < BOT_DANGER_RANGE))
+    return actions
+
+def run_vec_benchmark(env_count=256, seconds=60):
+    """批量对局的吞吐：用vec_bot_actions推进env_count局、模拟seconds秒，再和逐个推进Game对比"""
+    envs = VecRaids(env_count, seed=0)
+    obs = envs.reset()
+    steps = int(seconds * TICK_RATE)
+    finished = extracted = 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        obs, reward, done, info = envs.step(vec_bot_actions(obs))
+        if done.any():
+            finished += int(done.sum())
+            extracted += int(info["extracted"].sum())
+            obs = envs.reset(done)
+    elapsed = time.perf_counter() - start
+    vec_rate = env_count * steps / elapsed
+    print(f"批量: {env_count}局×{steps}步，用时{elapsed:.1f}秒，{vec_rate:,.0f}局·步/秒，"
+          f"结束{finished}局（撤离{extracted}）")
+    
+    # 对照：同样的规则用Game对象一局一局地推进
+    boot_headless()
+    game_clock.simulate(time.time())
+    game = Game(autosave=False)
+    game.start_raid()
+    game.particles = None
+    bot = RaidBot(game)
+    tick_input = TickInput()
+    step = 1 / TICK_RATE
+    count = min(steps, 2000)
+    start = time.perf_counter()
+    for _ in range(count):
+        bot.decide(tick_input)
+        game.update(tick_input)
+        game_clock.advance(step)
+        if game.state not in (GameState.PLAYING, GameState.EXTRACTING):
+            game.start_raid()
+            game.particles = None
+            bot = RaidBot(game)
+    game_rate = count / (time.perf_counter() - start)
+    print(f"逐局Game: {game_rate:,.0f}局·步/秒，批量快{vec_rate / game_rate:.0f}倍")
+
+# 内存分配预算检查（--alloc-check）：用tracemalloc跑几段固定的操作脚本，
+# 统计热身之后每帧update/draw各留下多少内存、临时分配峰值多大，按子系统（函数）汇总。
+# 每帧净增的容器对象越多，GC就越频繁，手机上的卡顿主要来自这里
+ALLOC_WARMUP_TICKS = 300  # 热身帧数，让各种缓存先填好
+ALLOC_TICKS = 200  # 每个统计窗口的帧数
+ALLOC_WINDOWS = 3  # 连续统计几个窗口，净增取最少的那个（numpy的小块缓存会让单个窗口偶尔多出几KB）
+ALLOC_TRACE_DEPTH = 16  # 调用栈要记得够深，才能从分配点找到外层的update/draw
+ALLOC_TOP = 5  # 每个阶段列出分配最多的几个子系统
+# 热身之后每帧允许净增的字节数。目标是零，留的余量不到一个Python对象：
+# 上一帧的numpy结果换了分配位置也会显示成一点净增，而每帧漏一个列表/字典就会超出
+ALLOC_BUDGETS = {"update": 16, "draw": 16}
+# 每帧临时分配的峰值上限（字节），超过说明有大块的临时对象（比如稠密的碰撞矩阵）
+ALLOC_PEAK_BUDGETS = {"update": 128 * 1024, "draw": 32 * 1024}
+# 热身之后每帧允许新建的表面个数。表面的像素缓冲在SDL里，tracemalloc看不到，
+# 每帧新建一张全屏遮罩就是几MB的分配，只能靠数个数
+ALLOC_SURFACE_BUDGET = 0
+# 热身之后每帧允许重复渲染同一段文字的次数。Font.render在C里建表面，上面的替换数不到；
+# 内容变了（比如血量）第一次渲染不算，画过的文字都该走缓存
+ALLOC_RENDER_BUDGET = 0
+# 有上限的缓存：热身后仍会慢慢填满，单独列出，不计入预算
+ALLOC_CACHE_SITES = ("LineOfSight.can_see_many",)
+
+class AllocSites:
+    """把源码行号对应到所在的函数（Class.method），用来给分配点归类"""
+    def __init__(self, path):
+        import ast
+        with open(path, encoding="utf-8-sig") as f:
+            tree = ast.parse(f.read())
+        self.path = path
+        self.spans = []
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef):
+                for item in node.body:
+                    if isinstance(item, ast.FunctionDef):
+                        self.spans.append((item.lineno, item.end_lineno, f"{node.name}.{item.name}"))
+            elif isinstance(node, ast.FunctionDef):
+                self.spans.append((node.lineno, node.end_lineno, node.name))
+        self.spans.sort()
+        self.starts = [span[0] for span in self.spans]
+    
+    def name(self, lineno):
+        index = bisect.bisect_right(self.starts, lineno) - 1
+        if index >= 0 and lineno <= self.spans[index][1]:
+            return self.spans[index][2]
+        return "<module>"
+    
+    def classify(self, traceback):
+        """返回(阶段, 子系统)：阶段是最外层的Game.update/draw，子系统是最内层的本文件函数"""
+        phase = subsystem = None
+        for frame in traceback:  # 从最外层往里
+            if frame.filename != self.path:
+                continue
+            name = self.name(frame.lineno)
+            if phase is None and name in ("Game.update", "Game.draw"):
+                phase = name[5:]
+            if phase is not None:
+                subsystem = name
+        return phase, subsystem
+
+def alloc_scenarios():
+    """固定的操作脚本：每个函数(game, tick, tick_input)填好这一帧的输入"""
+    def idle(game, tick, tick_input):
+        pass
+    
+    def walk(game, tick, tick_input):
+        # 绕圈走，经过不同的格子和视线
+        angle = tick * 2 * math.pi / 240
+        tick_input.move_x = round(math.cos(angle))
+        tick_input.move_y = round(math.sin(angle))
+    
+    def combat(game, tick, tick_input):
+        # 边走边朝最近的敌人开火，没子弹就换弹；血量一直补满，免得中途死掉换了场景
+        walk(game, tick, tick_input)
+        game.player.health = 100
+        xs, ys = game.enemies["x"], game.enemies["y"]
+        if xs:
+            px, py = game.player.x, game.player.y
+            nearest = min(range(len(xs)), key=lambda row: (xs[row] - px) ** 2 + (ys[row] - py) ** 2)
+            tick_input.aim_angle = math.atan2(ys[nearest] - py, xs[nearest] - px)
+            tick_input.fire = True
+        tick_input.reload = game.player.ammo == 0
+    
+    def inventory(game, tick, tick_input):
+        tick_input.toggle_inventory = tick == 0
+    
+    return (("idle", idle), ("walk", walk), ("combat", combat), ("inventory", inventory))
+
+def measure_allocations(game, script, sites):
+    """跑一段脚本，返回各阶段的统计：
+    {阶段: [净增字节, 净增块数, 峰值, {子系统: 字节}, {缓存: 字节}, 新建表面数, 重复渲染文字次数]}"""
+    import tracemalloc
+    tick_input = TickInput()
+    surfaces = {"update": 0, "draw": 0}
+    renders = {"update": 0, "draw": 0}
+    rendered = set()  # 渲染过的(字体, 参数)
+    current = [None]  # 正在统计的阶段，热身时为None
+    surface_class = pygame.Surface
+    
+    class CountedSurface(surface_class):
+        """统计期间替换pygame.Surface，数每个阶段新建了几张表面"""
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if current[0] is not None:
+                surfaces[current[0]] += 1
+    
+    class CountedFont:
+        """统计期间替换模块里的字体，数每个阶段重复渲染了几次画过的文字（Font是C类型，render改不了）"""
+        def __init__(self, wrapped):
+            self.wrapped = wrapped
+        
+        def render(self, *args, **kwargs):
+            key = (self.wrapped, args)
+            if key in rendered:
+                if current[0] is not None:
+                    renders[current[0]] += 1
+            else:
+                rendered.add(key)
+            return self.wrapped.render(*args, **kwargs)
+        
+        def __getattr__(self, name):
+            return getattr(self.wrapped, name)
+    
+    def tick(index, peaks=None):
+        tick_input.clear()
+        script(game, index, tick_input)
+        game_clock.advance(1 / TICK_RATE)
+        if peaks is None:
+            game.update(tick_input)
+            game.draw()
+            return
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        current[0] = "update"
+        game.update(tick_input)
+        peaks["update"] = max(peaks["update"], tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        current[0] = "draw"
+        game.draw()
+        current[0] = None
+        peaks["draw"] = max(peaks["draw"], tracemalloc.get_traced_memory()[1] - before)
+    
+    # 字体从热身前就换掉，文字缓存里存的就是换过的字体，热身后画过的文字应该全部命中
+    fonts = {"font": font, "large_font": large_font}
+    globals().update({name: CountedFont(wrapped) for name, wrapped in fonts.items()})
+    peaks = {"update": 0, "draw": 0}
+    snapshots = []
+    try:
+        for index in range(ALLOC_WARMUP_TICKS):
+            tick(index)
+        tracemalloc.start(ALLOC_TRACE_DEPTH)
+        pygame.Surface = CountedSurface
+        snapshots.append(tracemalloc.take_snapshot())
+        index = ALLOC_WARMUP_TICKS
+        for _ in range(ALLOC_WINDOWS):
+            for _ in range(ALLOC_TICKS):
+                tick(index, peaks)
+                index += 1
+            snapshots.append(tracemalloc.take_snapshot())
+    finally:
+        pygame.Surface = surface_class
+        tracemalloc.stop()
+        globals().update(fonts)
+    
+    # 每个阶段取净增最少的窗口：真正的泄漏每个窗口都在涨，缓存和numpy的内存池填满就不涨了
+    result = {}
+    for before, after in zip(snapshots, snapshots[1:]):
+        window = {phase: [0, 0, peaks[phase], {}, {}, surfaces[phase], renders[phase]] for phase in peaks}
+        for diff in after.compare_to(before, "traceback"):
+            if not diff.size_diff and not diff.count_diff:
+                continue
+            phase, subsystem = sites.classify(diff.traceback)
+            if phase is None:
+                continue
+            entry = window[phase]
+            if subsystem in ALLOC_CACHE_SITES:
+                entry[4][subsystem] = entry[4].get(subsystem, 0) + diff.size_diff
+                continue
+            entry[0] += diff.size_diff
+            entry[1] += diff.count_diff
+            entry[3][subsystem] = entry[3].get(subsystem, 0) + diff.size_diff
+        for phase, entry in window.items():
+            if phase not in result or entry[0] < result[phase][0]:
+                result[phase] = entry
+    return result
+
+def run_alloc_check():
+    """跑全部脚本并打印每帧的分配，超出预算返回1（作为进程退出码）"""
+    boot_headless()
+    # 音效也要算进去，用虚拟声卡，不出声
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    sounds.load()
+    game_clock.simulate(time.time())
+    sites = AllocSites(os.path.abspath(__file__))
+    failures = 0
+    for name, script in alloc_scenarios():
+        random.seed(0)
+        if np is not None:
+            np.random.seed(0)
+        game = Game(autosave=False)
+        game.start_raid()
+        result = measure_allocations(game, script, sites)
+        print(f"== {name}（热身{ALLOC_WARMUP_TICKS}帧，统计{ALLOC_WINDOWS}×{ALLOC_TICKS}帧）")
+        for phase, (size, count, peak, subsystems, caches, surface_count, render_count) in result.items():
+            per_tick = size / ALLOC_TICKS
+            over = (per_tick > ALLOC_BUDGETS[phase] or peak > ALLOC_PEAK_BUDGETS[phase] or
+                    surface_count > ALLOC_SURFACE_BUDGET * ALLOC_TICKS * ALLOC_WINDOWS or
+                    render_count > ALLOC_RENDER_BUDGET * ALLOC_TICKS * ALLOC_WINDOWS)
+            failures += over
+            print(f"  {phase:<7} 净增 {per_tick:8.1f} B/帧  {count / ALLOC_TICKS:6.2f} 块/帧  "
+                  f"临时峰值 {peak / 1024:6.1f} KB  新建表面 {surface_count:3d} 张  重复渲染文字 {render_count:3d} 次  "
+                  f"{'超出预算' if over else 'OK'}")
+            top = sorted(subsystems.items(), key=lambda item: -abs(item[1]))[:ALLOC_TOP]
+            for subsystem, size in top:
+                print(f"      {subsystem:<32} {size / ALLOC_TICKS:8.1f} B/帧")
+            for subsystem, size in caches.items():
+                print(f"      {subsystem:<32} {size / ALLOC_TICKS:8.1f} B/帧（缓存，不计入）")
+    print("全部在预算内" if not failures else f"{failures}项超出预算")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "--coop-server":
+        # 单独跑联机服务器：--coop-server [端口]
+        run_coop_server(int(args[1]) if len(args) > 1 else COOP_PORT)
+    elif args and args[0] == "--coop-loopback":
+        # 本机回环测试：--coop-loopback [客户端数]
+        run_coop_loopback(int(args[1]) if len(args) > 1 else 2)
+    elif args and args[0] == "--rollouts":
+        # 自动对局调数值：--rollouts [局数] [workers=进程数] [enemy_damage=20] [item_values.鼠标=500]
+        run_rollouts(*parse_rollout_args(args[1:]))
+    elif args and args[0] == "--vec-bench":
+        # 批量对局吞吐测试：--vec-bench [局数]
+        run_vec_benchmark(int(args[1]) if len(args) > 1 else 256)
+    elif args and args[0] == "--alloc-check":
+        # 内存分配预算检查，超出预算时退出码为1
+        sys.exit(run_alloc_check())
+    else:
+        try:
+            boot()
+            game = Game()
+            game.run()
+        except Exception as e:
+            print(f"游戏崩溃: {str(e)}")
+            pygame.quit()
+            raise